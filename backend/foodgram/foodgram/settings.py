@@ -33,10 +33,13 @@ INSTALLED_APPS = [
     'django_filters',
     'users.apps.UsersConfig',
     'recipes.apps.RecipesConfig',
+    'jobs.apps.JobsConfig',
+    'monitoring.apps.MonitoringConfig',
     'djoser',
 ]
 
 MIDDLEWARE = [
+    'monitoring.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     # 'corsheaders.middleware.CorsMiddleware',
@@ -143,6 +146,105 @@ REST_FRAMEWORK = {
 
 AUTH_USER_MODEL = 'users.CustomUser'
 
+# Кэш: по умолчанию в памяти процесса; для общего кэша всех воркеров
+# можно указать Redis-бэкенд, например django_redis.cache.RedisCache.
+# Версии данных, по которым сбрасывается кэш, хранятся в базе
+# (recipes.models.CacheVersion), поэтому изменения из других процессов
+# (воркер очереди задач, команды управления) видны и при кэше в памяти
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    }
+}
+
+# кэш справочников (теги, ингредиенты): алиас, время жизни записи (сек.)
+# и max-age для заголовка Cache-Control
+CATALOGUE_CACHE_ALIAS = 'default'
+CATALOGUE_CACHE_TIMEOUT = 60 * 60 * 24
+CATALOGUE_CACHE_MAX_AGE = 0
+
+# кэш выдачи рецептов и пользовательских флагов (сек., 0 - выключен),
+# хранится в том же кэше, что и справочники
+RECIPE_CACHE_TIMEOUT = 60 * 10
+
+# изображения рецептов: допустимые форматы и размер загрузки,
+# максимальная сторона сохраняемого оригинала и размеры превью (px)
+RECIPE_IMAGE_FORMATS = ('JPEG', 'PNG', 'WEBP', 'GIF')
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+RECIPE_IMAGE_MAX_DIMENSION = 2560
+RECIPE_IMAGE_RENDITIONS = {
+    'thumbnail': 320,
+    'card': 640,
+    'full': 1280,
+}
+
+# очередь фоновых задач: число попыток, базовая задержка повтора (сек.)
+# и время, после которого зависшая задача выдается другому воркеру (сек.)
+JOBS_MAX_ATTEMPTS = 3
+JOBS_RETRY_DELAY = 10
+JOBS_TIMEOUT = 15 * 60
+# файлы, подготовленные задачами (списки покупок по ?async=1): хранятся
+# вне MEDIA_ROOT, отдаются владельцу задачи по /api/jobs/<id>/file/
+# и удаляются через JOBS_FILES_TTL секунд
+JOBS_FILES_ROOT = os.path.join(BASE_DIR, 'job_files')
+JOBS_FILES_TTL = 60 * 60
+
+# максимальное число ингредиентов в одном рецепте
+RECIPE_MAX_INGREDIENTS = 200
+
+# максимальное число рецептов в одном пакетном запросе
+# к избранному и списку покупок
+RECIPE_BATCH_MAX_SIZE = 100
+
+# лента подписок хранится заранее посчитанной (fan-out on write)
+# для пользователей, подписанных не менее чем на столько авторов
+FEED_TIMELINE_MIN_FOLLOWING = 100
+
+# число похожих рецептов, хранимых для каждого рецепта,
+# и минимальное число пользователей, добавивших в избранное оба рецепта
+SIMILAR_RECIPES_COUNT = 10
+SIMILAR_RECIPES_MIN_USERS = 2
+
+# максимальное число ингредиентов в ответе автодополнения ?name=
+INGREDIENT_AUTOCOMPLETE_LIMIT = 50
+
+# TTF-шрифт с кириллицей для выгрузки списка покупок в PDF
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+# показатели запросов: бюджеты числа SQL-запросов и времени ответа,
+# порог повторов одного запроса и границы гистограмм для /api/metrics/
+METRICS_QUERY_BUDGET = int(os.getenv('METRICS_QUERY_BUDGET', default=20))
+METRICS_LATENCY_BUDGET_MS = int(
+    os.getenv('METRICS_LATENCY_BUDGET_MS', default=500)
+)
+METRICS_DUPLICATE_THRESHOLD = 2
+METRICS_DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+METRICS_QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'monitoring.requests': {
+            'handlers': ['console'],
+            'level': os.getenv('METRICS_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
@@ -0,0 +1,19 @@
+import os
+import tempfile
+
+# тесты по умолчанию идут на SQLite; для PostgreSQL достаточно
+# задать DB_ENGINE и параметры подключения в окружении
+os.environ.setdefault('SECRET_KEY', 'test-secret-key')
+os.environ.setdefault('DB_ENGINE', 'django.db.backends.sqlite3')
+os.environ.setdefault('DB_NAME', 'test.sqlite3')
+
+from .settings import *  # noqa: E402,F401,F403
+
+# тесты одновременных запросов работают из нескольких потоков:
+# база SQLite в памяти с общим кэшем не ждет снятия блокировок,
+# поэтому тестовая база создается файлом
+database = DATABASES['default']  # noqa: F405
+if database['ENGINE'] == 'django.db.backends.sqlite3':
+    database['TEST'] = {
+        'NAME': os.path.join(tempfile.gettempdir(), 'foodgram_test.sqlite3')
+    }
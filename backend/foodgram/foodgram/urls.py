@@ -7,6 +7,8 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/users/', include('users.urls', namespace='users')),
     path('api/auth/', include('djoser.urls.authtoken')),
+    path('api/jobs/', include('jobs.urls', namespace='jobs')),
+    path('api/metrics/', include('monitoring.urls', namespace='monitoring')),
     path('api/', include('recipes.urls', namespace='recipes')),
 ]
 
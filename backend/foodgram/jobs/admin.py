@@ -0,0 +1,14 @@
+from django.contrib import admin
+
+from .models import Job
+
+
+class JobAdmin(admin.ModelAdmin):
+    """Настрока панели администратора для модели Job."""
+    list_display = ('pk', 'name', 'status', 'attempts', 'run_after',
+                    'created', 'updated')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'idempotency_key')
+
+
+admin.site.register(Job, JobAdmin)
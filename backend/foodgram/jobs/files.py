@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+
+from jobs.queue import enqueue
+
+
+def get_files_storage():
+    """Хранилище файлов, подготовленных задачами. Каталог
+    JOBS_FILES_ROOT не раздается nginx: файлы отдаются только
+    владельцу задачи (JobViewSet.file)."""
+
+    return FileSystemStorage(location=settings.JOBS_FILES_ROOT)
+
+
+def save_job_file(name, content):
+    """Сохранение файла задачи; удаление файла ставится в очередь
+    с задержкой JOBS_FILES_TTL. Возвращает имя сохраненного файла
+    для результата задачи ({"file": name})."""
+
+    name = get_files_storage().save(name, content)
+    enqueue('jobs.delete_file', {'name': name},
+            delay=settings.JOBS_FILES_TTL)
+    return name
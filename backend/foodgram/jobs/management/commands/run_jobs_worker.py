@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from jobs.queue import claim_job, run_job
+
+
+class Command(BaseCommand):
+    help = 'running background jobs from the database queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sleep', type=float, default=1.0,
+                            help='пауза при пустой очереди, сек.')
+        parser.add_argument('--burst', action='store_true',
+                            help='завершиться, когда очередь опустеет')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Воркер очереди задач запущен')
+        while True:
+            close_old_connections()
+            job = claim_job()
+            if job is None:
+                if options['burst']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+            job = run_job(job)
+            self.stdout.write(f'{job}')
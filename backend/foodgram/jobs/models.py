@@ -0,0 +1,101 @@
+from django.db import models
+from django.db.models import Q
+from users.models import CustomUser
+
+
+class Job(models.Model):
+    """Модель Job хранит фоновую задачу очереди.
+    Задачи выполняются воркером (manage.py run_jobs_worker),
+    при ошибке повторяются с увеличивающейся задержкой."""
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+    ACTIVE_STATUSES = (PENDING, RUNNING)
+
+    name = models.CharField(
+        verbose_name='Название задачи',
+        max_length=100,
+    )
+    payload = models.TextField(
+        verbose_name='Параметры задачи (JSON)',
+        default='{}',
+    )
+    idempotency_key = models.CharField(
+        verbose_name='Ключ идемпотентности',
+        max_length=200,
+        blank=True,
+        null=True,
+    )
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='jobs',
+        verbose_name='Пользователь',
+        blank=True,
+        null=True,
+    )
+    status = models.CharField(
+        verbose_name='Статус',
+        max_length=10,
+        choices=STATUSES,
+        default=PENDING,
+    )
+    attempts = models.PositiveIntegerField(
+        verbose_name='Число попыток',
+        default=0,
+    )
+    max_attempts = models.PositiveIntegerField(
+        verbose_name='Максимальное число попыток',
+        default=3,
+    )
+    run_after = models.DateTimeField(
+        verbose_name='Выполнить не раньше',
+    )
+    started_at = models.DateTimeField(
+        verbose_name='Начало выполнения',
+        blank=True,
+        null=True,
+    )
+    result = models.TextField(
+        verbose_name='Результат (JSON)',
+        blank=True,
+    )
+    error = models.TextField(
+        verbose_name='Последняя ошибка',
+        blank=True,
+    )
+    created = models.DateTimeField(
+        verbose_name='Дата создания',
+        auto_now_add=True,
+    )
+    updated = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
+
+    class Meta:
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['status', 'run_after'],
+                         name='job_status_run_after'),
+        ]
+        constraints = [
+            # один и тот же ключ может быть только у одной
+            # незавершенной задачи
+            models.UniqueConstraint(
+                fields=['idempotency_key'],
+                condition=Q(status__in=('pending', 'running')),
+                name='unique_active_job_key'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.id} ({self.status})'
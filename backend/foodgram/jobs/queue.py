@@ -0,0 +1,110 @@
+import json
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from jobs.models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+def task(name):
+    """Регистрация функции как задачи очереди под именем name.
+    Функция получает параметры задачи именованными аргументами
+    и возвращает JSON-сериализуемый результат."""
+
+    def decorator(func):
+        TASKS[name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, idempotency_key=None, user=None,
+            delay=0, max_attempts=None):
+    """Постановка задачи в очередь.
+    Если незавершенная задача с таким же ключом идемпотентности уже есть,
+    новая не создается и возвращается существующая.
+    Возвращает кортеж (job, created)."""
+
+    if name not in TASKS:
+        raise ValueError(f'Неизвестная задача {name}')
+    if idempotency_key:
+        job = Job.objects.filter(
+            idempotency_key=idempotency_key, status__in=Job.ACTIVE_STATUSES
+        ).first()
+        if job is not None:
+            return job, False
+    try:
+        with transaction.atomic():
+            job = Job.objects.create(
+                name=name,
+                payload=json.dumps(payload or {}),
+                idempotency_key=idempotency_key,
+                user=user,
+                run_after=timezone.now() + timedelta(seconds=delay),
+                max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+            )
+    except IntegrityError:
+        # задачу с тем же ключом одновременно создал другой запрос
+        return Job.objects.get(
+            idempotency_key=idempotency_key, status__in=Job.ACTIVE_STATUSES
+        ), False
+    return job, True
+
+
+def claim_job():
+    """Выбор следующей задачи и пометка ее как выполняемой.
+    На PostgreSQL строки блокируются с SKIP LOCKED, поэтому несколько
+    воркеров не получают одну и ту же задачу. Задачи, зависшие
+    в статусе running дольше JOBS_TIMEOUT, выдаются повторно."""
+
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.JOBS_TIMEOUT)
+    with transaction.atomic():
+        job = Job.objects.select_for_update(skip_locked=True).filter(
+            Q(status=Job.PENDING, run_after__lte=now)
+            | Q(status=Job.RUNNING, started_at__lt=stale)
+        ).order_by('run_after', 'id').first()
+        if job is None:
+            return None
+        job.status = Job.RUNNING
+        job.started_at = now
+        job.attempts += 1
+        job.save(update_fields=['status', 'started_at', 'attempts',
+                                'updated'])
+    return job
+
+
+def run_job(job):
+    """Выполнение задачи в транзакции и сохранение результата.
+    При ошибке задача возвращается в очередь с экспоненциальной
+    задержкой, пока не исчерпаны попытки."""
+
+    try:
+        func = TASKS[job.name]
+        with transaction.atomic():
+            result = func(**json.loads(job.payload))
+    except Exception:
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = Job.PENDING
+            job.run_after = timezone.now() + timedelta(
+                seconds=settings.JOBS_RETRY_DELAY * 2 ** (job.attempts - 1)
+            )
+        else:
+            job.status = Job.FAILED
+        logger.warning('Задача %s завершилась ошибкой', job, exc_info=True)
+    else:
+        job.status = Job.DONE
+        job.result = json.dumps(result, ensure_ascii=False)
+        job.error = ''
+    job.save(update_fields=['status', 'run_after', 'result', 'error',
+                            'updated'])
+    return job
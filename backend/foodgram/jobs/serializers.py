@@ -0,0 +1,29 @@
+import json
+
+from django.urls import reverse
+from rest_framework import serializers
+
+from jobs.models import Job
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """Сериализатор для выдачи статуса фоновой задачи."""
+
+    result = serializers.SerializerMethodField()
+    file = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = ('id', 'name', 'status', 'attempts', 'result', 'file',
+                  'created', 'updated')
+
+    def get_result(self, obj):
+        return json.loads(obj.result) if obj.result else None
+
+    def get_file(self, obj):
+        """Адрес файла задачи, если она его подготовила."""
+
+        if obj.status != Job.DONE or 'file' not in (
+                self.get_result(obj) or {}):
+            return None
+        return reverse('jobs:job-file', args=[obj.pk])
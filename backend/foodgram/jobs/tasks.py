@@ -0,0 +1,8 @@
+from jobs.files import get_files_storage
+from jobs.queue import task
+
+
+@task('jobs.delete_file')
+def delete_file_task(name):
+    get_files_storage().delete(name)
+    return {'file': name}
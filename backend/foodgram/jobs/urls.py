@@ -0,0 +1,11 @@
+from django.urls import include, path
+from rest_framework.routers import DefaultRouter
+
+from jobs.views import JobViewSet
+
+app_name = 'jobs'
+
+router = DefaultRouter()
+router.register('', JobViewSet)
+
+urlpatterns = [path('', include(router.urls)), ]
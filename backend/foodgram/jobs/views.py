@@ -0,0 +1,39 @@
+import json
+import os
+
+from django.http import FileResponse
+from rest_framework import mixins, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.permissions import IsAuthenticated
+
+from jobs.files import get_files_storage
+from jobs.models import Job
+from jobs.serializers import JobSerializer
+
+
+class JobViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """ViewSet для просмотра статуса фоновой задачи.
+    Пользователю доступны только его задачи, администратору - все."""
+
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return Job.objects.all()
+        return Job.objects.filter(user=self.request.user)
+
+    @action(detail=True, methods=['GET'])
+    def file(self, request, pk=None):
+        """Файл, подготовленный задачей (например, список покупок),
+        пока он не удален по истечении JOBS_FILES_TTL."""
+
+        job = self.get_object()
+        name = json.loads(job.result).get('file') if job.result else None
+        storage = get_files_storage()
+        if job.status != Job.DONE or not name or not storage.exists(name):
+            raise NotFound('Файл задачи не найден.')
+        return FileResponse(storage.open(name), as_attachment=True,
+                            filename=os.path.basename(name))
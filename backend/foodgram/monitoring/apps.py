@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class MonitoringConfig(AppConfig):
+    name = 'monitoring'
+
+    def ready(self):
+        from monitoring.metrics import instrument_serializers
+
+        instrument_serializers()
@@ -0,0 +1,188 @@
+import hashlib
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from rest_framework.serializers import BaseSerializer
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+TRANSACTION_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT',
+                          'RELEASE')
+
+# состояние текущего запроса (см. RequestMetricsMiddleware)
+_local = threading.local()
+
+
+class RequestMetrics:
+    """Показатели одного запроса: SQL-запросы, время в БД
+    и время работы сериализаторов."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.fingerprints = Counter()
+        self.statements = {}
+        self.serializer_time = 0.0
+        self.serializer_queries = 0
+        self.serializer_depth = 0
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            if sql.startswith(TRANSACTION_STATEMENTS):
+                return
+            key = fingerprint(sql)
+            self.fingerprints[key] += 1
+            self.statements.setdefault(key, sql)
+
+    def duplicates(self):
+        """Повторяющиеся запросы (обычно N+1 в сериализаторах)."""
+
+        return [
+            {'fingerprint': key, 'count': count,
+             'sql': self.statements[key][:300]}
+            for key, count in self.fingerprints.most_common()
+            if count >= settings.METRICS_DUPLICATE_THRESHOLD
+        ]
+
+
+def fingerprint(sql):
+    """Отпечаток запроса: текст с плейсхолдерами, списки IN (...)
+    любой длины считаются одинаковыми."""
+
+    return hashlib.md5(
+        IN_LIST_RE.sub('IN (...)', sql).encode()
+    ).hexdigest()[:12]
+
+
+def current():
+    return getattr(_local, 'metrics', None)
+
+
+def start():
+    _local.metrics = RequestMetrics()
+    return _local.metrics
+
+
+def finish():
+    _local.metrics = None
+
+
+def instrument_serializers():
+    """Учет времени сериализаторов DRF: замеряется самое внешнее
+    обращение к serializer.data в запросе, вместе с SQL-запросами,
+    выполненными во время сериализации."""
+
+    original = BaseSerializer.data
+    if getattr(original, 'instrumented', False):
+        return
+
+    def data(self):
+        metrics = current()
+        if metrics is None or metrics.serializer_depth:
+            return original.fget(self)
+        metrics.serializer_depth += 1
+        started, queries = time.perf_counter(), metrics.queries
+        try:
+            return original.fget(self)
+        finally:
+            metrics.serializer_depth -= 1
+            metrics.serializer_time += time.perf_counter() - started
+            metrics.serializer_queries += metrics.queries - queries
+
+    data.instrumented = True
+    BaseSerializer.data = property(data)
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for number, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[number] += 1
+        self.total += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    """Агрегированные показатели запросов по представлениям.
+    Хранятся в памяти процесса: каждый воркер gunicorn отдает свои."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.durations = defaultdict(
+            lambda: Histogram(settings.METRICS_DURATION_BUCKETS))
+        self.queries = defaultdict(
+            lambda: Histogram(settings.METRICS_QUERY_BUCKETS))
+        self.db_time = Counter()
+        self.serializer_time = Counter()
+        self.over_budget = Counter()
+
+    def observe(self, view, duration, metrics, over_budget):
+        with self.lock:
+            self.durations[view].observe(duration)
+            self.queries[view].observe(metrics.queries)
+            self.db_time[view] += metrics.db_time
+            self.serializer_time[view] += metrics.serializer_time
+            if over_budget:
+                self.over_budget[view] += 1
+
+    def render(self):
+        """Показатели в текстовом формате Prometheus."""
+
+        lines = []
+        with self.lock:
+            for name, title, histograms in (
+                ('foodgram_request_duration_seconds',
+                 'Request duration', self.durations),
+                ('foodgram_request_queries',
+                 'SQL queries per request', self.queries),
+            ):
+                lines += [f'# HELP {name} {title}.',
+                          f'# TYPE {name} histogram']
+                for view, histogram in sorted(histograms.items()):
+                    lines += histogram_lines(name, view, histogram)
+            for name, title, counter in (
+                ('foodgram_request_db_seconds_total',
+                 'Time spent in SQL queries', self.db_time),
+                ('foodgram_request_serializer_seconds_total',
+                 'Time spent in serializers', self.serializer_time),
+                ('foodgram_request_over_budget_total',
+                 'Requests over query or latency budget', self.over_budget),
+            ):
+                lines += [f'# HELP {name} {title}.',
+                          f'# TYPE {name} counter']
+                lines += [f'{name}{{view="{view}"}} {value}'
+                          for view, value in sorted(counter.items())]
+        return '\n'.join(lines) + '\n'
+
+
+def histogram_lines(name, view, histogram):
+    lines = [
+        f'{name}_bucket{{view="{view}",le="{bound}"}} {count}'
+        for bound, count in zip(histogram.buckets, histogram.counts)
+    ]
+    lines.append(f'{name}_bucket{{view="{view}",le="+Inf"}} '
+                 f'{histogram.total}')
+    lines.append(f'{name}_sum{{view="{view}"}} {histogram.sum}')
+    lines.append(f'{name}_count{{view="{view}"}} {histogram.total}')
+    return lines
+
+
+registry = MetricsRegistry()
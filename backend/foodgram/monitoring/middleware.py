@@ -0,0 +1,67 @@
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from monitoring.metrics import finish, registry, start
+
+logger = logging.getLogger('monitoring.requests')
+
+
+class RequestMetricsMiddleware:
+    """Сбор показателей запроса: число SQL-запросов, время в БД,
+    время сериализаторов и повторяющиеся запросы.
+    Показатели отдаются в заголовке Server-Timing, пишутся в лог
+    строкой JSON и накапливаются для эндпоинта /api/metrics/.
+    Запросы сверх бюджета (METRICS_QUERY_BUDGET,
+    METRICS_LATENCY_BUDGET_MS) пишутся в лог с уровнем WARNING."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = start()
+        try:
+            with connection.execute_wrapper(metrics.record_query):
+                response = self.get_response(request)
+        finally:
+            finish()
+        duration = time.perf_counter() - metrics.started
+
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={metrics.db_time * 1000:.1f};'
+            f'desc="{metrics.queries} queries"',
+            f'serializer;dur={metrics.serializer_time * 1000:.1f};'
+            f'desc="{metrics.serializer_queries} queries"',
+            f'total;dur={duration * 1000:.1f}',
+        ))
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        exceeded = [
+            name for name, over in (
+                ('queries', metrics.queries > settings.METRICS_QUERY_BUDGET),
+                ('latency', duration * 1000
+                 > settings.METRICS_LATENCY_BUDGET_MS),
+            ) if over
+        ]
+        registry.observe(view, duration, metrics, bool(exceeded))
+        logger.log(
+            logging.WARNING if exceeded else logging.INFO,
+            json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'view': view,
+                'status': response.status_code,
+                'duration_ms': round(duration * 1000, 1),
+                'queries': metrics.queries,
+                'db_ms': round(metrics.db_time * 1000, 1),
+                'serializer_ms': round(metrics.serializer_time * 1000, 1),
+                'serializer_queries': metrics.serializer_queries,
+                'duplicate_queries': metrics.duplicates(),
+                'budget_exceeded': exceeded,
+            }, ensure_ascii=False)
+        )
+        return response
@@ -0,0 +1,31 @@
+from rest_framework.permissions import IsAdminUser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from monitoring.metrics import registry
+
+
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode(self.charset)
+        # ответы с ошибками (например, 403) - строками "ключ значение"
+        return '\n'.join(
+            f'# {key}: {value}' for key, value in data.items()
+        ).encode(self.charset)
+
+
+class MetricsView(APIView):
+    """Показатели запросов по представлениям в формате Prometheus.
+    Доступно только администраторам."""
+
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (PrometheusRenderer,)
+
+    def get(self, request):
+        return Response(registry.render())
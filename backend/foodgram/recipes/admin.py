@@ -1,7 +1,9 @@
 from django.contrib import admin
+from django.db import transaction
+from jobs.queue import enqueue
 
 from .models import (Favorite, Ingredient, IngredientAmountInRecipe, Recipe,
-                     ShoppingCart, Tag)
+                     ShoppingCart, ShoppingListItem, Tag)
 
 
 class IngredientAdmin(admin.ModelAdmin):
@@ -20,14 +22,13 @@ class TagAdmin(admin.ModelAdmin):
 
 class RecipeAdmin(admin.ModelAdmin):
     """Настрока панели администратора для модели Recipe."""
-    list_display = ('pk', 'name', 'text', 'author', 'image', 'favorited_count')
+    list_display = ('pk', 'name', 'text', 'author', 'image',
+                    'favorites_count', 'shopping_cart_count')
     list_editable = ('name', 'text', 'author', 'image')
     exclude = ('ingredients',)
     list_filter = ('author', 'name', 'tags')
     search_fields = ('author__username', 'name', 'tags__name')
-
-    def favorited_count(self, obj):
-        return Favorite.objects.filter(recipe=obj.id).count()
+    readonly_fields = ('favorites_count', 'shopping_cart_count')
 
 
 class IngredientAmountInRecipeAdmin(admin.ModelAdmin):
@@ -37,10 +38,56 @@ class IngredientAmountInRecipeAdmin(admin.ModelAdmin):
 
 
 class FavoriteShoppingCartAdmin(admin.ModelAdmin):
-    """Настрока панели администратора для моделей Favorite и ShoppingCart."""
+    """Настрока панели администратора для моделей Favorite и ShoppingCart.
+    Счетчики рецептов обновляют обработчики сигналов (recipes.counters);
+    после сохранения ставится задача сверки счетчиков и пересчета
+    сводных списков покупок."""
     list_display = ('pk', 'user', 'recipe')
     search_fields = ('user__username', 'recipe__name')
 
+    def recount(self, user_ids, recipe_ids):
+        # сводный список покупок зависит только от корзины
+        if self.model is not ShoppingCart:
+            user_ids = []
+        user_ids = sorted(set(user_ids))
+        recipe_ids = sorted(set(recipe_ids))
+        transaction.on_commit(lambda: enqueue(
+            'recipes.recount_counters',
+            {'user_ids': user_ids, 'recipe_ids': recipe_ids},
+            idempotency_key='recount_counters:{0}:{1}'.format(
+                ','.join(map(str, user_ids)), ','.join(map(str, recipe_ids))
+            )
+        ))
+
+    def save_model(self, request, obj, form, change):
+        user_ids = [obj.user_id]
+        recipe_ids = [obj.recipe_id]
+        if change and 'user' in form.changed_data:
+            user_ids.append(form.initial['user'])
+        if change and 'recipe' in form.changed_data:
+            recipe_ids.append(form.initial['recipe'])
+        super().save_model(request, obj, form, change)
+        self.recount(user_ids, recipe_ids)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.recount([obj.user_id], [obj.recipe_id])
+
+    def delete_queryset(self, request, queryset):
+        links = list(queryset.values_list('user_id', 'recipe_id'))
+        super().delete_queryset(request, queryset)
+        self.recount([user for user, _ in links],
+                     [recipe for _, recipe in links])
+
+
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    """Настрока панели администратора для модели ShoppingListItem.
+    Записи пересчитываются автоматически, поэтому доступны только
+    для просмотра."""
+    list_display = ('pk', 'user', 'ingredient', 'total_amount')
+    search_fields = ('user__username', 'ingredient__name')
+    readonly_fields = ('user', 'ingredient', 'total_amount')
+
 
 admin.site.register(Tag, TagAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
@@ -48,3 +95,4 @@ admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Favorite, FavoriteShoppingCartAdmin)
 admin.site.register(ShoppingCart, FavoriteShoppingCartAdmin)
 admin.site.register(IngredientAmountInRecipe, IngredientAmountInRecipeAdmin)
+admin.site.register(ShoppingListItem, ShoppingListItemAdmin)
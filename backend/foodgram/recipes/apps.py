@@ -3,3 +3,126 @@ from django.apps import AppConfig
 
 class RecipesConfig(AppConfig):
     name = 'recipes'
+
+    def ready(self):
+        from django.db.models.signals import (m2m_changed, post_delete,
+                                              post_save, pre_delete,
+                                              pre_save)
+        from users.models import CustomUser, Subscribe
+
+        from recipes.cache import (author_changed, bump_catalogue_version,
+                                   recipe_changed, recipe_tags_changed,
+                                   user_flags_changed)
+        from recipes.counters import (recipe_deleted, recipe_saved,
+                                      recipe_saving, user_link_deleted,
+                                      user_link_saved)
+        from recipes.feed import (schedule_fan_out, subscription_deleted,
+                                  subscription_saved)
+        from recipes.models import (Favorite, Ingredient,
+                                    IngredientAmountInRecipe, Recipe,
+                                    ShoppingCart, Tag)
+        from recipes.search import (recipe_search_changed,
+                                    recipe_tags_search_changed,
+                                    schedule_search_update)
+        from recipes.shopping_list import (ingredient_changed,
+                                           recipe_ingredient_deleting,
+                                           recipe_ingredient_saved,
+                                           recipe_ingredient_saving)
+        from recipes.similarity import favorite_changed
+
+        # любое изменение справочников меняет их версию: ответы в кэше
+        # и индекс автодополнения ингредиентов становятся неактуальными
+        for model in (Ingredient, Tag):
+            post_save.connect(bump_catalogue_version, sender=model,
+                              dispatch_uid=f'catalogue_save_{model.__name__}')
+            post_delete.connect(
+                bump_catalogue_version, sender=model,
+                dispatch_uid=f'catalogue_delete_{model.__name__}'
+            )
+            # названия ингредиентов и тегов входят в поисковый вектор рецепта
+            post_save.connect(
+                schedule_search_update, sender=model,
+                dispatch_uid=f'search_save_{model.__name__}'
+            )
+
+        # поисковые векторы рецептов, в том числе созданных
+        # и измененных в админке
+        post_save.connect(recipe_search_changed, sender=Recipe,
+                          dispatch_uid='search_recipe_save')
+        post_save.connect(recipe_search_changed,
+                          sender=IngredientAmountInRecipe,
+                          dispatch_uid='search_recipe_ingredient_save')
+        post_delete.connect(recipe_search_changed,
+                            sender=IngredientAmountInRecipe,
+                            dispatch_uid='search_recipe_ingredient_delete')
+        m2m_changed.connect(recipe_tags_search_changed,
+                            sender=Recipe.tags.through,
+                            dispatch_uid='search_recipe_tags')
+
+        # Last-Modified выгрузки списков покупок с этим ингредиентом;
+        # при удалении строки списков еще не удалены каскадом
+        post_save.connect(ingredient_changed, sender=Ingredient,
+                          dispatch_uid='shopping_list_ingredient_save')
+        pre_delete.connect(ingredient_changed, sender=Ingredient,
+                           dispatch_uid='shopping_list_ingredient_delete')
+
+        # счетчики рецептов и пользователей при изменениях в обход API
+        pre_save.connect(recipe_saving, sender=Recipe,
+                         dispatch_uid='counters_recipe_pre')
+        post_save.connect(recipe_saved, sender=Recipe,
+                          dispatch_uid='counters_recipe_save')
+        post_delete.connect(recipe_deleted, sender=Recipe,
+                            dispatch_uid='counters_recipe_delete')
+        for model in (Favorite, ShoppingCart, Subscribe):
+            post_save.connect(user_link_saved, sender=model,
+                              dispatch_uid=f'counters_save_{model.__name__}')
+            post_delete.connect(
+                user_link_deleted, sender=model,
+                dispatch_uid=f'counters_delete_{model.__name__}'
+            )
+
+        # сводные списки покупок при изменении ингредиентов рецептов
+        # в обход API: админка, каскадное удаление рецепта или автора
+        pre_save.connect(recipe_ingredient_saving,
+                         sender=IngredientAmountInRecipe,
+                         dispatch_uid='shopping_list_recipe_ingredient_pre')
+        post_save.connect(recipe_ingredient_saved,
+                          sender=IngredientAmountInRecipe,
+                          dispatch_uid='shopping_list_recipe_ingredient_save')
+        pre_delete.connect(
+            recipe_ingredient_deleting, sender=IngredientAmountInRecipe,
+            dispatch_uid='shopping_list_recipe_ingredient_delete'
+        )
+
+        # кэш выдачи рецептов (RecipeCacheMixin) сбрасывается
+        # только для затронутых рецептов и пользователей
+        for model, handler in ((Recipe, recipe_changed),
+                               (IngredientAmountInRecipe, recipe_changed),
+                               (Favorite, user_flags_changed),
+                               (ShoppingCart, user_flags_changed),
+                               (Subscribe, user_flags_changed)):
+            post_save.connect(handler, sender=model,
+                              dispatch_uid=f'cache_save_{model.__name__}')
+            post_delete.connect(
+                handler, sender=model,
+                dispatch_uid=f'cache_delete_{model.__name__}'
+            )
+        m2m_changed.connect(recipe_tags_changed, sender=Recipe.tags.through,
+                            dispatch_uid='cache_recipe_tags')
+        post_save.connect(author_changed, sender=CustomUser,
+                          dispatch_uid='cache_author')
+
+        # лента подписок: новые рецепты и изменения подписок в обход API
+        post_save.connect(schedule_fan_out, sender=Recipe,
+                          dispatch_uid='feed_recipe_save')
+        post_save.connect(subscription_saved, sender=Subscribe,
+                          dispatch_uid='feed_subscription_save')
+        post_delete.connect(subscription_deleted, sender=Subscribe,
+                            dispatch_uid='feed_subscription_delete')
+
+        # похожие рецепты пересчитываются для рецептов, избранное
+        # которых изменилось (изменения через API отмечаются во view)
+        post_save.connect(favorite_changed, sender=Favorite,
+                          dispatch_uid='similar_favorite_save')
+        post_delete.connect(favorite_changed, sender=Favorite,
+                            dispatch_uid='similar_favorite_delete')
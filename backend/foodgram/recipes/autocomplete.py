@@ -0,0 +1,76 @@
+import threading
+from bisect import bisect_left
+
+from recipes.cache import get_catalogue_version
+from recipes.models import Ingredient
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def normalize(value):
+    """Приведение строки к виду для поиска: без учета регистра
+    и без различия букв ё/е."""
+
+    return value.strip().casefold().replace('ё', 'е')
+
+
+class IngredientIndex:
+    """Индекс ингредиентов для автодополнения в форме рецепта.
+    Хранит отсортированный по нормализованному названию список
+    ингредиентов: совпадения по началу названия находятся бинарным поиском,
+    совпадения по подстроке - полным проходом и выдаются после них."""
+
+    def __init__(self, ingredients):
+        entries = sorted(
+            (normalize(item['name']), item['name'], item['id'], item)
+            for item in ingredients
+        )
+        self._keys = [entry[0] for entry in entries]
+        self._items = [entry[3] for entry in entries]
+
+    def __len__(self):
+        return len(self._items)
+
+    def search(self, query, limit):
+        query = normalize(query)
+        if not query:
+            return self._items[:limit]
+
+        result = []
+        position = bisect_left(self._keys, query)
+        while (len(result) < limit and position < len(self._keys)
+               and self._keys[position].startswith(query)):
+            result.append(self._items[position])
+            position += 1
+
+        if len(result) < limit:
+            for key, item in zip(self._keys, self._items):
+                if query in key and not key.startswith(query):
+                    result.append(item)
+                    if len(result) == limit:
+                        break
+        return result
+
+
+def get_index():
+    """Индекс ингредиентов текущего процесса.
+    Строится из базы при первом обращении и перестраивается при смене
+    версии справочников, общей для всех процессов через базу
+    (recipes.models.CacheVersion)."""
+
+    global _index, _index_version
+    version = get_catalogue_version()
+    index = _index
+    if index is None or _index_version != version:
+        with _index_lock:
+            if _index is None or _index_version != version:
+                _index = IngredientIndex(
+                    Ingredient.objects.values(
+                        'id', 'name', 'measurement_unit'
+                    ).order_by()
+                )
+                _index_version = version
+            index = _index
+    return index
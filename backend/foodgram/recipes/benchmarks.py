@@ -0,0 +1,471 @@
+import io
+import json
+import os
+import random
+import time
+
+from django.conf import settings
+
+DATA_ROOT = os.path.join(settings.BASE_DIR, 'data')
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    """Регистрация сценария для команды manage.py benchmark."""
+
+    def decorator(func):
+        SCENARIOS[name] = func
+        return func
+    return decorator
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    if not ordered:
+        return 0
+    position = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+    return ordered[position]
+
+
+def measure(func, args_list):
+    """Время выполнения func для каждого набора аргументов, в мс."""
+
+    timings = []
+    for args in args_list:
+        started = time.perf_counter()
+        func(*args)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def summary(title, timings, **extra):
+    line = (
+        f'{title}: n={len(timings)} '
+        f'p50={percentile(timings, 50):.3f}ms '
+        f'p90={percentile(timings, 90):.3f}ms '
+        f'p99={percentile(timings, 99):.3f}ms '
+        f'max={max(timings, default=0):.3f}ms'
+    )
+    for key, value in extra.items():
+        line += f' {key}={value}'
+    return line
+
+
+@scenario('autocomplete')
+def autocomplete(iterations, **options):
+    """Поиск по индексу автодополнения на полном справочнике
+    data/ingredients.json без обращения к базе данных."""
+
+    from recipes.autocomplete import IngredientIndex
+
+    with open(os.path.join(DATA_ROOT, 'ingredients.json'),
+              encoding='utf-8') as f:
+        ingredients = [
+            dict(item, id=number) for number, item in enumerate(json.load(f))
+        ]
+    started = time.perf_counter()
+    index = IngredientIndex(ingredients)
+    build_time = (time.perf_counter() - started) * 1000
+
+    rng = random.Random(0)
+    names = [item['name'] for item in ingredients]
+    prefixes, substrings = [], []
+    for _ in range(iterations):
+        name = rng.choice(names)
+        prefixes.append((name[:rng.randint(1, 4)], 50))
+        start = rng.randint(0, max(len(name) - 3, 0))
+        substrings.append((name[start:start + 3], 50))
+
+    yield f'ingredients={len(index)} build={build_time:.1f}ms'
+    yield summary('prefix', measure(index.search, prefixes))
+    yield summary('substring', measure(index.search, substrings))
+
+
+@scenario('recipe_validation')
+def recipe_validation(iterations, **options):
+    """Проверка состава рецепта с большим числом ингредиентов
+    (RecipeWriteSerializer.validate_ingredients) на текущей базе."""
+
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.exceptions import ValidationError
+
+    from recipes.models import Ingredient
+    from recipes.serializers import RecipeWriteSerializer
+
+    size = min(150, settings.RECIPE_MAX_INGREDIENTS)
+    ids = list(Ingredient.objects.values_list('id', flat=True)[:size])
+    if len(ids) < size:
+        yield (f'нужно минимум {size} ингредиентов в базе, найдено '
+               f'{len(ids)} - выполните load_ingredients_data')
+        return
+    ingredients = [{'id': pk, 'amount': 1} for pk in ids]
+    serializer = RecipeWriteSerializer()
+    runs = max(1, iterations // 10)
+
+    with CaptureQueriesContext(connection) as queries:
+        serializer.validate_ingredients(ingredients)
+    yield f'ingredients={size} queries={len(queries)}'
+    yield summary('valid', measure(
+        serializer.validate_ingredients, [(ingredients,)] * runs
+    ))
+
+    def validate_invalid(data):
+        try:
+            serializer.validate_ingredients(data)
+        except ValidationError:
+            pass
+
+    invalid = ingredients + [{'id': ids[0], 'amount': 1}]
+    yield summary('duplicate', measure(validate_invalid, [(invalid,)] * runs))
+
+
+def pick_user():
+    """Пользователь с подписками, списком покупок или избранным:
+    на нем задействованы все ветки запросов."""
+
+    from recipes.models import Favorite, ShoppingCart
+    from users.models import CustomUser, Subscribe
+
+    for model in (Subscribe, ShoppingCart, Favorite):
+        row = model.objects.order_by().values('user').first()
+        if row is not None:
+            return CustomUser.objects.get(pk=row['user'])
+    return CustomUser.objects.first()
+
+
+def hot_endpoints():
+    """Основные запросы фронтенда с весами - относительной частотой
+    запроса при нагрузочном прогоне."""
+
+    from recipes.models import Recipe, Tag
+
+    recipe = Recipe.objects.order_by('-favorites_count').first()
+    tag = Tag.objects.first()
+    endpoints = [
+        ('/api/recipes/', 10),
+        ('/api/recipes/?cursor=', 2),
+        ('/api/recipes/?is_favorited=1', 2),
+        ('/api/recipes/?is_in_shopping_cart=1', 2),
+        ('/api/recipes/?ordering=-favorites_count', 2),
+        ('/api/users/subscriptions/', 2),
+        ('/api/recipes/feed/', 3),
+        ('/api/recipes/download_shopping_cart/', 1),
+        ('/api/ingredients/?name=с', 4),
+    ]
+    if tag is not None:
+        endpoints.append((f'/api/recipes/?tags={tag.slug}', 4))
+    if recipe is not None:
+        endpoints.append((f'/api/recipes/{recipe.id}/', 6))
+        endpoints.append((f'/api/recipes/{recipe.id}/similar/', 2))
+        endpoints.append((f'/api/recipes/?author={recipe.author_id}', 2))
+    return endpoints
+
+
+def local_host():
+    hosts = [host for host in settings.ALLOWED_HOSTS if host != '*']
+    return hosts[0].lstrip('.') if hosts else 'localhost'
+
+
+def request_local(client, url, runs):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    timings = []
+    for _ in range(runs):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.get(url, HTTP_HOST=local_host())
+            timings.append((time.perf_counter() - started) * 1000)
+    return timings, len(queries), response.status_code
+
+
+def request_live(base_url, token, plan):
+    """Один виртуальный пользователь: выполняет запросы plan подряд
+    и возвращает время ответов по адресам и число ошибок."""
+
+    import requests
+
+    session = requests.Session()
+    session.headers['Authorization'] = f'Token {token}'
+    timings, errors = {}, {}
+    for url in plan:
+        started = time.perf_counter()
+        try:
+            response = session.get(base_url + url, timeout=30)
+            failed = response.status_code >= 400
+        except requests.RequestException:
+            failed = True
+        timings.setdefault(url, []).append(
+            (time.perf_counter() - started) * 1000
+        )
+        errors[url] = errors.get(url, 0) + failed
+    return timings, errors
+
+
+def run_live(base_url, user, endpoints, iterations, concurrency):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from rest_framework.authtoken.models import Token
+
+    token, _ = Token.objects.get_or_create(user=user)
+    urls, weights = zip(*endpoints)
+    plan = random.Random(0).choices(urls, weights=weights, k=iterations)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(
+            lambda number: request_live(
+                base_url.rstrip('/'), token.key, plan[number::concurrency]
+            ),
+            range(concurrency)
+        ))
+    elapsed = time.perf_counter() - started
+    yield (f'{base_url}: users={concurrency} requests={iterations} '
+           f'rps={iterations / elapsed:.1f}')
+    for url in urls:
+        timings = [ms for result, _ in results for ms in result.get(url, ())]
+        errors = sum(result.get(url, 0) for _, result in results)
+        yield summary(url, timings, errors=errors)
+
+
+@scenario('endpoints')
+def endpoints(iterations, url=None, concurrency=1, **options):
+    """Задержки основных эндпоинтов API на текущей базе (например,
+    после generate_fake_data). Без --url запросы выполняются в процессе
+    с подсчетом SQL-запросов, с --url - по HTTP к запущенному серверу
+    (--concurrency виртуальных пользователей, запросы выбираются
+    случайно с весами)."""
+
+    from rest_framework.test import APIClient
+
+    user = pick_user()
+    if user is None:
+        yield 'в базе нет данных - выполните generate_fake_data'
+        return
+    if url:
+        yield from run_live(url, user, hot_endpoints(), iterations,
+                            concurrency)
+        return
+    client = APIClient()
+    client.force_authenticate(user)
+    runs = max(1, iterations // 20)
+    for path, _ in hot_endpoints():
+        timings, queries, status = request_local(client, path, runs)
+        yield summary(path, timings, queries=queries, status=status)
+
+
+def toggle_state(user, recipe):
+    """Наличие строк и значения счетчиков для сценария toggles."""
+
+    from recipes.models import Favorite, Recipe, ShoppingCart
+    from users.models import CustomUser, Subscribe
+
+    favorites, shopping_cart = Recipe.objects.values_list(
+        'favorites_count', 'shopping_cart_count').get(pk=recipe.pk)
+    followers = CustomUser.objects.values_list(
+        'followers_count', flat=True).get(pk=recipe.author_id)
+    return {
+        'favorite': (Favorite.objects.filter(
+            user=user, recipe=recipe).exists(), favorites),
+        'shopping_cart': (ShoppingCart.objects.filter(
+            user=user, recipe=recipe).exists(), shopping_cart),
+        'subscribe': (Subscribe.objects.filter(
+            user=user, author=recipe.author_id).exists(), followers),
+    }
+
+
+def toggle_worker(user, urls, runs, seed):
+    """Один поток сценария toggles: случайные POST и DELETE по urls.
+    Возвращает число ответов по (действие, статус) и время ответов."""
+
+    from collections import Counter
+
+    from django.db import connection
+    from rest_framework.test import APIClient
+
+    client = APIClient()
+    client.force_authenticate(user)
+    rng = random.Random(seed)
+    statuses, timings = Counter(), []
+    try:
+        for _ in range(runs):
+            name = rng.choice(sorted(urls))
+            method = rng.choice((client.post, client.delete))
+            started = time.perf_counter()
+            try:
+                status = method(urls[name], HTTP_HOST=local_host()).status_code
+            except Exception:
+                status = 500
+            timings.append((time.perf_counter() - started) * 1000)
+            statuses[name, status] += 1
+    finally:
+        # у каждого потока свое соединение с базой
+        connection.close()
+    return statuses, timings
+
+
+@scenario('toggles')
+def toggles(iterations, concurrency=1, **options):
+    """Одновременные добавления и удаления одного рецепта в избранном
+    и списке покупок и подписки на одного автора от одного пользователя
+    из нескольких потоков (--concurrency, по умолчанию 8). Изменение
+    числа строк и счетчиков должно совпасть с разностью ответов 201
+    и 204, сводный список покупок - с корзиной. В конце исходное
+    состояние восстанавливается."""
+
+    from collections import Counter
+    from concurrent.futures import ThreadPoolExecutor
+
+    from django.core.management import call_command
+    from django.core.management.base import CommandError
+    from rest_framework.test import APIClient
+
+    from recipes.models import Recipe
+
+    user = pick_user()
+    recipe = user and Recipe.objects.exclude(author=user).first()
+    if recipe is None:
+        yield 'в базе нет данных - выполните generate_fake_data'
+        return
+    urls = {
+        'favorite': f'/api/recipes/{recipe.pk}/favorite/',
+        'shopping_cart': f'/api/recipes/{recipe.pk}/shopping_cart/',
+        'subscribe': f'/api/users/{recipe.author_id}/subscribe/',
+    }
+    threads = concurrency if concurrency > 1 else 8
+    runs = max(1, iterations // threads)
+    before = toggle_state(user, recipe)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(
+            lambda number: toggle_worker(user, urls, runs, number),
+            range(threads)
+        ))
+    after = toggle_state(user, recipe)
+    statuses = sum((result for result, _ in results), Counter())
+    yield summary('toggle', [ms for _, result in results for ms in result],
+                  threads=threads)
+    for name in sorted(urls):
+        changed = statuses[name, 201] - statuses[name, 204]
+        rows = after[name][0] - before[name][0]
+        counter = after[name][1] - before[name][1]
+        yield (f'{name}: 201={statuses[name, 201]} '
+               f'204={statuses[name, 204]} 400={statuses[name, 400]} '
+               f'500={statuses[name, 500]} '
+               + ('согласовано' if changed == rows == counter else
+                  f'расхождение: ответы {changed}, строки {rows}, '
+                  f'счетчик {counter}'))
+    try:
+        call_command('check_shopping_lists', '--user', str(user.pk),
+                     stdout=io.StringIO())
+        yield 'сводный список покупок согласован'
+    except CommandError as error:
+        yield str(error)
+
+    client = APIClient()
+    client.force_authenticate(user)
+    for name, url in urls.items():
+        if after[name][0] != before[name][0]:
+            method = client.post if before[name][0] else client.delete
+            method(url, HTTP_HOST=local_host())
+
+
+def walk_feed(client, pages):
+    """Время получения первых pages страниц ленты по ссылкам next
+    и число SQL-запросов на страницу."""
+
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    timings, queries = [], []
+    url = '/api/recipes/feed/'
+    while url and len(timings) < pages:
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = client.get(url, HTTP_HOST=local_host())
+            timings.append((time.perf_counter() - started) * 1000)
+        queries.append(len(captured))
+        url = response.data['next']
+    return timings, max(queries, default=0)
+
+
+@scenario('feed')
+def feed(iterations, **options):
+    """Лента подписок /api/recipes/feed/ пользователя с наибольшим
+    числом подписок двумя способами: запросом к рецептам авторов
+    (join) и по заранее посчитанной ленте (timeline). В конце лента
+    пользователя пересчитывается по обычному порогу."""
+
+    from django.db.models import Count
+    from rest_framework.test import APIClient
+
+    from recipes.models import FeedEntry
+    from users.models import CustomUser, Subscribe
+
+    row = Subscribe.objects.order_by().values('user').annotate(
+        following=Count('id')
+    ).order_by('-following').first()
+    if row is None:
+        yield 'в базе нет подписок - выполните generate_fake_data'
+        return
+    user = CustomUser.objects.get(pk=row['user'])
+    client = APIClient()
+    client.force_authenticate(user)
+    pages = max(1, iterations // 20)
+    try:
+        for strategy, min_following in (('join', row['following'] + 1),
+                                        ('timeline', 1)):
+            FeedEntry.objects.rebuild([user.pk], min_following=min_following)
+            timings, queries = walk_feed(client, pages)
+            yield summary(strategy, timings, following=row['following'],
+                          queries=queries)
+    finally:
+        FeedEntry.objects.rebuild([user.pk])
+
+
+@scenario('recipe_filters')
+def recipe_filters(iterations, **options):
+    """Проверка параметров ?tags= и ?author= списка рецептов:
+    прежнее построение вариантов по всем рецептам (SELECT DISTINCT,
+    как в AllValuesMultipleFilter) против проверки по справочнику
+    тегов и первичному ключу пользователей, и полный запрос списка
+    с фильтрами без кэша выдачи."""
+
+    from django.http import QueryDict
+    from django.test.utils import override_settings
+    from rest_framework.test import APIClient
+
+    from recipes.filters import RecipeFilter
+    from recipes.models import Recipe, Tag
+
+    recipe = Recipe.objects.order_by('-pub_date').first()
+    if recipe is None:
+        yield 'в базе нет рецептов - выполните generate_fake_data'
+        return
+    slugs = list(Tag.objects.values_list('slug', flat=True)[:2])
+    query = '&'.join(
+        [f'tags={slug}' for slug in slugs] + [f'author={recipe.author_id}']
+    )
+    runs = max(1, iterations // 10)
+
+    def all_values():
+        list(Recipe.objects.order_by().values_list(
+            'tags__slug', flat=True).distinct())
+        list(Recipe.objects.order_by().values_list(
+            'author_id', flat=True).distinct())
+
+    def validate():
+        RecipeFilter(QueryDict(query),
+                     queryset=Recipe.objects.all()).is_valid()
+
+    yield f'recipes={Recipe.objects.count()} query=?{query}'
+    yield summary('all_values', measure(all_values, [()] * runs))
+    yield summary('lookup', measure(validate, [()] * runs))
+
+    client = APIClient()
+    client.force_authenticate(pick_user())
+    with override_settings(RECIPE_CACHE_TIMEOUT=0):
+        timings, queries, status = request_local(
+            client, f'/api/recipes/?{query}', runs
+        )
+    yield summary('list', timings, queries=queries, status=status)
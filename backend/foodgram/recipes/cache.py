@@ -0,0 +1,286 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from users.models import Subscribe
+
+from recipes.models import CacheVersion, Favorite, ShoppingCart, Tag
+
+CATALOGUE_VERSION_KEY = 'catalogue:version'
+# общая версия всех рецептов (массовая загрузка данных)
+# и версия страниц списка рецептов
+RECIPES_VERSION_KEY = 'recipes:version'
+RECIPE_LIST_VERSION_KEY = 'recipes:list:version'
+
+# поля автора, которые входят в выдачу рецепта
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+def get_cache():
+    return caches[settings.CATALOGUE_CACHE_ALIAS]
+
+
+def recipe_version_key(recipe_id):
+    return f'recipes:recipe:{recipe_id}:version'
+
+
+def user_flags_version_key(user_id):
+    return f'recipes:flags:{user_id}:version'
+
+
+def get_versions(*keys):
+    """Текущие значения версий keys одним запросом к базе
+    (recipes.models.CacheVersion). Версии входят в ключи кэша,
+    поэтому смена версии в любом процессе делает недоступными все
+    ранее сохраненные по ней ответы во всех процессах."""
+
+    versions = CacheVersion.objects.get_many(keys)
+    return tuple(versions[key] for key in keys)
+
+
+def bump_versions(*keys):
+    CacheVersion.objects.bump(keys)
+
+
+def get_catalogue_version():
+    """Текущая версия справочников (теги и ингредиенты)."""
+
+    return get_versions(CATALOGUE_VERSION_KEY)[0]
+
+
+def bump_catalogue_version(**kwargs):
+    """Увеличение версии справочников; подключается к сигналам
+    сохранения и удаления моделей Tag и Ingredient."""
+
+    bump_versions(CATALOGUE_VERSION_KEY)
+
+
+def get_tag_ids():
+    """Соответствие slug - id тегов. Хранится в кэше до изменения
+    справочников, поэтому проверка ?tags= не обращается к базе."""
+
+    cache = get_cache()
+    key = f'catalogue:{get_catalogue_version()}:tag_ids'
+    tag_ids = cache.get(key)
+    if tag_ids is None:
+        tag_ids = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(key, tag_ids, settings.CATALOGUE_CACHE_TIMEOUT)
+    return tag_ids
+
+
+def invalidate_recipes(recipe_ids):
+    """Сброс кэша страниц списка и указанных рецептов.
+    Версии меняются после фиксации транзакции: запрос, прочитавший
+    старые данные до фиксации, сохранит их под старой версией."""
+
+    keys = [RECIPE_LIST_VERSION_KEY, *map(recipe_version_key, recipe_ids)]
+    transaction.on_commit(lambda: bump_versions(*keys))
+
+
+def invalidate_all_recipes():
+    """Сброс всего кэша рецептов, например после массовой загрузки."""
+
+    transaction.on_commit(lambda: bump_versions(RECIPES_VERSION_KEY))
+
+
+def invalidate_user_flags(user_id):
+    """Сброс кэша избранного, покупок и подписок пользователя."""
+
+    key = user_flags_version_key(user_id)
+    transaction.on_commit(lambda: bump_versions(key))
+
+
+def recipe_changed(sender, instance, **kwargs):
+    """Обработчик сохранения и удаления Recipe
+    и IngredientAmountInRecipe."""
+
+    invalidate_recipes([getattr(instance, 'recipe_id', instance.pk)])
+
+
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_recipes([instance.pk])
+    elif pk_set is not None:
+        invalidate_recipes(pk_set)
+    else:
+        # у тега очищен весь список рецептов
+        invalidate_all_recipes()
+
+
+def author_changed(sender, instance, created, update_fields, **kwargs):
+    """Изменение имени или почты автора меняет выдачу его рецептов.
+    Сохранения без этих полей (например, last_login при входе)
+    и регистрация нового пользователя кэш не сбрасывают."""
+
+    if created or (update_fields is not None
+                   and not AUTHOR_FIELDS & set(update_fields)):
+        return
+    invalidate_recipes(instance.recipes.values_list('pk', flat=True))
+
+
+def user_flags_changed(sender, instance, **kwargs):
+    """Обработчик сохранения и удаления Favorite, ShoppingCart
+    и Subscribe."""
+
+    invalidate_user_flags(instance.user_id)
+
+
+def get_user_flags(user_id):
+    """Множества id рецептов в избранном и в списке покупок
+    и id авторов в подписках пользователя (кэшируются до изменения)."""
+
+    cache = get_cache()
+    key = 'recipes:flags:{0}:{1}:{2}'.format(*get_versions(
+        RECIPES_VERSION_KEY, user_flags_version_key(user_id)
+    ), user_id)
+    flags = cache.get(key)
+    if flags is None:
+        flags = (
+            set(Favorite.objects.filter(user_id=user_id).values_list(
+                'recipe_id', flat=True)),
+            set(ShoppingCart.objects.filter(user_id=user_id).values_list(
+                'recipe_id', flat=True)),
+            set(Subscribe.objects.filter(user_id=user_id).values_list(
+                'author_id', flat=True)),
+        )
+        cache.set(key, flags, settings.RECIPE_CACHE_TIMEOUT)
+    return flags
+
+
+class CatalogueCacheMixin:
+    """Миксин для ViewSet справочников.
+    GET-ответы сохраняются в кэше уже сериализованными в JSON байтами
+    с ключом по версии справочников и адресу запроса, отдаются
+    без обращения к базе и снабжаются сильным ETag и Cache-Control
+    для повторной валидации клиентом и nginx."""
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        cache = get_cache()
+        key = 'catalogue:{0}:{1}'.format(
+            get_catalogue_version(), request.get_full_path()
+        )
+        cached = cache.get(key)
+        if cached is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            content = JSONRenderer().render(response.data)
+            cached = (quote_etag(hashlib.md5(content).hexdigest()), content)
+            cache.set(key, cached, settings.CATALOGUE_CACHE_TIMEOUT)
+
+        etag, content = cached
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        response['Cache-Control'] = (
+            f'public, max-age={settings.CATALOGUE_CACHE_MAX_AGE}, '
+            'must-revalidate'
+        )
+        return response
+
+
+class RecipeCacheMixin:
+    """Миксин для ViewSet рецептов.
+    В кэше хранится общая для всех пользователей выдача list и retrieve
+    (флаги is_favorited, is_in_shopping_cart и is_subscribed равны
+    False) с ключом по версиям данных и параметрам запроса. Флаги
+    пользователя проставляются поверх нее по множествам id
+    из get_user_flags. Выдача, зависящая от пользователя
+    (?is_favorited=, ?is_in_shopping_cart=) или от часто меняющихся
+    счетчиков (?ordering=-favorites_count), не кэшируется."""
+
+    user_filter_params = ('is_favorited', 'is_in_shopping_cart')
+    cached_orderings = (None, 'pub_date', '-pub_date')
+
+    # True, пока строится общая выдача: queryset без флагов пользователя
+    shared_payload = False
+
+    def get_flags_user(self):
+        if self.shared_payload:
+            return AnonymousUser()
+        return self.request.user
+
+    def list(self, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return super().list(request, *args, **kwargs)
+        return self.cached_response(
+            super().list, (RECIPE_LIST_VERSION_KEY,),
+            request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if not settings.RECIPE_CACHE_TIMEOUT:
+            return super().retrieve(request, *args, **kwargs)
+        recipe_id = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return self.cached_response(
+            super().retrieve, (recipe_version_key(recipe_id),),
+            request, *args, **kwargs
+        )
+
+    def is_cacheable(self, request):
+        if not settings.RECIPE_CACHE_TIMEOUT:
+            return False
+        params = request.query_params
+        if any(name in params for name in self.user_filter_params):
+            return False
+        return params.get('ordering') in self.cached_orderings
+
+    def get_cache_key(self, request, version_keys):
+        versions = get_versions(
+            CATALOGUE_VERSION_KEY, RECIPES_VERSION_KEY, *version_keys
+        )
+        # ссылки в выдаче абсолютные, поэтому в ключ входит и хост
+        params = sorted(request.query_params.lists())
+        identity = hashlib.md5(
+            f'{request.scheme}://{request.get_host()}{request.path}'
+            f'?{params}'.encode()
+        ).hexdigest()
+        return 'recipes:{0}:{1}'.format(
+            ':'.join(map(str, versions)), identity
+        )
+
+    def cached_response(self, handler, version_keys, request,
+                        *args, **kwargs):
+        cache = get_cache()
+        # версии читаются до обращения к базе (см. invalidate_recipes)
+        key = self.get_cache_key(request, version_keys)
+        data = cache.get(key)
+        if data is None:
+            self.shared_payload = True
+            response = handler(request, *args, **kwargs)
+            self.shared_payload = False
+            if response.status_code != 200:
+                return response
+            data = response.data
+            cache.set(key, data, settings.RECIPE_CACHE_TIMEOUT)
+        return Response(self.with_user_flags(data, request.user))
+
+    def with_user_flags(self, data, user):
+        if user.is_anonymous:
+            return data
+        favorites, shopping_cart, subscriptions = get_user_flags(user.id)
+        for recipe in data.get('results', [data]):
+            recipe['is_favorited'] = recipe['id'] in favorites
+            recipe['is_in_shopping_cart'] = recipe['id'] in shopping_cart
+            recipe['author']['is_subscribed'] = (
+                recipe['author']['id'] in subscriptions
+            )
+        return data
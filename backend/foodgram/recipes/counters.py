@@ -0,0 +1,77 @@
+from django.db.models import F
+from users.models import CustomUser, Subscribe
+
+from .models import Favorite, Recipe, ShoppingCart
+
+# счетчики рецепта для списков пользователя
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'shopping_cart_count',
+}
+
+
+def change_counter(queryset, field, delta):
+    """Изменение счетчика F-выражением. Счетчик не уменьшается ниже
+    нуля: расхождение, накопленное до пересчета командой
+    recount_counters, не должно мешать удалению записей."""
+
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def change_user_counter(user_id, field, delta):
+    change_counter(CustomUser.objects.filter(pk=user_id), field, delta)
+
+
+def recipe_saving(sender, instance, raw, update_fields, **kwargs):
+    """Запоминает прежнего автора рецепта перед сохранением:
+    автора можно сменить в админке."""
+
+    previous = None
+    if not raw and instance.pk is not None and (
+            update_fields is None
+            or {'author', 'author_id'} & set(update_fields)):
+        previous = Recipe.objects.filter(pk=instance.pk).values_list(
+            'author_id', flat=True
+        ).first()
+    instance._counters_author = previous
+
+
+def recipe_saved(sender, instance, created, raw, **kwargs):
+    """Обработчики сохранения и удаления Recipe (API, админка,
+    каскадное удаление): счетчик рецептов автора."""
+
+    previous = instance.__dict__.pop('_counters_author', None)
+    if raw:
+        return
+    if created:
+        change_user_counter(instance.author_id, 'recipes_count', 1)
+    elif previous is not None and previous != instance.author_id:
+        change_user_counter(previous, 'recipes_count', -1)
+        change_user_counter(instance.author_id, 'recipes_count', 1)
+
+
+def recipe_deleted(sender, instance, **kwargs):
+    change_user_counter(instance.author_id, 'recipes_count', -1)
+
+
+def user_link_saved(sender, instance, created, raw, **kwargs):
+    """Обработчики сохранения и удаления Favorite, ShoppingCart
+    и Subscribe в обход API (админка, каскадное удаление). API меняет
+    связи одним запросом без сигналов и обновляет счетчики само."""
+
+    if created and not raw:
+        change_link_counter(sender, instance, 1)
+
+
+def user_link_deleted(sender, instance, **kwargs):
+    change_link_counter(sender, instance, -1)
+
+
+def change_link_counter(model, instance, delta):
+    if model is Subscribe:
+        change_user_counter(instance.author_id, 'followers_count', delta)
+        return
+    change_counter(Recipe.objects.filter(pk=instance.recipe_id),
+                   RECIPE_COUNTERS[model], delta)
@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.db import transaction
+from jobs.queue import enqueue
+from users.models import Subscribe
+
+from .models import FeedEntry, FeedTimeline, Recipe
+
+
+def has_timeline(user):
+    return FeedTimeline.objects.filter(user=user).exists()
+
+
+def join_feed(user):
+    """Лента подписок запросом к рецептам: рецепты авторов из подписок
+    пользователя по индексу (author, -pub_date)."""
+
+    return Recipe.objects.filter(
+        author__in=Subscribe.objects.filter(user=user).values('author')
+    ).order_by('-pub_date', '-id')
+
+
+def timeline_feed(user):
+    """Заранее посчитанная лента подписок (записи FeedEntry)."""
+
+    return FeedEntry.objects.filter(user=user)
+
+
+def follow(user_id, author_id):
+    """Обработка новой подписки: рецепты автора добавляются в ленту,
+    если она ведется. Иначе при достижении порога подписок
+    построение ленты ставится в очередь фоновых задач."""
+
+    if has_timeline(user_id):
+        FeedEntry.objects.add_author(user_id, author_id)
+    elif Subscribe.objects.filter(user_id=user_id).count() >= (
+            settings.FEED_TIMELINE_MIN_FOLLOWING):
+        transaction.on_commit(lambda: enqueue(
+            'recipes.build_feed_timeline', {'user_id': user_id},
+            idempotency_key=f'feed:{user_id}'
+        ))
+
+
+def unfollow(user_id, author_id):
+    FeedEntry.objects.remove_author(user_id, author_id)
+
+
+def schedule_fan_out(sender, instance, created, **kwargs):
+    """Новый рецепт раскладывается по лентам подписчиков автора
+    фоновой задачей после фиксации транзакции."""
+
+    if not created or not Subscribe.objects.filter(
+            author_id=instance.author_id).exists():
+        return
+    transaction.on_commit(lambda: enqueue(
+        'recipes.fan_out_recipe', {'recipe_id': instance.pk}
+    ))
+
+
+def subscription_saved(sender, instance, created, **kwargs):
+    """Обработчики сохранения и удаления Subscribe (админка, каскадное
+    удаление). API меняет подписки одним запросом без сигналов
+    и вызывает follow и unfollow напрямую."""
+
+    if created:
+        follow(instance.user_id, instance.author_id)
+
+
+def subscription_deleted(sender, instance, **kwargs):
+    unfollow(instance.user_id, instance.author_id)
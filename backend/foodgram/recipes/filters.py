@@ -1,50 +1,87 @@
-from django_filters import AllValuesMultipleFilter, rest_framework
-from rest_framework.filters import SearchFilter
+from django.db.models import Exists, OuterRef
+from django_filters import rest_framework
+from rest_framework.filters import BaseFilterBackend
+from users.models import CustomUser
 
+from recipes.cache import get_tag_ids
 from recipes.models import Recipe
+from recipes.search import get_search_engine
 
 
-class IngredientSearchFilter(SearchFilter):
-    search_param = 'name'
+def tag_choices():
+    return [(slug, slug) for slug in get_tag_ids()]
+
+
+class RecipeSearchFilter(BaseFilterBackend):
+    """Полнотекстовый поиск рецептов по ?search= в названии, описании,
+    названиях ингредиентов и тегов. Результаты упорядочены
+    по релевантности (если не передан ?ordering=), у каждого рецепта
+    есть фрагмент описания с подсветкой совпадений (search_headline)."""
+
+    search_param = 'search'
+    max_length = 200
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return get_search_engine().search(queryset, query[:self.max_length])
 
 
 class RecipeFilter(rest_framework.FilterSet):
+    """Фильтры списка рецептов.
+    Slug тегов проверяются по кэшу справочника тегов, id авторов -
+    одним запросом по первичному ключу пользователей, без построения
+    списка вариантов по всем рецептам."""
+
     is_favorited = rest_framework.BooleanFilter(method='favorite')
     is_in_shopping_cart = rest_framework.BooleanFilter(method='shopping_cart')
-    tags = AllValuesMultipleFilter(field_name='tags__slug')
-    author = AllValuesMultipleFilter(field_name='author__id')
+    tags = rest_framework.MultipleChoiceFilter(
+        choices=tag_choices, method='filter_tags'
+    )
+    author = rest_framework.ModelMultipleChoiceFilter(
+        queryset=CustomUser.objects.only('pk'), method='filter_author'
+    )
 
     class Meta:
         model = Recipe
         fields = ('author', 'tags',)
 
-    def favorite(self, queryset, name, value):
-        # если в запросе передано ?is_favorited=1, то выбираем
-        # записи из таблицы Favorite по related_name usera
-        # т.е. ищем записи где текущий пользователь добавил в избранное рецепты
-        if value is True:
-            queryset = queryset.filter(
-                favorites__user__username=self.request.user
-            )
-            return queryset
-        # # если в запросе передано ?is_favorited=0, то наоборот,
-        # но не понятно а зачем этот случай.
-        # сделала, потому что в документации к API это требуется.
-        # но для интерфейса не понимаю зачем оно...
-        elif value is False:
-            queryset = queryset.exclude(
-                favorites__user__username=self.request.user
+    def filter_tags(self, queryset, name, value):
+        # EXISTS по таблице связей вместо соединения: рецепт с несколькими
+        # выбранными тегами не дублируется, и DISTINCT не нужен
+        tag_ids = get_tag_ids()
+        return queryset.annotate(has_tags=Exists(
+            Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'),
+                tag_id__in=[tag_ids[slug] for slug in value
+                            if slug in tag_ids],
             )
+        )).filter(has_tags=True)
+
+    def filter_author(self, queryset, name, value):
+        # пустой queryset не входит в EMPTY_VALUES django-filter,
+        # поэтому метод вызывается и без параметра ?author=
+        if not value:
             return queryset
+        return queryset.filter(author_id__in=[author.pk for author in value])
+
+    def favorite(self, queryset, name, value):
+        # ?is_favorited=1 - рецепты в избранном текущего пользователя,
+        # ?is_favorited=0 - все остальные (требуется документацией к API)
+        return self.filter_by_user(queryset, 'favorites', value)
 
     def shopping_cart(self, queryset, name, value):
-        if value is True:
-            queryset = queryset.filter(
-                shopping_cart__user__username=self.request.user
-            )
-            return queryset
-        elif value is False:
-            queryset = queryset.exclude(
-                shopping_cart__user__username=self.request.user
-            )
-            return queryset
+        return self.filter_by_user(queryset, 'shopping_cart', value)
+
+    def filter_by_user(self, queryset, relation, value):
+        """Фильтр по id текущего пользователя в таблице relation,
+        без соединения с таблицей пользователей."""
+
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none() if value else queryset
+        lookup = {f'{relation}__user_id': user.id}
+        if value:
+            return queryset.filter(**lookup)
+        return queryset.exclude(**lookup)
@@ -0,0 +1,136 @@
+import hashlib
+import io
+import os
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from drf_base64.fields import Base64ImageField
+from jobs.queue import enqueue
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+from recipes.cache import invalidate_recipes
+from recipes.models import Recipe
+
+UPLOAD_DIR = 'recipes'
+RENDITIONS_DIR = 'recipes/renditions'
+RENDITION_FORMATS = (('webp', 'WEBP'), ('jpeg', 'JPEG'))
+
+ProcessedImage = namedtuple('ProcessedImage', ('name', 'content'))
+
+
+def to_rgb(image):
+    """Приведение к RGB; прозрачность заменяется белым фоном."""
+
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def encode(image, image_format, quality):
+    buffer = io.BytesIO()
+    # метаданные (EXIF, ICC, GPS) не передаются при сохранении
+    image.save(buffer, image_format, quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+class RecipeImageField(Base64ImageField):
+    """Поле изображения рецепта.
+    Загрузка декодируется и проверяется Base64ImageField, затем
+    изображение открывается Pillow, поворачивается по EXIF, очищается
+    от метаданных и перекодируется в JPEG. Имя файла - хэш содержимого
+    загрузки, поэтому одинаковые изображения хранятся в одном экземпляре."""
+
+    def to_internal_value(self, data):
+        try:
+            upload = super().to_internal_value(data)
+        except ValueError:
+            # строка data: без ;base64, или с неверным base64
+            self.fail('invalid_image')
+        raw = upload.read()
+        if len(raw) > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise serializers.ValidationError(
+                'Размер изображения превышает допустимый.'
+            )
+        digest = hashlib.sha256(raw).hexdigest()
+        name = f'{UPLOAD_DIR}/{digest}.jpg'
+        if default_storage.exists(name):
+            return ProcessedImage(name, None)
+
+        try:
+            image = Image.open(io.BytesIO(raw))
+            image.load()
+        except (OSError, ValueError, SyntaxError,
+                Image.DecompressionBombError):
+            self.fail('invalid_image')
+        if image.format not in settings.RECIPE_IMAGE_FORMATS:
+            self.fail('invalid_image')
+
+        image = to_rgb(ImageOps.exif_transpose(image))
+        limit = settings.RECIPE_IMAGE_MAX_DIMENSION
+        image.thumbnail((limit, limit), Image.LANCZOS)
+        return ProcessedImage(name, encode(image, 'JPEG', quality=90))
+
+
+def store_image(processed):
+    """Сохранение обработанного изображения в хранилище (если такого
+    содержимого еще нет) и планирование генерации превью после
+    фиксации транзакции. Возвращает имя файла для поля Recipe.image."""
+
+    if processed.content is not None and not default_storage.exists(
+            processed.name):
+        default_storage.save(processed.name, ContentFile(processed.content))
+    transaction.on_commit(lambda: schedule_renditions(processed.name))
+    return processed.name
+
+
+def rendition_name(image_name, rendition, extension):
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return f'{RENDITIONS_DIR}/{stem}/{rendition}.{extension}'
+
+
+def rendition_urls(image_name):
+    return {
+        rendition: {
+            extension: default_storage.url(
+                rendition_name(image_name, rendition, extension)
+            )
+            for extension, _ in RENDITION_FORMATS
+        }
+        for rendition in settings.RECIPE_IMAGE_RENDITIONS
+    }
+
+
+def generate_renditions(image_name):
+    """Генерация превью (thumbnail, card, full) в WebP и JPEG для
+    изображения рецепта. Уже существующие файлы не пересоздаются."""
+
+    with default_storage.open(image_name, 'rb') as f:
+        original = to_rgb(ImageOps.exif_transpose(Image.open(f)))
+    for rendition, size in settings.RECIPE_IMAGE_RENDITIONS.items():
+        image = original.copy()
+        image.thumbnail((size, size), Image.LANCZOS)
+        for extension, image_format in RENDITION_FORMATS:
+            name = rendition_name(image_name, rendition, extension)
+            if not default_storage.exists(name):
+                default_storage.save(name, ContentFile(
+                    encode(image, image_format, quality=80)
+                ))
+    recipes = Recipe.objects.filter(image=image_name)
+    invalidate_recipes(list(recipes.values_list('pk', flat=True)))
+    recipes.update(has_renditions=True)
+
+
+def schedule_renditions(image_name):
+    """Генерация превью ставится в очередь фоновых задач.
+    Ключ идемпотентности не дает поставить одно и то же изображение
+    в очередь повторно, пока предыдущая задача не выполнена."""
+
+    enqueue('recipes.generate_renditions', {'image_name': image_name},
+            idempotency_key=f'renditions:{image_name}')
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.benchmarks import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = 'running performance benchmark scenarios'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*',
+                            help='сценарии (по умолчанию - все): '
+                                 + ', '.join(sorted(SCENARIOS)))
+        parser.add_argument('--iterations', type=int, default=1000)
+        parser.add_argument('--url',
+                            help='адрес запущенного сервера для сценария '
+                                 'endpoints, например http://localhost:8000')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='число параллельных пользователей '
+                                 'при прогоне по --url')
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or sorted(SCENARIOS)
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(
+                f'Неизвестные сценарии: {", ".join(sorted(unknown))}'
+            )
+        for name in names:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for line in SCENARIOS[name](**options):
+                self.stdout.write(f'  {line}')
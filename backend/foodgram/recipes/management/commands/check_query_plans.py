@@ -0,0 +1,97 @@
+import json
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from recipes.autocomplete import get_index
+from recipes.benchmarks import hot_endpoints, local_host, pick_user
+
+SQLITE_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+
+class Command(BaseCommand):
+    help = ('running EXPLAIN for every query of hot API endpoints '
+            'and failing if a large table is read by a sequential scan')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-rows', type=int, default=1000,
+            help='таблицы меньшего размера не проверяются'
+        )
+
+    # ответ из кэша рецептов не обращается к базе
+    @override_settings(RECIPE_CACHE_TIMEOUT=0)
+    def handle(self, *args, **options):
+        user = pick_user()
+        if user is None:
+            raise CommandError('В базе нет пользователей')
+        client = APIClient()
+        client.force_authenticate(user)
+        self.table_sizes = {}
+        self.tables = set(connection.introspection.table_names())
+        # индекс автодополнения строится один раз на версию справочника
+        get_index()
+        problems = []
+        for url, _ in hot_endpoints():
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url, HTTP_HOST=local_host())
+            if response.status_code >= 400:
+                raise CommandError(f'{url}: ответ {response.status_code}')
+            for query in queries.captured_queries:
+                sql = query['sql']
+                # COUNT(*) без условий всегда читает таблицу целиком,
+                # для больших таблиц есть ?cursor= и ?count=estimated
+                if not sql.startswith('SELECT') or sql.startswith(
+                        'SELECT COUNT(*) AS "__count" FROM'):
+                    continue
+                for table in self.sequential_scans(sql):
+                    # подзапросы в FROM SQLite тоже показывает как SCAN
+                    if table not in self.tables:
+                        continue
+                    rows = self.table_size(table)
+                    if rows >= options['min_rows']:
+                        problems.append(f'{url}: {table} ({rows} строк)\n'
+                                        f'    {sql}')
+            self.stdout.write(f'{url}: запросов {len(queries)}')
+        if problems:
+            raise CommandError(
+                'Последовательное чтение больших таблиц:\n'
+                + '\n'.join(problems)
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Последовательного чтения больших таблиц нет'
+        ))
+
+    def sequential_scans(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                return list(self.postgres_scans(plan[0]['Plan']))
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [
+                match.group(1) for match in (
+                    SQLITE_SCAN_RE.match(row[-1]) for row in cursor.fetchall()
+                ) if match
+            ]
+
+    def postgres_scans(self, node):
+        if node['Node Type'] == 'Seq Scan':
+            yield node['Relation Name']
+        for child in node.get('Plans', ()):
+            yield from self.postgres_scans(child)
+
+    def table_size(self, table):
+        if table not in self.table_sizes:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT COUNT(*) FROM '
+                    + connection.ops.quote_name(table)
+                )
+                self.table_sizes[table] = cursor.fetchone()[0]
+        return self.table_sizes[table]
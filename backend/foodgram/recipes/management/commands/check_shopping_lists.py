@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'checking aggregated shopping lists against shopping carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append',
+                            dest='users',
+                            help='id пользователя (можно указать несколько)')
+        parser.add_argument('--fix', action='store_true',
+                            help='пересчитать списки с расхождениями')
+
+    def handle(self, *args, **options):
+        users = options['users']
+        expected = {
+            (row['user_id'], row['ingredient_id']): row['total_amount']
+            for row in ShoppingListItem.objects.calculate(users).iterator()
+        }
+        stored = ShoppingListItem.objects.all()
+        if users is not None:
+            stored = stored.filter(user__in=users)
+        actual = {
+            (user, ingredient): total_amount
+            for user, ingredient, total_amount in stored.values_list(
+                'user_id', 'ingredient_id', 'total_amount').iterator()
+        }
+
+        broken_users = set()
+        for key in expected.keys() | actual.keys():
+            if expected.get(key) != actual.get(key):
+                user, ingredient = key
+                broken_users.add(user)
+                self.stdout.write(
+                    f'Пользователь {user}, ингредиент {ingredient}: '
+                    f'ожидается {expected.get(key)}, '
+                    f'в списке {actual.get(key)}'
+                )
+
+        if not broken_users:
+            self.stdout.write(self.style.SUCCESS(
+                'Сводные списки покупок согласованы'
+            ))
+            return
+        if options['fix']:
+            ShoppingListItem.objects.rebuild(broken_users)
+            self.stdout.write(self.style.SUCCESS(
+                f'Пересчитаны списки пользователей: {len(broken_users)}'
+            ))
+            return
+        raise CommandError(
+            f'Расхождения в списках пользователей: {len(broken_users)}'
+        )
@@ -0,0 +1,75 @@
+import json
+import os
+import shutil
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.images import RENDITION_FORMATS, rendition_name
+from recipes.models import Recipe
+from recipes.snapshot import (MEDIA_DIR, SNAPSHOT_MODELS, SnapshotEncoder,
+                              snapshot_fields, snapshot_filename)
+
+
+class Command(BaseCommand):
+    help = ('exporting foodgram data as newline-delimited json '
+            '(one file per model) with recipe images')
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', type=str)
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--no-media', action='store_true',
+                            help='не копировать изображения рецептов')
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        os.makedirs(directory, exist_ok=True)
+        encoder = SnapshotEncoder(ensure_ascii=False)
+
+        for name, model in SNAPSHOT_MODELS:
+            fields = snapshot_fields(model)
+            rows = model.objects.order_by('pk').values_list(*fields)
+            count = 0
+            path = os.path.join(directory, snapshot_filename(name))
+            with open(path, 'w', encoding='utf-8') as f:
+                for row in rows.iterator(chunk_size=options['chunk_size']):
+                    f.write(encoder.encode(dict(zip(fields, row))))
+                    f.write('\n')
+                    count += 1
+            self.stdout.write(f'{name}: {count}')
+
+        if not options['no_media']:
+            copied = self.copy_media(directory)
+            self.stdout.write(f'media: {copied}')
+        with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+            json.dump([name for name, _ in SNAPSHOT_MODELS], f)
+        self.stdout.write(self.style.SUCCESS(f'Снимок сохранен в {directory}'))
+
+    def copy_media(self, directory):
+        """Копирование изображений рецептов вместе с превью:
+        has_renditions=True в снимке означает, что файлы превью есть."""
+
+        copied = 0
+        images = Recipe.objects.exclude(image='').values_list(
+            'image', flat=True).order_by().distinct().iterator()
+        for image in images:
+            if not self.copy_file(image, directory):
+                self.stderr.write(f'Нет файла изображения: {image}')
+                continue
+            copied += 1
+            for rendition in settings.RECIPE_IMAGE_RENDITIONS:
+                for extension, _ in RENDITION_FORMATS:
+                    self.copy_file(
+                        rendition_name(image, rendition, extension),
+                        directory
+                    )
+        return copied
+
+    def copy_file(self, name, directory):
+        source = os.path.join(settings.MEDIA_ROOT, name)
+        if not os.path.exists(source):
+            return False
+        target = os.path.join(directory, MEDIA_DIR, name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copy2(source, target)
+        return True
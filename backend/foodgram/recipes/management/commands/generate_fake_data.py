@@ -0,0 +1,211 @@
+import io
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from recipes.cache import bump_catalogue_version, invalidate_all_recipes
+from recipes.images import generate_renditions
+from recipes.models import (Favorite, FeedEntry, Ingredient,
+                            IngredientAmountInRecipe, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag)
+from recipes.search import update_search_vectors
+from recipes.similarity import update_similar_recipes
+from recipes.snapshot import keep_auto_dates
+from users.models import CustomUser, Subscribe
+
+DEFAULT_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+FAKE_IMAGE = 'recipes/fake_data.jpg'
+TEXT = ('Подготовьте продукты. Смешайте ингредиенты, доведите до готовности '
+        'и подавайте к столу.')
+
+
+def zipf_weights(size, exponent=1.1):
+    """Накопленные веса распределения Ципфа: несколько элементов
+    встречаются часто, большинство - редко."""
+
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)
+    ))
+
+
+def weighted_sample(rng, population, cum_weights, size):
+    """Выборка size разных элементов с весами cum_weights."""
+
+    size = min(size, len(population))
+    chosen = {}
+    while len(chosen) < size:
+        for item in rng.choices(population, cum_weights=cum_weights,
+                                k=size - len(chosen)):
+            chosen[item] = None
+    return list(chosen)
+
+
+def batches(objects, size):
+    return iter(lambda: list(islice(objects, size)), [])
+
+
+class Command(BaseCommand):
+    help = ('generating users, recipes, favorites, shopping carts and '
+            'subscriptions with realistic distributions for load testing')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--password', default='password',
+                            help='пароль всех созданных пользователей')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        ingredients, tags = self.ensure_catalogue()
+
+        users = self.create_users(options['users'], options['password'])
+        recipes = self.create_recipes(options['recipes'], users,
+                                      ingredients, tags)
+        # популярность пользователей и рецептов случайна,
+        # но одинакова для избранного, покупок и подписок
+        self.rng.shuffle(users)
+        self.rng.shuffle(recipes)
+        self.create_links(Favorite, 'recipe', users, recipes, alpha=1.2)
+        self.create_links(ShoppingCart, 'recipe', users, recipes, alpha=1.6)
+        self.create_links(Subscribe, 'author', users, users, alpha=1.4)
+
+        # производные данные пересчитываются так же, как после импорта
+        call_command('recount_counters', stdout=io.StringIO())
+        ShoppingListItem.objects.rebuild()
+        FeedEntry.objects.rebuild()
+        update_search_vectors()
+        update_similar_recipes(full=True)
+        generate_renditions(FAKE_IMAGE)
+        bump_catalogue_version()
+        invalidate_all_recipes()
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные созданы за {time.perf_counter() - started:.1f} сек.'
+        ))
+
+    def ensure_catalogue(self):
+        if not Ingredient.objects.exists():
+            call_command('load_ingredients_data', stdout=self.stdout)
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in DEFAULT_TAGS
+            )
+        ingredients = list(Ingredient.objects.values_list('pk', flat=True))
+        self.rng.shuffle(ingredients)
+        return ingredients, list(Tag.objects.values_list('pk', flat=True))
+
+    def bulk_insert(self, model, objects):
+        """Вставка пачками; возвращает id созданных записей
+        (bulk_create возвращает их не на всех СУБД)."""
+
+        last_id = model.objects.aggregate(last=Max('pk'))['last'] or 0
+        with transaction.atomic():
+            for batch in batches(objects, self.batch_size):
+                model.objects.bulk_create(batch)
+        ids = list(model.objects.filter(pk__gt=last_id).order_by(
+            'pk').values_list('pk', flat=True))
+        self.stdout.write(f'{model._meta.verbose_name_plural}: {len(ids)}')
+        return ids
+
+    def create_users(self, count, password):
+        password = make_password(password)
+        start = (CustomUser.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+        return self.bulk_insert(CustomUser, (
+            CustomUser(
+                username=f'user{number}',
+                email=f'user{number}@example.com',
+                first_name='Имя',
+                last_name='Фамилия',
+                password=password,
+            ) for number in range(start, start + count)
+        ))
+
+    def create_image(self):
+        if default_storage.exists(FAKE_IMAGE):
+            return
+        image = Image.new('RGB', (1280, 960), (238, 238, 238))
+        ImageDraw.Draw(image).ellipse((240, 80, 1040, 880),
+                                      fill=(226, 108, 45))
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=85)
+        default_storage.save(FAKE_IMAGE, ContentFile(buffer.getvalue()))
+
+    def create_recipes(self, count, users, ingredients, tags):
+        self.create_image()
+        authors = zipf_weights(len(users))
+        now = timezone.now()
+        names = dict(Ingredient.objects.values_list('pk', 'name'))
+        popularity = zipf_weights(len(ingredients))
+        compositions = [
+            weighted_sample(self.rng, ingredients, popularity,
+                            self.rng.randint(3, 12))
+            for _ in range(count)
+        ]
+        with keep_auto_dates(Recipe):
+            recipe_ids = self.bulk_insert(Recipe, (
+                Recipe(
+                    name=f'{names[items[0]].capitalize()} '
+                         f'с {names[items[1]]}'[:200],
+                    text=TEXT,
+                    image=FAKE_IMAGE,
+                    author_id=author,
+                    cooking_time=self.rng.randint(5, 180),
+                    pub_date=now - timedelta(
+                        minutes=self.rng.randint(0, 60 * 24 * 730)),
+                ) for items, author in zip(compositions, self.rng.choices(
+                    users, cum_weights=authors, k=count))
+            ))
+        self.bulk_insert(IngredientAmountInRecipe, (
+            IngredientAmountInRecipe(
+                recipe_id=recipe, ingredients_id=ingredient,
+                amount=self.rng.randint(1, 500)
+            )
+            for recipe, items in zip(recipe_ids, compositions)
+            for ingredient in items
+        ))
+        self.bulk_insert(Recipe.tags.through, (
+            Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+            for recipe in recipe_ids
+            for tag in self.rng.sample(tags, min(len(tags),
+                                                 self.rng.randint(1, 2)))
+        ))
+        return recipe_ids
+
+    def create_links(self, model, field, users, targets, alpha):
+        """Связи пользователь - объект (избранное, покупки, подписки):
+        число связей у пользователя и популярность объектов
+        распределены по степенному закону."""
+
+        weights = zipf_weights(len(targets))
+
+        def links():
+            for user in users:
+                count = min(int(self.rng.paretovariate(alpha)) - 1,
+                            len(targets) // 2)
+                chosen = set(self.rng.choices(targets, cum_weights=weights,
+                                              k=count))
+                if field == 'author':
+                    chosen.discard(user)
+                for target in chosen:
+                    yield model(user_id=user, **{f'{field}_id': target})
+
+        self.bulk_insert(model, links())
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import generate_renditions
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'generating image renditions for recipes without them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='обработать все рецепты, а не только без превью'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(has_renditions=False)
+        images = recipes.values_list('image', flat=True).order_by().distinct()
+        processed = failed = 0
+        for image in images.iterator():
+            try:
+                generate_renditions(image)
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'{image}: {error}')
+                continue
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Превью созданы для {processed} изображений, ошибок: {failed}'
+        ))
@@ -0,0 +1,126 @@
+import json
+import os
+import shutil
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from recipes.cache import bump_catalogue_version, invalidate_all_recipes
+from recipes.images import (RENDITION_FORMATS, rendition_name,
+                            schedule_renditions)
+from recipes.models import FeedEntry, Recipe, ShoppingListItem
+from recipes.search import update_search_vectors
+from recipes.similarity import update_similar_recipes
+from recipes.snapshot import (MEDIA_DIR, SNAPSHOT_MODELS, keep_auto_dates,
+                              snapshot_filename)
+
+
+class Command(BaseCommand):
+    help = ('importing foodgram data exported by export_foodgram '
+            'with bulk inserts in dependency order')
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', type=str)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--no-media', action='store_true',
+                            help='не копировать изображения рецептов')
+
+    def handle(self, *args, **options):
+        directory = options['directory']
+        if not os.path.isdir(directory):
+            raise CommandError(f'Каталог {directory} не найден')
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            for name, model in SNAPSHOT_MODELS:
+                path = os.path.join(directory, snapshot_filename(name))
+                if not os.path.exists(path):
+                    self.stdout.write(f'{name}: файл отсутствует, пропуск')
+                    continue
+                with open(path, encoding='utf-8') as f:
+                    with keep_auto_dates(model):
+                        count = self.load(model, f, options['batch_size'])
+                self.stdout.write(f'{name}: {count}')
+
+            self.reset_sequences()
+            # производные данные пересчитываются по загруженным таблицам
+            ShoppingListItem.objects.rebuild()
+            FeedEntry.objects.rebuild()
+            update_search_vectors()
+            update_similar_recipes(full=True)
+
+        if not options['no_media']:
+            copied = self.copy_media(os.path.join(directory, MEDIA_DIR))
+            self.stdout.write(f'media: {copied}')
+        scheduled = self.check_renditions()
+        self.stdout.write(f'renditions: {scheduled} в очереди')
+        bump_catalogue_version()
+        invalidate_all_recipes()
+        self.stdout.write(self.style.SUCCESS(
+            f'Импорт завершен за {time.perf_counter() - started:.1f} сек.'
+        ))
+
+    def load(self, model, file, batch_size):
+        rows = (json.loads(line) for line in file if line.strip())
+        count = 0
+        while True:
+            batch = [model(**row) for row in islice(rows, batch_size)]
+            if not batch:
+                return count
+            model.objects.bulk_create(batch)
+            count += len(batch)
+
+    def reset_sequences(self):
+        models = [model for _, model in SNAPSHOT_MODELS]
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def check_renditions(self):
+        """Рецепты, превью которых нет в хранилище, получают
+        has_renditions=False, чтобы выдача не ссылалась на отсутствующие
+        файлы; превью таких изображений ставятся в очередь генерации.
+        Возвращает число изображений в очереди."""
+
+        missing = [
+            image for image in Recipe.objects.exclude(image='').values_list(
+                'image', flat=True).order_by().distinct().iterator()
+            if not all(
+                default_storage.exists(
+                    rendition_name(image, rendition, extension)
+                )
+                for rendition in settings.RECIPE_IMAGE_RENDITIONS
+                for extension, _ in RENDITION_FORMATS
+            )
+        ]
+        images = iter(missing)
+        for batch in iter(lambda: list(islice(images, 1000)), []):
+            Recipe.objects.filter(image__in=batch).update(
+                has_renditions=False
+            )
+        scheduled = 0
+        for image in missing:
+            if default_storage.exists(image):
+                schedule_renditions(image)
+                scheduled += 1
+            else:
+                self.stderr.write(f'Нет файла изображения: {image}')
+        return scheduled
+
+    def copy_media(self, source):
+        copied = 0
+        for root, _, files in os.walk(source):
+            target = os.path.join(
+                settings.MEDIA_ROOT, os.path.relpath(root, source)
+            )
+            os.makedirs(target, exist_ok=True)
+            for filename in files:
+                shutil.copy2(os.path.join(root, filename), target)
+                copied += 1
+        return copied
@@ -1,36 +1,158 @@
+import csv
+import io
 import json
 import os
+import time
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from django.db.utils import IntegrityError
+from django.db import connection, transaction
 
+from recipes.cache import bump_catalogue_version
 from recipes.models import Ingredient
 
 DATA_ROOT = os.path.join(settings.BASE_DIR, 'data')
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def iter_json(file):
+    """Потоковое чтение JSON-массива объектов: файл читается частями,
+    объекты разбираются по одному через JSONDecoder.raw_decode."""
+
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,')
+        if not started and buffer:
+            if buffer[0] != '[':
+                raise CommandError('Ожидается JSON-массив ингредиентов')
+            buffer = buffer[1:]
+            started = True
+            continue
+        if started and buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                if not buffer:
+                    return
+                raise CommandError('Некорректный JSON в файле ингредиентов')
+            chunk = file.read(READ_CHUNK_SIZE)
+            eof = not chunk
+            buffer += chunk
+            continue
+        yield item['name'], item['measurement_unit']
+        buffer = buffer[end:]
+
+
+def iter_csv(file):
+    # неполные строки возвращаются с пустыми полями
+    # и учитываются как пропущенные
+    for row in csv.reader(file):
+        if row:
+            name, measurement_unit = (row + ['', ''])[:2]
+            yield name, measurement_unit
 
 
 class Command(BaseCommand):
-    help = 'loading ingredients from data in json'
+    help = 'loading ingredients from data in json or csv'
 
     def add_arguments(self, parser):
         parser.add_argument('filename', default='ingredients.json', nargs='?',
                             type=str)
+        parser.add_argument('--format', choices=('json', 'csv'),
+                            help='формат файла (по умолчанию - по расширению)')
+        parser.add_argument('--encoding', default='utf-8-sig')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='проверить файл без записи в базу')
+        parser.add_argument('--no-copy', action='store_true',
+                            help='не использовать COPY на PostgreSQL')
 
     def handle(self, *args, **options):
-        try:
-            with open(os.path.join(DATA_ROOT, options['filename']), 'r',
-                      encoding='utf-8') as f:
-                data = json.load(f)
-                for ingredient in data:
-                    try:
-                        Ingredient.objects.create(name=ingredient["name"],
-                                                  measurement_unit=ingredient[
-                                                      "measurement_unit"])
-                    except IntegrityError:
-                        print(f'Ингридиет {ingredient["name"]} '
-                              f'{ingredient["measurement_unit"]} '
-                              f'уже есть в базе')
+        path = os.path.join(DATA_ROOT, options['filename'])
+        file_format = options['format'] or (
+            'csv' if path.lower().endswith('.csv') else 'json'
+        )
+        reader = iter_csv if file_format == 'csv' else iter_json
+        use_copy = (connection.vendor == 'postgresql'
+                    and not options['no_copy'])
 
+        started = time.perf_counter()
+        total = inserted = 0
+        try:
+            with open(path, 'r', encoding=options['encoding'],
+                      newline='') as f, transaction.atomic():
+                # дубли отсекаются в памяти по ограничению
+                # unique_for_ingredient (name, measurement_unit)
+                seen = set(Ingredient.objects.values_list(
+                    'name', 'measurement_unit').iterator())
+                batch = []
+                for name, measurement_unit in reader(f):
+                    total += 1
+                    key = (name.strip(), measurement_unit.strip())
+                    if not all(key) or key in seen:
+                        continue
+                    seen.add(key)
+                    batch.append(key)
+                    if len(batch) >= options['batch_size']:
+                        inserted += self.write(batch, use_copy)
+                        batch = []
+                inserted += self.write(batch, use_copy)
+                if options['dry_run']:
+                    transaction.set_rollback(True)
         except FileNotFoundError:
             raise CommandError('Файл отсутствует в директории data')
+
+        if inserted and not options['dry_run']:
+            # bulk-запись не отправляет сигналы моделей
+            bump_catalogue_version()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Проверено" if options["dry_run"] else "Загружено"}: '
+            f'строк {total}, добавлено {inserted}, '
+            f'пропущено {total - inserted}, '
+            f'{total / elapsed if elapsed else total:.0f} строк/сек.'
+        ))
+
+    def write(self, batch, use_copy):
+        if not batch:
+            return 0
+        if use_copy:
+            return self.copy(batch)
+        Ingredient.objects.bulk_create(
+            [Ingredient(name=name, measurement_unit=measurement_unit)
+             for name, measurement_unit in batch],
+            ignore_conflicts=True
+        )
+        return len(batch)
+
+    def copy(self, batch):
+        """Запись пачки через COPY во временную таблицу и INSERT ...
+        ON CONFLICT DO NOTHING в таблицу ингредиентов."""
+
+        table = Ingredient._meta.db_table
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(batch)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE IF NOT EXISTS ingredients_load '
+                '(name varchar(150), measurement_unit varchar(25)) '
+                'ON COMMIT DROP'
+            )
+            cursor.execute('TRUNCATE ingredients_load')
+            cursor.copy_expert(
+                'COPY ingredients_load (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)', buffer
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT name, measurement_unit FROM ingredients_load '
+                'ON CONFLICT DO NOTHING'
+            )
+            return cursor.rowcount
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'rebuilding aggregated shopping lists from shopping carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append',
+                            dest='users',
+                            help='id пользователя (можно указать несколько)')
+
+    def handle(self, *args, **options):
+        created = ShoppingListItem.objects.rebuild(options['users'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Сводные списки покупок пересчитаны, строк: {created}'
+        ))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import CustomUser, Subscribe
+
+
+def count_subquery(model, field):
+    """Подзапрос количества записей model, ссылающихся на
+    текущую строку внешнего запроса через поле field."""
+
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            count=Count('pk')
+        ).values('count')
+    ), Value(0))
+
+
+class Command(BaseCommand):
+    help = 'recounting denormalized recipe and user counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipe', type=int, action='append',
+                            dest='recipes',
+                            help='id рецепта (можно указать несколько)')
+        parser.add_argument('--user', type=int, action='append',
+                            dest='users',
+                            help='id пользователя (можно указать несколько)')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.all()
+        users = CustomUser.objects.all()
+        # с --recipe или --user пересчитываются только указанные записи
+        if options['recipes'] is not None or options['users'] is not None:
+            recipes = recipes.filter(pk__in=options['recipes'] or [])
+            users = users.filter(pk__in=options['users'] or [])
+        recipes = recipes.update(
+            favorites_count=count_subquery(Favorite, 'recipe'),
+            shopping_cart_count=count_subquery(ShoppingCart, 'recipe'),
+        )
+        users = users.update(
+            recipes_count=count_subquery(Recipe, 'author'),
+            followers_count=count_subquery(Subscribe, 'author'),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Счетчики пересчитаны: рецептов {recipes}, '
+            f'пользователей {users}'
+        ))
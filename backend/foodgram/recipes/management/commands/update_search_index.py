@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from recipes.search import update_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'recalculating full-text search vectors of all recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = update_search_vectors(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Поисковые векторы обновлены: {updated}'
+        ))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.similarity import update_similar_recipes
+
+
+class Command(BaseCommand):
+    help = ('recalculating similar recipes from favorites co-occurrence '
+            'for recipes whose favorites changed (or all with --full)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='пересчитать похожие для всех рецептов')
+        parser.add_argument('--count', type=int,
+                            help='число похожих рецептов на рецепт')
+        parser.add_argument('--min-users', type=int,
+                            help='минимальное число общих пользователей')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        updated = update_similar_recipes(
+            full=options['full'],
+            count=options['count'],
+            min_users=options['min_users'],
+            chunk_size=options['chunk_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Похожие рецепты пересчитаны: {updated} '
+            f'за {time.perf_counter() - started:.1f} сек.'
+        ))
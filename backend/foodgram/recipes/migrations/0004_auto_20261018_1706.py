@@ -0,0 +1,75 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:06
+
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import F, Sum
+
+
+def fill_shopping_lists(apps, schema_editor):
+    IngredientAmountInRecipe = apps.get_model(
+        'recipes', 'IngredientAmountInRecipe')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    rows = IngredientAmountInRecipe.objects.values(
+        user_id=F('recipe__shopping_cart__user'),
+        ingredient_id=F('ingredients'),
+    ).annotate(total_amount=Sum('amount')).filter(
+        user_id__isnull=False
+    ).order_by()
+    ShoppingListItem.objects.bulk_create(
+        [ShoppingListItem(**row) for row in rows]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0003_auto_20220922_2242'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='ingredientamountinrecipe',
+            options={'ordering': ['-id']},
+        ),
+        migrations.AlterModelOptions(
+            name='tag',
+            options={'ordering': ['name']},
+        ),
+        migrations.AlterField(
+            model_name='ingredientamountinrecipe',
+            name='amount',
+            field=models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1, message='Количество ингредиента в рецепте необходимо не менее 1 (г., мл., шт. и т.д.')], verbose_name='Количество'),
+        ),
+        migrations.AlterField(
+            model_name='tag',
+            name='name',
+            field=models.CharField(max_length=30, unique=True, verbose_name='Наименование'),
+        ),
+        migrations.AlterField(
+            model_name='tag',
+            name='slug',
+            field=models.SlugField(max_length=30, unique=True, verbose_name='Slug поле'),
+        ),
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.PositiveIntegerField(verbose_name='Суммарное количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to='recipes.Ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_ingredient_in_shopping_list'),
+        ),
+        migrations.RunPython(
+            fill_shopping_lists, migrations.RunPython.noop
+        ),
+    ]
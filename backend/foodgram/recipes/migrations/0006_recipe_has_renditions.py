@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_auto_20261018_1707'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='has_renditions',
+            field=models.BooleanField(default=False, verbose_name='Превью изображения готовы'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:17
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# выражение поискового вектора на момент миграции; оно повторяет
+# recipes.search.search_vector_sql, но не зависит от его изменений
+RELATED_NAMES_SQL = (
+    "concat_ws(' ', "
+    "(SELECT string_agg(i.name, ' ') "
+    'FROM recipes_ingredientamountinrecipe ia '
+    'JOIN recipes_ingredient i ON i.id = ia.ingredients_id '
+    'WHERE ia.recipe_id = r.id), '
+    "(SELECT string_agg(t.name, ' ') "
+    'FROM recipes_recipe_tags rt '
+    'JOIN recipes_tag t ON t.id = rt.tag_id '
+    'WHERE rt.recipe_id = r.id))'
+)
+SEARCH_VECTOR_SQL = ' || '.join(
+    f"setweight(to_tsvector('{config}', coalesce({source}, '')), "
+    f"'{weight}')"
+    for config in ('russian', 'english')
+    for weight, source in (
+        ('A', 'r.name'), ('B', RELATED_NAMES_SQL), ('C', 'r.text')
+    )
+)
+
+
+def create_search_index(apps, schema_editor):
+    # GIN-индекс и заполнение вектора есть только на PostgreSQL,
+    # на других СУБД используется поиск recipes.search.PythonSearchEngine
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX recipe_search_vector_gin ON recipes_recipe '
+        'USING gin (search_vector)'
+    )
+    schema_editor.execute(
+        f'UPDATE recipes_recipe r SET search_vector = {SEARCH_VECTOR_SQL}'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS recipe_search_vector_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_has_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
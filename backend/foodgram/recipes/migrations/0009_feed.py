@@ -0,0 +1,44 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_auto_20261018_1720'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0008_auto_20261018_1720'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedTimeline',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='feed_timeline', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Дата построения ленты')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации рецепта')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='recipes.Recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'ordering': ['-pub_date', '-recipe_id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', '-pub_date', '-recipe'], name='feed_user_pub_date'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_recipe_in_feed'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_similar_recipes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('key', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Ключ')),
+                ('version', models.BigIntegerField(verbose_name='Версия')),
+            ],
+        ),
+    ]
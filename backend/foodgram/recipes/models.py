@@ -1,8 +1,17 @@
+import hashlib
+import time
+from itertools import islice
+
 from django.db.models.aggregates import Sum
 
+from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core import validators
-from django.db import models
-from users.models import CustomUser
+from django.db import models, transaction
+from django.db.models import (BooleanField, Case, Count, Exists, F,
+                              OuterRef, Prefetch, Value, When)
+from django.utils import timezone
+from users.models import CustomUser, Subscribe, UserLinkQuerySet
 
 
 class Ingredient(models.Model):
@@ -63,6 +72,39 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    """QuerySet для модели Recipe с вычислением пользовательских флагов
+    в основном запросе вместо отдельных запросов на каждый рецепт."""
+
+    def with_related(self):
+        # автор, теги и ингредиенты загружаются фиксированным числом
+        # запросов на всю страницу, а не на каждый рецепт
+        return self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredient',
+                queryset=IngredientAmountInRecipe.objects.select_related(
+                    'ingredients')
+            )
+        )
+
+    def with_user_flags(self, user):
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+                is_author_subscribed=Value(False, output_field=BooleanField())
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_author_subscribed=Exists(Subscribe.objects.filter(
+                user=user, author=OuterRef('author')))
+        )
+
+
 class Recipe(models.Model):
     """Модель Recipe хранит сведения о всех рецептах пользователей."""
 
@@ -75,6 +117,10 @@ class Recipe(models.Model):
         upload_to='recipes/',
         verbose_name='Изображение рецепта'
     )
+    has_renditions = models.BooleanField(
+        verbose_name='Превью изображения готовы',
+        default=False
+    )
     author = models.ForeignKey(
         CustomUser,
         on_delete=models.CASCADE,
@@ -104,13 +150,42 @@ class Recipe(models.Model):
         auto_now_add=True,
         db_index=True
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Количество добавлений в избранное',
+        default=0,
+        db_index=True
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        verbose_name='Количество добавлений в список покупок',
+        default=0
+    )
+    # поддерживается recipes.search.update_search_vectors,
+    # GIN-индекс создается миграцией только на PostgreSQL
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            # рецепты автора: фильтр ?author= и превью в подписках
+            models.Index(fields=['author', '-pub_date'],
+                         name='recipe_author_pub_date'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def change_counter(self, field, delta):
+        """Атомарное изменение счетчика рецепта F-выражением,
+        без гонки между чтением и записью значения."""
+
+        Recipe.objects.filter(pk=self.pk).update(**{field: F(field) + delta})
+
 
 class IngredientAmountInRecipe(models.Model):
     """Модель IngredientAmountInRecipe является дополнительной
@@ -153,22 +228,6 @@ class IngredientAmountInRecipe(models.Model):
                 '- Кол-во <{self.amount}> '
                 )
 
-    @staticmethod
-    def download_shopping_cart(user):
-        shopping_list = IngredientAmountInRecipe.objects.filter(
-            recipe__shopping_cart__user=user).values(
-                'ingredients__name',
-                'ingredients__measurement_unit'
-        ).annotate(amount=Sum('amount')).order_by()
-
-        content = (
-            [f'{item["ingredients__name"]} '
-             f'({item["ingredients__measurement_unit"]}) '
-             f'- {item["amount"]}\n'
-             for item in shopping_list]
-        )
-        return content
-
 
 class Favorite(models.Model):
     """Модель Favorite хранит данные о добавлении
@@ -187,6 +246,8 @@ class Favorite(models.Model):
         verbose_name='Рецепт в списке избранного',
     )
 
+    objects = UserLinkQuerySet.as_manager()
+
     class Meta:
         ordering = ['-id']
         constraints = [
@@ -217,6 +278,8 @@ class ShoppingCart(models.Model):
         verbose_name='Рецепт в списке покупок',
     )
 
+    objects = UserLinkQuerySet.as_manager()
+
     class Meta:
         ordering = ['-id']
         constraints = [
@@ -225,3 +288,477 @@ class ShoppingCart(models.Model):
                 name='unique_recipe_in_user_shopping_cart'
             )
         ]
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+    """QuerySet для модели ShoppingListItem.
+    Содержит операции инкрементального обновления сводного списка покупок
+    и его полного пересчета из исходных таблиц."""
+
+    @staticmethod
+    def calculate(users=None):
+        """Сводный список покупок, посчитанный напрямую из рецептов
+        в списке покупок: словари user_id, ingredient_id, total_amount."""
+
+        queryset = IngredientAmountInRecipe.objects.all()
+        if users is not None:
+            queryset = queryset.filter(recipe__shopping_cart__user__in=users)
+        return queryset.values(
+            user_id=F('recipe__shopping_cart__user'),
+            ingredient_id=F('ingredients'),
+        ).annotate(total_amount=Sum('amount')).filter(
+            user_id__isnull=False
+        ).order_by()
+
+    def apply_deltas(self, user_ids, deltas):
+        """Применяет изменения количеств {ingredient_id: delta}
+        к сводным спискам всех переданных пользователей.
+        Число запросов не зависит от количества пользователей
+        и ингредиентов: вставка недостающих строк, одно UPDATE
+        и одно удаление обнулившихся. Строки вставляются с нулевым
+        количеством без предварительной проверки (INSERT ... ON CONFLICT
+        DO NOTHING), поэтому одновременные запросы, добавляющие одну
+        и ту же строку, не нарушают уникальность (user, ingredient),
+        а прибавляются к ней общим UPDATE."""
+
+        deltas = {
+            ingredient: delta for ingredient, delta in deltas.items() if delta
+        }
+        user_ids = list(user_ids)
+        if not deltas or not user_ids:
+            return
+        with transaction.atomic():
+            self.bulk_create([
+                self.model(
+                    user_id=user_id,
+                    ingredient_id=ingredient,
+                    total_amount=0
+                )
+                for user_id in user_ids
+                for ingredient, delta in deltas.items()
+                if delta > 0
+            ], ignore_conflicts=True)
+            items = self.filter(
+                user_id__in=user_ids, ingredient_id__in=deltas
+            )
+            items.update(total_amount=F('total_amount') + Case(
+                *[When(ingredient_id=ingredient, then=Value(delta))
+                  for ingredient, delta in deltas.items()],
+                output_field=models.IntegerField()
+            ))
+            items.filter(total_amount__lte=0).delete()
+            self.touch(user_ids)
+
+    @staticmethod
+    def touch(users=None):
+        """Отметка времени изменения сводных списков пользователей
+        (всех, если users не указан) для заголовка Last-Modified."""
+
+        queryset = CustomUser.objects.all()
+        if users is not None:
+            queryset = queryset.filter(pk__in=users)
+        queryset.update(shopping_list_modified=timezone.now())
+
+    @staticmethod
+    def recipes_amounts(recipes):
+        """Суммарные количества ингредиентов нескольких рецептов."""
+
+        return dict(IngredientAmountInRecipe.objects.filter(
+            recipe__in=recipes
+        ).order_by().values('ingredients_id').annotate(
+            total=Sum('amount')
+        ).values_list('ingredients_id', 'total'))
+
+    def add_recipes(self, user, recipes):
+        if recipes:
+            self.apply_deltas([user.id], self.recipes_amounts(recipes))
+
+    def remove_recipes(self, user, recipes):
+        if recipes:
+            self.apply_deltas([user.id], {
+                ingredient: -amount
+                for ingredient, amount in self.recipes_amounts(
+                    recipes).items()
+            })
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        """Пересчет списков покупок всех пользователей, у которых рецепт
+        в корзине, после изменения ингредиентов рецепта."""
+
+        deltas = {
+            ingredient: (new_amounts.get(ingredient, 0)
+                         - old_amounts.get(ingredient, 0))
+            for ingredient in set(old_amounts) | set(new_amounts)
+        }
+        if not any(deltas.values()):
+            return
+        self.apply_deltas(
+            ShoppingCart.objects.filter(
+                recipe=recipe).values_list('user_id', flat=True),
+            deltas
+        )
+
+    def clear(self, user):
+        self.filter(user=user).delete()
+        self.touch([user.pk])
+
+    def rebuild(self, users=None):
+        """Полный пересчет сводных списков (всех или указанных
+        пользователей) из таблиц ShoppingCart и IngredientAmountInRecipe."""
+
+        with transaction.atomic():
+            items = self.all()
+            if users is not None:
+                items = items.filter(user__in=users)
+            items.delete()
+            rows = (self.model(**row)
+                    for row in self.calculate(users).iterator())
+            created = 0
+            # пачки собираются по мере чтения, размер INSERT для каждой
+            # пачки Django подбирает под ограничения СУБД
+            for batch in iter(lambda: list(islice(rows, 1000)), []):
+                self.bulk_create(batch)
+                created += len(batch)
+            self.touch(users)
+        return created
+
+    def shopping_list(self, user):
+        """Сводный список покупок пользователя для выгрузки.
+        Возвращает queryset словарей, пригодный для потоковой выдачи
+        через .iterator()."""
+
+        return self.filter(user=user).values(
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit'),
+            amount=F('total_amount'),
+        ).order_by('ingredient__name')
+
+    def fingerprint(self, user):
+        """Отпечаток списка покупок пользователя для ETag: хэш строк
+        (ingredient_id, total_amount), прочитанных по уникальному индексу
+        (user, ingredient). Агрегаты вроде числа строк и сумм количеств
+        совпадают у разных списков и для ETag не годятся."""
+
+        digest = hashlib.md5()
+        for ingredient, amount in self.filter(user=user).order_by(
+                'ingredient_id').values_list(
+                'ingredient_id', 'total_amount').iterator():
+            digest.update(f'{ingredient}:{amount};'.encode())
+        return digest.hexdigest()
+
+
+class ShoppingListItem(models.Model):
+    """Модель ShoppingListItem хранит денормализованный сводный список
+    покупок пользователя: суммарное количество каждого ингредиента
+    по всем рецептам из ShoppingCart. Обновляется инкрементально
+    при изменении корзины или ингредиентов рецепта."""
+
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент',
+    )
+    total_amount = models.PositiveIntegerField(
+        verbose_name='Суммарное количество',
+    )
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_ingredient_in_shopping_list'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.ingredient} - {self.total_amount}'
+
+
+class FeedEntryQuerySet(models.QuerySet):
+    """QuerySet для модели FeedEntry: заполнение лент подписок
+    (fan-out on write) и их полный пересчет."""
+
+    def insert(self, rows):
+        """Вставка строк (user_id, recipe_id, pub_date) пачками,
+        уже существующие записи пропускаются."""
+
+        rows = iter(rows)
+        created = 0
+        for batch in iter(lambda: list(islice(rows, 1000)), []):
+            self.bulk_create([
+                self.model(user_id=user, recipe_id=recipe, pub_date=pub_date)
+                for user, recipe, pub_date in batch
+            ], ignore_conflicts=True)
+            created += len(batch)
+        return created
+
+    def add_author(self, user_id, author_id):
+        """Рецепты автора в ленту пользователя (после подписки)."""
+
+        return self.insert(
+            (user_id, recipe, pub_date)
+            for recipe, pub_date in Recipe.objects.filter(
+                author_id=author_id
+            ).values_list('pk', 'pub_date').iterator()
+        )
+
+    def remove_author(self, user_id, author_id):
+        return self.filter(
+            user_id=user_id, recipe__author_id=author_id
+        ).delete()[0]
+
+    def fan_out(self, recipe):
+        """Новый рецепт в ленты подписчиков автора, для которых
+        лента ведется (есть запись FeedTimeline)."""
+
+        return self.insert(
+            (user, recipe.pk, recipe.pub_date)
+            for user in Subscribe.objects.filter(
+                author_id=recipe.author_id,
+                user__feed_timeline__isnull=False,
+            ).values_list('user_id', flat=True).iterator()
+        )
+
+    def rebuild(self, users=None, min_following=None):
+        """Пересчет лент подписок (всех или указанных пользователей).
+        Лента ведется для пользователей, подписанных не менее чем
+        на min_following авторов (по умолчанию FEED_TIMELINE_MIN_FOLLOWING),
+        для остальных лента удаляется. Возвращает число пользователей
+        с лентой."""
+
+        if min_following is None:
+            min_following = settings.FEED_TIMELINE_MIN_FOLLOWING
+        subscriptions = Subscribe.objects.all()
+        timelines = FeedTimeline.objects.all()
+        entries = self.all()
+        if users is not None:
+            subscriptions = subscriptions.filter(user__in=users)
+            timelines = timelines.filter(user__in=users)
+            entries = entries.filter(user__in=users)
+        with transaction.atomic():
+            entries.delete()
+            timelines.delete()
+            followers = list(subscriptions.order_by().values(
+                'user'
+            ).annotate(
+                following=Count('id')
+            ).filter(
+                following__gte=min_following
+            ).values_list('user', flat=True))
+            FeedTimeline.objects.bulk_create(
+                FeedTimeline(user_id=user) for user in followers
+            )
+            self.insert(Subscribe.objects.filter(
+                user__in=followers, author__recipes__isnull=False
+            ).values_list(
+                'user_id', 'author__recipes__id', 'author__recipes__pub_date'
+            ).iterator())
+        return len(followers)
+
+
+class FeedTimeline(models.Model):
+    """Модель FeedTimeline отмечает пользователей, для которых лента
+    подписок хранится заранее посчитанной в FeedEntry (подписчики
+    большого числа авторов). Для остальных лента строится запросом
+    с соединением рецептов и подписок."""
+
+    user = models.OneToOneField(
+        CustomUser,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='feed_timeline',
+        verbose_name='Пользователь',
+    )
+    created = models.DateTimeField(
+        verbose_name='Дата построения ленты',
+        auto_now_add=True,
+    )
+
+    def __str__(self):
+        return f'{self.user}'
+
+
+class FeedEntry(models.Model):
+    """Модель FeedEntry хранит ленту подписок пользователя: рецепты
+    авторов, на которых он подписан, с датой публикации рецепта
+    для выдачи по курсору без соединения с таблицей рецептов."""
+
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пользователь',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации рецепта',
+    )
+
+    objects = FeedEntryQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-pub_date', '-recipe_id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_recipe_in_feed'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-recipe'],
+                         name='feed_user_pub_date'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.recipe_id}'
+
+
+class SimilarRecipeQuerySet(models.QuerySet):
+
+    def for_recipe(self, recipe_id):
+        """id похожих рецептов по убыванию сходства."""
+
+        return list(self.filter(recipe_id=recipe_id).values_list(
+            'similar_id', flat=True
+        ))
+
+
+class SimilarRecipe(models.Model):
+    """Модель SimilarRecipe хранит заранее посчитанные похожие рецепты
+    ("добавившие этот рецепт в избранное также добавили"): не больше
+    SIMILAR_RECIPES_COUNT рецептов с наибольшим косинусным сходством
+    по избранному пользователей. Заполняется командой
+    update_similar_recipes."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий рецепт',
+    )
+    score = models.FloatField(
+        verbose_name='Сходство',
+    )
+
+    objects = SimilarRecipeQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-score', 'similar_id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_similar_recipe'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id} - {self.similar_id} ({self.score:.3f})'
+
+
+class FavoriteChangeQuerySet(models.QuerySet):
+
+    def mark(self, recipe_ids):
+        """Отметка рецептов, избранное которых изменилось."""
+
+        return len(self.bulk_create(
+            self.model(recipe_id=recipe) for recipe in recipe_ids
+        ))
+
+
+class FavoriteChange(models.Model):
+    """Модель FavoriteChange - журнал рецептов, избранное которых
+    изменилось после последнего расчета похожих рецептов.
+    Хранится только id рецепта без внешнего ключа: отметка
+    появляется и при удалении рецепта вместе с избранным."""
+
+    recipe_id = models.PositiveIntegerField(
+        verbose_name='id рецепта',
+    )
+
+    objects = FavoriteChangeQuerySet.as_manager()
+
+    def __str__(self):
+        return f'{self.recipe_id}'
+
+
+class CacheVersionQuerySet(models.QuerySet):
+
+    @staticmethod
+    def initial_version():
+        # новый ключ (например, после очистки таблицы) начинается
+        # с текущего времени, чтобы не вернуться к старой версии,
+        # под которой в кэше еще могут лежать ответы
+        return int(time.time() * 1000)
+
+    def get_many(self, keys):
+        """Версии keys {key: version} одним запросом, отсутствующие
+        ключи создаются."""
+
+        versions = dict(self.filter(key__in=keys).values_list(
+            'key', 'version'))
+        missing = [key for key in keys if key not in versions]
+        if missing:
+            initial = self.initial_version()
+            self.bulk_create([
+                self.model(key=key, version=initial) for key in missing
+            ], ignore_conflicts=True)
+            versions.update(self.filter(key__in=missing).values_list(
+                'key', 'version'))
+        return versions
+
+    def bump(self, keys):
+        """Увеличение версий keys. Если ключа еще нет, он создается
+        и увеличивается вместе с остальными: версия, которую
+        одновременно создал читающий запрос, тоже меняется."""
+
+        if self.filter(key__in=keys).update(
+                version=F('version') + 1) == len(keys):
+            return
+        initial = self.initial_version()
+        self.bulk_create([
+            self.model(key=key, version=initial) for key in keys
+        ], ignore_conflicts=True)
+        self.filter(key__in=keys).update(version=F('version') + 1)
+
+
+class CacheVersion(models.Model):
+    """Модель CacheVersion хранит версии данных, входящие в ключи
+    кэша ответов (recipes.cache). Версии хранятся в базе, а не в самом
+    кэше: кэш в памяти у каждого процесса свой, а данные меняют
+    и другие воркеры gunicorn, и воркер очереди задач, и команды
+    управления."""
+
+    key = models.CharField(
+        verbose_name='Ключ',
+        max_length=100,
+        primary_key=True,
+    )
+    version = models.BigIntegerField(
+        verbose_name='Версия',
+    )
+
+    objects = CacheVersionQuerySet.as_manager()
+
+    def __str__(self):
+        return f'{self.key} - {self.version}'
@@ -1,6 +1,204 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def estimated_count(queryset):
+    """Оценка числа записей по статистике планировщика PostgreSQL
+    (EXPLAIN запроса) вместо COUNT(*). На других СУБД - обычный count()."""
+
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def without_annotations(queryset):
+    """Копия queryset без вычисляемых полей для подсчета строк.
+    При наличии annotate() Django считает строки через подзапрос,
+    вычисляя аннотации (например, флаги is_favorited) для каждой строки.
+    Условия фильтрации хранят выражения целиком, поэтому от удаления
+    аннотаций не зависят."""
+
+    if queryset.query.group_by is not None:
+        return queryset
+    queryset = queryset.all()
+    queryset.query.annotations.clear()
+    queryset.query.set_annotation_mask(None)
+    return queryset
+
+
+class CountPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        return without_annotations(self.object_list).count()
+
+
+class EstimatedCountPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        return estimated_count(without_annotations(self.object_list))
+
+
+def keyset_ordering(queryset):
+    """Сортировка queryset в виде [(поле модели, по убыванию)],
+    дополненная первичным ключом для однозначности.
+    None, если сортировка не сводится к обязательным полям модели
+    (например, сортировка по релевантности поиска). Внешний ключ
+    допускается только по имени столбца (recipe_id): сортировка
+    по самой связи идет по полям связанной модели."""
+
+    opts = queryset.model._meta
+    ordering = []
+    for name in queryset.query.order_by or opts.ordering:
+        if not isinstance(name, str):
+            return None
+        descending = name.startswith('-')
+        name = name.lstrip('-')
+        try:
+            field = opts.pk if name == 'pk' else opts.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if not field.concrete or field.null or (
+                field.is_relation and name != field.attname):
+            return None
+        ordering.append((field, descending))
+    if not any(field.primary_key for field, _ in ordering):
+        descending = ordering[-1][1] if ordering else False
+        ordering.append((opts.pk, descending))
+    return ordering
 
 
 class CustomPageNumberPagination(PageNumberPagination):
+    """Постраничная выдача по номеру страницы (?page=, ?limit=).
+    С параметром ?cursor= включается выдача по курсору: следующая
+    страница выбирается условием по ключу сортировки (например,
+    pub_date и id рецепта) без OFFSET и без подсчета COUNT(*).
+    Параметр ?count=estimated заменяет точное число записей оценкой
+    планировщика PostgreSQL."""
+
     page_size = 6
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.estimate = (
+            request.query_params.get(self.count_query_param) == 'estimated'
+        )
+        self.ordering = None
+        if self.cursor_query_param in request.query_params:
+            self.ordering = keyset_ordering(queryset)
+        if self.ordering is None:
+            # сортировка по выражению (?search=) - выдача по номеру страницы
+            self.django_paginator_class = (
+                EstimatedCountPaginator if self.estimate else CountPaginator
+            )
+            return super().paginate_queryset(queryset, request, view)
+        return self.paginate_keyset(queryset, request)
+
+    def paginate_keyset(self, queryset, request):
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*(
+            f'-{field.attname}' if descending else field.attname
+            for field, descending in self.ordering
+        ))
+        self.count = estimated_count(
+            without_annotations(queryset)
+        ) if self.estimate else None
+        position = self.decode_cursor(
+            request.query_params.get(self.cursor_query_param)
+        )
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+        page = list(queryset[:page_size + 1])
+        self.next_position = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_position = [
+                field.value_to_string(page[-1]) for field, _ in self.ordering
+            ]
+        return page
+
+    def after(self, position):
+        """Условие "строка после позиции" для составного ключа:
+        (a < a0) OR (a = a0 AND b < b0) OR ... с учетом направлений."""
+
+        condition = Q()
+        equal = Q()
+        for (field, descending), value in zip(self.ordering, position):
+            lookup = 'lt' if descending else 'gt'
+            condition |= equal & Q(**{f'{field.attname}__{lookup}': value})
+            equal &= Q(**{field.attname: value})
+        return condition
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                field.to_python(value)
+                for (field, _), value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, ValidationError, binascii.Error):
+            raise NotFound('Неверный курсор.')
+
+    def encode_cursor(self, position):
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def get_next_link(self):
+        if self.ordering is None:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_position)
+        )
+
+    def get_paginated_response(self, data):
+        if self.ordering is None:
+            return super().get_paginated_response(data)
+        response = OrderedDict((('next', self.get_next_link()),
+                                ('previous', None)))
+        if self.count is not None:
+            response['count'] = self.count
+        response['results'] = data
+        return Response(response)
+
+
+class KeysetPagination(CustomPageNumberPagination):
+    """Выдача только по курсору: первая страница - без ?cursor=,
+    следующие - по ссылке next. Для лент, где номер страницы
+    и общее число записей не нужны."""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.estimate = (
+            request.query_params.get(self.count_query_param) == 'estimated'
+        )
+        self.ordering = keyset_ordering(queryset)
+        return self.paginate_keyset(queryset, request)
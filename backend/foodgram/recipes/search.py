@@ -0,0 +1,249 @@
+import re
+from collections import defaultdict
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection, transaction
+from django.db.models import (Case, F, FloatField, Func, TextField, Value,
+                              When)
+
+from jobs.queue import enqueue
+
+from .autocomplete import normalize
+from .models import IngredientAmountInRecipe, Recipe, Tag
+
+# конфигурации полнотекстового поиска PostgreSQL: русская и английская
+SEARCH_CONFIGS = ('russian', 'english')
+
+# веса частей документа: A - название, B - ингредиенты и теги,
+# C - описание (значения как у ts_rank по умолчанию)
+WEIGHTS = {'A': 1.0, 'B': 0.4, 'C': 0.2}
+
+HEADLINE_OPTIONS = 'MaxFragments=2, MaxWords=20, MinWords=5'
+HEADLINE_WORDS = 20
+
+RANK_ORDERING = ('-search_rank', '-pub_date', '-id')
+
+WORD_RE = re.compile(r'\w+')
+
+
+def search_vector_sql(alias='r'):
+    """SQL-выражение tsvector рецепта (для UPDATE по таблице
+    recipes_recipe с псевдонимом alias)."""
+
+    ingredients = (
+        "(SELECT string_agg(i.name, ' ') "
+        'FROM recipes_ingredientamountinrecipe ia '
+        'JOIN recipes_ingredient i ON i.id = ia.ingredients_id '
+        f'WHERE ia.recipe_id = {alias}.id)'
+    )
+    tags = (
+        "(SELECT string_agg(t.name, ' ') "
+        'FROM recipes_recipe_tags rt '
+        'JOIN recipes_tag t ON t.id = rt.tag_id '
+        f'WHERE rt.recipe_id = {alias}.id)'
+    )
+    parts = []
+    for config in SEARCH_CONFIGS:
+        for weight, source in (
+            ('A', f'{alias}.name'),
+            ('B', f"concat_ws(' ', {ingredients}, {tags})"),
+            ('C', f'{alias}.text'),
+        ):
+            parts.append(
+                f"setweight(to_tsvector('{config}', "
+                f"coalesce({source}, '')), '{weight}')"
+            )
+    return ' || '.join(parts)
+
+
+def update_search_vectors(recipe_ids=None, batch_size=1000):
+    """Пересчет столбца Recipe.search_vector для указанных рецептов
+    (или всех, пачками по batch_size). На других СУБД столбец
+    не используется и пересчет не выполняется."""
+
+    if connection.vendor != 'postgresql':
+        return 0
+    sql = (f'UPDATE recipes_recipe r SET search_vector = '
+           f'{search_vector_sql()} WHERE r.id = ANY(%s)')
+    if recipe_ids is None:
+        recipe_ids = Recipe.objects.order_by('pk').values_list(
+            'pk', flat=True).iterator()
+    updated = 0
+    batch = []
+    with connection.cursor() as cursor:
+        for recipe_id in recipe_ids:
+            batch.append(recipe_id)
+            if len(batch) == batch_size:
+                cursor.execute(sql, [batch])
+                updated += cursor.rowcount
+                batch = []
+        if batch:
+            cursor.execute(sql, [batch])
+            updated += cursor.rowcount
+    return updated
+
+
+def refresh_search_vectors(recipe_ids):
+    """Пересчет поисковых векторов рецептов после фиксации транзакции:
+    к этому моменту сохранены и теги, и ингредиенты рецепта, в том
+    числе записанные массовыми запросами без сигналов."""
+
+    if connection.vendor != 'postgresql':
+        return
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        transaction.on_commit(lambda: update_search_vectors(recipe_ids))
+
+
+def recipe_search_changed(sender, instance, update_fields=None, **kwargs):
+    """Обработчик сохранения Recipe (API, админка, генерация данных)
+    и сохранения и удаления IngredientAmountInRecipe. Сохранения
+    без названия и описания (например, has_renditions) вектор
+    не меняют."""
+
+    if sender is Recipe and update_fields is not None and not (
+            {'name', 'text'} & set(update_fields)):
+        return
+    refresh_search_vectors([getattr(instance, 'recipe_id', instance.pk)])
+
+
+def recipe_tags_search_changed(sender, instance, action, reverse, pk_set,
+                               **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            refresh_search_vectors([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        refresh_search_vectors(pk_set)
+    elif action == 'pre_clear':
+        # после очистки список рецептов тега уже не получить
+        refresh_search_vectors(
+            instance.recipes.values_list('pk', flat=True)
+        )
+
+
+def schedule_search_update(sender, instance, created, **kwargs):
+    """Переименование ингредиента или тега меняет поисковые векторы
+    рецептов, где он используется: пересчет выполняется фоновой задачей."""
+
+    if created or connection.vendor != 'postgresql':
+        return
+    field = 'tags' if sender is Tag else 'ingredients'
+    key = f'search:{field}:{instance.pk}'
+    transaction.on_commit(lambda: enqueue(
+        'recipes.update_search_vectors', {field: [instance.pk]},
+        idempotency_key=key
+    ))
+
+
+def tokenize(text):
+    return WORD_RE.findall(normalize(text))
+
+
+class PostgresSearchEngine:
+    """Поиск по столбцу search_vector с GIN-индексом.
+    Совпадение ищется по запросам в обеих конфигурациях,
+    фрагменты описания с подсветкой строятся ts_headline."""
+
+    def search(self, queryset, query):
+        search_query = None
+        for config in SEARCH_CONFIGS:
+            part = SearchQuery(query, config=config)
+            search_query = part if search_query is None else (
+                search_query | part
+            )
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query),
+            search_headline=Func(
+                Value(SEARCH_CONFIGS[0]),
+                F('text'),
+                search_query,
+                Value(HEADLINE_OPTIONS),
+                function='ts_headline',
+                output_field=TextField(),
+            ),
+        ).order_by(*RANK_ORDERING)
+
+
+class PythonSearchEngine:
+    """Поиск без полнотекстовых возможностей СУБД (SQLite при
+    локальной разработке и тестовых прогонах). Слово запроса совпадает
+    со словом документа по началу, все слова запроса обязательны.
+    Вес и подсветка повторяют поведение PostgresSearchEngine."""
+
+    def documents(self, queryset):
+        recipes = Recipe.objects.filter(pk__in=queryset.values('pk'))
+        fields = defaultdict(lambda: {'A': [], 'B': [], 'C': []})
+        for pk, name, text in recipes.values_list('pk', 'name', 'text'):
+            fields[pk]['A'] = tokenize(name)
+            fields[pk]['C'] = tokenize(text)
+        related = IngredientAmountInRecipe.objects.filter(
+            recipe__in=recipes
+        ).values_list('recipe_id', 'ingredients__name')
+        tags = Recipe.tags.through.objects.filter(
+            recipe__in=recipes
+        ).values_list('recipe_id', 'tag__name')
+        for pk, name in (*related, *tags):
+            fields[pk]['B'].extend(tokenize(name))
+        return fields
+
+    def rank(self, terms, document):
+        rank = 0
+        for term in terms:
+            weights = [
+                WEIGHTS[weight] for weight, words in document.items()
+                if any(word.startswith(term) for word in words)
+            ]
+            if not weights:
+                return None
+            rank += max(weights)
+        return rank / len(terms)
+
+    def headline(self, terms, text):
+        words = text.split()
+        matched = [
+            any(token.startswith(term) for term in terms
+                for token in tokenize(word))
+            for word in words
+        ]
+        start = matched.index(True) if any(matched) else 0
+        start = max(0, start - HEADLINE_WORDS // 4)
+        fragment = [
+            f'<b>{word}</b>' if is_match else word
+            for word, is_match in zip(
+                words[start:start + HEADLINE_WORDS],
+                matched[start:start + HEADLINE_WORDS]
+            )
+        ]
+        return ' '.join(fragment)
+
+    def search(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return queryset.none()
+        ranks = {}
+        for pk, document in self.documents(queryset).items():
+            rank = self.rank(terms, document)
+            if rank is not None:
+                ranks[pk] = rank
+        if not ranks:
+            return queryset.none()
+        texts = dict(Recipe.objects.filter(
+            pk__in=ranks).values_list('pk', 'text'))
+        return queryset.filter(pk__in=ranks).annotate(
+            search_rank=Case(
+                *[When(pk=pk, then=Value(rank))
+                  for pk, rank in ranks.items()],
+                output_field=FloatField(),
+            ),
+            search_headline=Case(
+                *[When(pk=pk, then=Value(self.headline(terms, text)))
+                  for pk, text in texts.items()],
+                output_field=TextField(),
+            ),
+        ).order_by(*RANK_ORDERING)
+
+
+def get_search_engine():
+    if connection.vendor == 'postgresql':
+        return PostgresSearchEngine()
+    return PythonSearchEngine()
@@ -1,10 +1,14 @@
-from django.shortcuts import get_object_or_404
-from drf_base64.fields import Base64ImageField
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
-from users.serializers import CustomUserListSerializer
+from users.serializers import (CustomUserListSerializer,
+                               get_image_renditions)
 
+from .cache import invalidate_recipes
+from .images import RecipeImageField, store_image
+from .search import refresh_search_vectors
 from .models import (Favorite, Ingredient, IngredientAmountInRecipe,
-                     Recipe, ShoppingCart, Tag)
+                     Recipe, ShoppingCart, ShoppingListItem, Tag)
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -48,10 +52,47 @@ def ingredient_bulk_creation(recipe, ingredients):
     IngredientAmountInRecipe.objects.bulk_create(ingredients_for_creation)
 
 
+def ingredient_bulk_update(recipe, ingredients):
+    """Функция обновления ингредиентов рецепта для сериализатора
+    RecipeWriteSerializer. Новый состав сравнивается с текущим:
+    создаются только новые строки, у оставшихся обновляется количество,
+    лишние удаляются. Возвращает прежний состав {ingredient_id: amount}."""
+
+    current = {
+        row.ingredients_id: row
+        for row in IngredientAmountInRecipe.objects.filter(recipe=recipe)
+    }
+    old_amounts = {
+        ingredient_id: row.amount for ingredient_id, row in current.items()
+    }
+    new_amounts = {item['id']: item['amount'] for item in ingredients}
+
+    changed = []
+    for ingredient_id, row in current.items():
+        amount = new_amounts.get(ingredient_id)
+        if amount is not None and amount != row.amount:
+            row.amount = amount
+            changed.append(row)
+    if changed:
+        IngredientAmountInRecipe.objects.bulk_update(changed, ['amount'])
+
+    removed = [
+        row.id for ingredient_id, row in current.items()
+        if ingredient_id not in new_amounts
+    ]
+    if removed:
+        IngredientAmountInRecipe.objects.filter(id__in=removed).delete()
+
+    ingredient_bulk_creation(recipe, [
+        item for item in ingredients if item['id'] not in current
+    ])
+    return old_amounts
+
+
 class RecipeWriteSerializer(serializers.ModelSerializer):
     """Сериализатор для создания рецептов (модель Recipe)."""
 
-    image = Base64ImageField(max_length=None, use_url=True)
+    image = RecipeImageField()
     tags = serializers.PrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all()
@@ -64,48 +105,88 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                   'image', 'text', 'cooking_time']
         read_only_fields = ('author',)
 
-    def validate(self, data):
-        ingredients = data['ingredients']
+    def validate_ingredients(self, ingredients):
+        """Все ингредиенты проверяются одним запросом in_bulk.
+        Ошибки возвращаются списком по позициям:
+        {"ingredients": [{}, {"id": ["..."]}, ...]}."""
+
         if not ingredients:
             raise serializers.ValidationError(
                 'Необходимо добавить минимум один ингредиент'
             )
-        ingredient_list = []
+        limit = settings.RECIPE_MAX_INGREDIENTS
+        if len(ingredients) > limit:
+            raise serializers.ValidationError(
+                f'В рецепте может быть не больше {limit} ингредиентов'
+            )
+        existing = Ingredient.objects.in_bulk(
+            {item['id'] for item in ingredients}
+        )
+        errors = []
+        seen = set()
         for item in ingredients:
-            ingredient = get_object_or_404(
-                Ingredient, id=item['id'])
-
-            if ingredient in ingredient_list:
-                raise serializers.ValidationError(
-                    'Ингредиент должен быть уникальным!'
-                )
-            ingredient_list.append(ingredient)
-
-        return data
-
+            if item['id'] not in existing:
+                errors.append({'id': ['Ингредиент не найден.']})
+            elif item['id'] in seen:
+                errors.append({'id': ['Ингредиент должен быть уникальным!']})
+            else:
+                errors.append({})
+            seen.add(item['id'])
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return ingredients
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        recipe = Recipe.objects.create(
-            **validated_data,
-            author=self.context.get('request').user
-        )
+        author = self.context.get('request').user
+        validated_data['image'] = store_image(validated_data['image'])
+        recipe = Recipe.objects.create(**validated_data, author=author)
         recipe.tags.set(tags)
+        # поисковый вектор пересчитывается после фиксации транзакции
+        # по сигналу сохранения рецепта (recipes.search)
         ingredient_bulk_creation(recipe, ingredients)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.ingredients.clear()
-        instance.tags.clear()
+        if 'image' in validated_data:
+            validated_data['image'] = store_image(validated_data['image'])
+            validated_data['has_renditions'] = False
         ingredients = validated_data.pop('ingredients')
+        old_amounts = ingredient_bulk_update(instance, ingredients)
+        # set() сам сравнивает наборы и не трогает неизменившиеся теги
         instance.tags.set(validated_data.pop('tags'))
-        ingredient_bulk_creation(instance, ingredients)
-        return super().update(instance, validated_data)
+        new_amounts = {item['id']: item['amount'] for item in ingredients}
+        # удаленные строки уже вычтены из списков покупок
+        # обработчиком pre_delete (recipes.shopping_list)
+        ShoppingListItem.objects.change_recipe(
+            instance,
+            {ingredient: amount for ingredient, amount in old_amounts.items()
+             if ingredient in new_amounts},
+            new_amounts
+        )
+        # сохраняются только переданные поля: счетчики рецепта
+        # обновляются параллельно через F() и не должны перезаписываться
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.save(update_fields=list(validated_data))
+        # ингредиенты меняются массовыми запросами без сигналов,
+        # а при пустом update_fields рецепт не сохраняется вовсе
+        refresh_search_vectors([instance.pk])
+        invalidate_recipes([instance.pk])
+        return instance
 
     def to_representation(self, instance):
+        # ответ строится по рецепту, загруженному с флагами пользователя
+        # и связанными объектами, а не отдельным запросом на каждое поле
+        request = self.context.get('request')
+        instance = Recipe.objects.with_user_flags(
+            request.user
+        ).with_related().get(pk=instance.pk)
         return RecipeReadSerializer(
-            instance,
-            context={'request': self.context.get('request')}
+            instance, context={'request': request}
         ).data
 
 
@@ -137,86 +218,54 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
-    image = Base64ImageField()
+    image = serializers.ImageField(read_only=True)
+    image_renditions = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = ['id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart', 'name', 'image',
-                  'text', 'cooking_time']
+                  'image_renditions', 'text', 'cooking_time']
+
+    def to_representation(self, instance):
+        # флаг подписки на автора вычислен в queryset рецептов,
+        # передаем его в объект автора для CustomUserListSerializer
+        if hasattr(instance, 'is_author_subscribed'):
+            instance.author.is_subscribed = instance.is_author_subscribed
+        data = super().to_representation(instance)
+        # фрагмент с подсветкой есть только в результатах поиска ?search=
+        if hasattr(instance, 'search_headline'):
+            data['search_headline'] = instance.search_headline
+        return data
+
+    def get_image_renditions(self, obj):
+        return get_image_renditions(obj, self.context.get('request'))
 
     def get_is_favorited(self, obj):
+        # флаг уже вычислен в queryset (Recipe.objects.with_user_flags)
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user_id = self.context.get('request').user.id
         return Favorite.objects.filter(
             user=user_id, recipe=obj.id).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user_id = self.context.get('request').user.id
         return ShoppingCart.objects.filter(
             user=user_id, recipe=obj.id).exists()
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
-    user = serializers.IntegerField(source='user.id')
-    recipe = serializers.IntegerField(source='recipe.id')
-
-    class Meta:
-        model = Favorite
-        fields = ('user', 'recipe',)
-
-    def validate(self, data):
-        request = self.context.get('request')
-        user = data['user']['id']
-        recipe = data['recipe']['id']
-        follow = Favorite.objects.filter(user__id=user, recipe__id=recipe)
-        if request.method == 'POST':
-            if follow.exists():
-                raise serializers.ValidationError(
-                    {'errors': 'Нельзя добавить повторно рецепт в избранное.'}
-                )
-        if request.method == 'DELETE':
-            if not follow.exists():
-                raise serializers.ValidationError(
-                    {'errors': 'Нельзя удалить повторно рецепт из избранного.'}
-                )
-        return data
-
-    def create(self, validated_data):
-        user = validated_data['user']
-        recipe = validated_data['recipe']
-        Favorite.objects.get_or_create(user=user, recipe=recipe)
-        return validated_data
-
+class RecipeBatchSerializer(serializers.Serializer):
+    """Список id рецептов для пакетного добавления в избранное
+    и список покупок и удаления из них. Повторы id отбрасываются."""
 
-class ShoppingSerializer(FavoriteSerializer):
-    user = serializers.IntegerField(source='user.id')
-    recipe = serializers.IntegerField(source='recipe.id')
-
-    class Meta:
-        model = ShoppingCart
-        fields = ('user', 'recipe',)
-
-    def validate(self, data):
-        request = self.context.get('request')
-        user = data['user']['id']
-        recipe = data['recipe']['id']
-        want_to_buy = ShoppingCart.objects.filter(
-            user__id=user, recipe__id=recipe
-        )
-        if request.method == 'POST':
-            if want_to_buy.exists():
-                raise serializers.ValidationError(
-                    {'errors': 'Нельзя добавить повторно рецепт в список.'}
-                )
-        if request.method == 'DELETE':
-            if not want_to_buy.exists():
-                raise serializers.ValidationError(
-                    {'errors': 'Нельзя удалить повторно рецепт из списка.'}
-                )
-        return data
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RECIPE_BATCH_MAX_SIZE,
+    )
 
-    def create(self, validated_data):
-        user = validated_data['user']
-        recipe = validated_data['recipe']
-        ShoppingCart.objects.get_or_create(user=user, recipe=recipe)
-        return validated_data
+    def validate_recipes(self, recipes):
+        return list(dict.fromkeys(recipes))
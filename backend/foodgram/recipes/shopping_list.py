@@ -0,0 +1,192 @@
+import csv
+import io
+import json
+import os
+
+from django.conf import settings
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .models import IngredientAmountInRecipe, ShoppingListItem
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer: вместо записи возвращает строку,
+    чтобы CSV можно было отдавать построчно."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Базовый рендерер списка покупок.
+    Формат выбирается query-параметром ?format= (стандартный механизм DRF),
+    а сами строки списка отдаются потоково методом stream()."""
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # рендер через DRF используется только для ответов с ошибками
+        return JSONRenderer().render(data)
+
+    def get_filename(self):
+        return f'shopping_list.{self.format}'
+
+    def stream(self, rows):
+        raise NotImplementedError('Метод stream() должен быть определен.')
+
+
+class TxtShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, rows):
+        for item in rows:
+            yield (f'{item["name"]} '
+                   f'({item["measurement_unit"]}) '
+                   f'- {item["amount"]}\n').encode(self.charset)
+
+
+class CsvShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(
+            ['name', 'measurement_unit', 'amount']
+        ).encode(self.charset)
+        for item in rows:
+            yield writer.writerow([
+                item['name'],
+                item['measurement_unit'],
+                item['amount'],
+            ]).encode(self.charset)
+
+
+class JsonShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, rows):
+        separator = '['
+        for item in rows:
+            yield (separator + json.dumps(
+                item, ensure_ascii=False
+            )).encode(self.charset)
+            separator = ','
+        yield ('[]' if separator == '[' else ']').encode(self.charset)
+
+
+class PdfShoppingListRenderer(ShoppingListRenderer):
+    """PDF собирается целиком в памяти (формат не допускает потоковой
+    записи), но строки из базы читаются так же через курсор."""
+
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    font_name = 'ShoppingListFont'
+
+    def get_font(self):
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+
+        font_path = settings.SHOPPING_LIST_PDF_FONT
+        if not os.path.exists(font_path):
+            # встроенный шрифт не содержит кириллицы,
+            # но позволяет отдать файл без дополнительных зависимостей
+            return 'Helvetica'
+        if self.font_name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont(self.font_name, font_path))
+        return self.font_name
+
+    def stream(self, rows):
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen import canvas
+
+        buffer = io.BytesIO()
+        pdf = canvas.Canvas(buffer, pagesize=A4)
+        font = self.get_font()
+        width, height = A4
+        top, bottom, left, step = height - 50, 50, 50, 18
+        y = top
+        pdf.setFont(font, 16)
+        pdf.drawString(left, y, 'Список покупок')
+        y -= step * 2
+        pdf.setFont(font, 12)
+        for item in rows:
+            if y < bottom:
+                pdf.showPage()
+                pdf.setFont(font, 12)
+                y = top
+            pdf.drawString(left, y, (
+                f'{item["name"]} '
+                f'({item["measurement_unit"]}) '
+                f'- {item["amount"]}'
+            ))
+            y -= step
+        pdf.save()
+        yield buffer.getvalue()
+
+
+SHOPPING_LIST_RENDERERS = (
+    TxtShoppingListRenderer,
+    CsvShoppingListRenderer,
+    JsonShoppingListRenderer,
+    PdfShoppingListRenderer,
+)
+
+
+def ingredient_changed(sender, instance, **kwargs):
+    """Название и единица измерения ингредиента входят в выгрузку:
+    их изменение (и удаление ингредиента) меняет время изменения
+    списков покупок, где он есть."""
+
+    ShoppingListItem.objects.touch(ShoppingListItem.objects.filter(
+        ingredient=instance
+    ).values('user_id'))
+
+
+def recipe_ingredient_saving(sender, instance, raw, **kwargs):
+    """Запоминает прежнее состояние строки ингредиента рецепта перед
+    сохранением в обход API (админка): в post_save по нему считается
+    изменение списков покупок. API пишет строки массовыми запросами
+    без сигналов и обновляет списки само."""
+
+    previous = None
+    if not raw and instance.pk is not None:
+        previous = IngredientAmountInRecipe.objects.filter(
+            pk=instance.pk
+        ).values_list('recipe_id', 'ingredients_id', 'amount').first()
+    instance._shopping_list_previous = previous
+
+
+def recipe_ingredient_saved(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    previous = instance.__dict__.pop('_shopping_list_previous', None)
+    new_amounts = {instance.ingredients_id: instance.amount}
+    if previous is None:
+        ShoppingListItem.objects.change_recipe(
+            instance.recipe_id, {}, new_amounts
+        )
+        return
+    recipe, ingredient, amount = previous
+    if recipe == instance.recipe_id:
+        ShoppingListItem.objects.change_recipe(
+            recipe, {ingredient: amount}, new_amounts
+        )
+        return
+    ShoppingListItem.objects.change_recipe(recipe, {ingredient: amount}, {})
+    ShoppingListItem.objects.change_recipe(
+        instance.recipe_id, {}, new_amounts
+    )
+
+
+def recipe_ingredient_deleting(sender, instance, **kwargs):
+    """Удаление строки ингредиента, в том числе каскадом при удалении
+    рецепта или его автора. Обработчик подключен к pre_delete:
+    при каскадном удалении строки корзин рецепта еще не удалены."""
+
+    ShoppingListItem.objects.change_recipe(
+        instance.recipe_id, {instance.ingredients_id: instance.amount}, {}
+    )
@@ -0,0 +1,128 @@
+from itertools import chain, islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from .models import Favorite, FavoriteChange, SimilarRecipe
+
+
+def favorite_changed(sender, instance, **kwargs):
+    """Отметка рецепта при изменении избранного в обход API
+    (админка, удаление пользователя)."""
+
+    FavoriteChange.objects.mark([instance.recipe_id])
+
+
+def favorites_matrix():
+    """Разреженная матрица избранного пользователи x рецепты (CSC)
+    и id рецептов по столбцам матрицы."""
+
+    # numpy и scipy нужны только для расчета, веб-процесс их не загружает
+    import numpy as np
+    from scipy import sparse
+
+    pairs = np.fromiter(
+        chain.from_iterable(Favorite.objects.order_by().values_list(
+            'user_id', 'recipe_id'
+        ).iterator()),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    users, rows = np.unique(pairs[:, 0], return_inverse=True)
+    recipes, columns = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csc_matrix(
+        (np.ones(len(pairs), dtype=np.int32),
+         (rows.ravel(), columns.ravel())),
+        shape=(len(users), len(recipes)),
+    )
+    return matrix, recipes
+
+
+def top_similar(matrix, recipes, columns, count, min_users):
+    """Похожие рецепты для столбцов columns матрицы избранного:
+    строки (recipe_id, similar_id, score). Сходство - косинус между
+    столбцами: число общих пользователей, деленное на корень
+    из произведения чисел пользователей у обоих рецептов."""
+
+    import numpy as np
+
+    norms = np.sqrt(np.asarray(matrix.sum(axis=0)).ravel())
+    # число общих пользователей со всеми рецептами одним умножением
+    common = (matrix[:, columns].T @ matrix).tocsr()
+    for row, column in enumerate(columns):
+        start, end = common.indptr[row], common.indptr[row + 1]
+        others = common.indices[start:end]
+        shared = common.data[start:end]
+        keep = (others != column) & (shared >= min_users)
+        others = others[keep]
+        scores = shared[keep] / (norms[column] * norms[others])
+        if len(scores) > count:
+            top = np.argpartition(-scores, count - 1)[:count]
+            others, scores = others[top], scores[top]
+        for position in np.lexsort((recipes[others], -scores)):
+            yield (int(recipes[column]), int(recipes[others[position]]),
+                   float(scores[position]))
+
+
+def affected_recipes(matrix, recipes, changed):
+    """Рецепты, сходство которых с changed могло измениться:
+    сами changed, рецепты из избранного тех же пользователей
+    и рецепты, в списках похожих которых есть changed."""
+
+    import numpy as np
+
+    columns = np.flatnonzero(np.isin(recipes, list(changed)))
+    users = np.unique(matrix[:, columns].nonzero()[0])
+    neighbours = np.unique(matrix[users, :].nonzero()[1])
+    return set(changed) | set(recipes[neighbours].tolist()) | set(
+        SimilarRecipe.objects.filter(
+            similar_id__in=changed
+        ).values_list('recipe_id', flat=True)
+    )
+
+
+def update_similar_recipes(full=False, count=None, min_users=None,
+                           chunk_size=1000):
+    """Пересчет таблицы SimilarRecipe. По умолчанию пересчитываются
+    только рецепты, затронутые изменениями избранного из журнала
+    FavoriteChange; с full=True - все рецепты. Отметки, появившиеся
+    во время расчета, остаются в журнале до следующего запуска.
+    Возвращает число рецептов с пересчитанным списком."""
+
+    import numpy as np
+
+    if count is None:
+        count = settings.SIMILAR_RECIPES_COUNT
+    if min_users is None:
+        min_users = settings.SIMILAR_RECIPES_MIN_USERS
+    last_change = FavoriteChange.objects.aggregate(
+        last=Max('pk'))['last'] or 0
+    changed = set(FavoriteChange.objects.filter(
+        pk__lte=last_change
+    ).values_list('recipe_id', flat=True))
+    if not full and not changed:
+        return 0
+    matrix, recipes = favorites_matrix()
+    if full:
+        targets = set(recipes.tolist())
+    else:
+        targets = affected_recipes(matrix, recipes, changed)
+    columns = np.flatnonzero(np.isin(recipes, list(targets)))
+    with transaction.atomic():
+        if full:
+            SimilarRecipe.objects.all().delete()
+        else:
+            stale = iter(sorted(targets))
+            for batch in iter(lambda: list(islice(stale, chunk_size)), []):
+                SimilarRecipe.objects.filter(recipe_id__in=batch).delete()
+        for start in range(0, len(columns), chunk_size):
+            SimilarRecipe.objects.bulk_create(
+                SimilarRecipe(recipe_id=recipe, similar_id=similar,
+                              score=score)
+                for recipe, similar, score in top_similar(
+                    matrix, recipes, columns[start:start + chunk_size],
+                    count, min_users
+                )
+            )
+        FavoriteChange.objects.filter(pk__lte=last_change).delete()
+    return len(targets)
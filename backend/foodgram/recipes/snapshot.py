@@ -0,0 +1,63 @@
+import datetime
+from contextlib import contextmanager
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from recipes.models import (Favorite, Ingredient, IngredientAmountInRecipe,
+                            Recipe, ShoppingCart, Tag)
+from users.models import CustomUser, Subscribe
+
+# модели снимка базы в порядке зависимостей: при импорте каждая таблица
+# загружается после тех, на которые она ссылается
+SNAPSHOT_MODELS = (
+    ('users', CustomUser),
+    ('tags', Tag),
+    ('ingredients', Ingredient),
+    ('recipes', Recipe),
+    ('recipe_tags', Recipe.tags.through),
+    ('recipe_ingredients', IngredientAmountInRecipe),
+    ('favorites', Favorite),
+    ('shopping_cart', ShoppingCart),
+    ('subscriptions', Subscribe),
+)
+
+MEDIA_DIR = 'media'
+
+
+def snapshot_fields(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def snapshot_filename(name):
+    return f'{name}.jsonl'
+
+
+class SnapshotEncoder(DjangoJSONEncoder):
+    """JSON-кодировщик снимка: даты сохраняются с микросекундами
+    (DjangoJSONEncoder округляет их до миллисекунд)."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+@contextmanager
+def keep_auto_dates(model):
+    """Отключение auto_now/auto_now_add на время массовой загрузки, чтобы
+    даты (например, Recipe.pub_date) сохранились из снимка
+    или сгенерированных данных."""
+
+    fields = [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False)
+        or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
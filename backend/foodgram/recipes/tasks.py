@@ -0,0 +1,78 @@
+import io
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db.models import Q
+from jobs.files import save_job_file
+from jobs.queue import task
+from users.models import CustomUser
+
+from .images import generate_renditions
+from .models import FeedEntry, Recipe, ShoppingListItem
+from .search import update_search_vectors
+from .shopping_list import SHOPPING_LIST_RENDERERS
+
+SHOPPING_LISTS_DIR = 'shopping_lists'
+
+
+@task('recipes.generate_renditions')
+def generate_renditions_task(image_name):
+    generate_renditions(image_name)
+    return {'image': image_name}
+
+
+@task('recipes.render_shopping_list')
+def render_shopping_list_task(user_id, file_format):
+    """Выгрузка списка покупок в файл задачи. Файл не публикуется
+    в media: его отдает владельцу задачи /api/jobs/<id>/file/,
+    а через JOBS_FILES_TTL секунд он удаляется."""
+
+    renderer = next(
+        renderer() for renderer in SHOPPING_LIST_RENDERERS
+        if renderer.format == file_format
+    )
+    user = CustomUser.objects.get(pk=user_id)
+    rows = ShoppingListItem.objects.shopping_list(user).iterator()
+    content = b''.join(renderer.stream(rows))
+    name = save_job_file(
+        f'{SHOPPING_LISTS_DIR}/{user_id}/{renderer.get_filename()}',
+        ContentFile(content)
+    )
+    return {'file': name}
+
+
+@task('recipes.recount_counters')
+def recount_counters_task(user_ids=(), recipe_ids=()):
+    """Сверка счетчиков указанных рецептов и пользователей
+    и пересчет сводных списков покупок пользователей после правок
+    в обход API."""
+
+    if user_ids or recipe_ids:
+        call_command('recount_counters', users=list(user_ids),
+                     recipes=list(recipe_ids), stdout=io.StringIO())
+    if user_ids:
+        ShoppingListItem.objects.rebuild(
+            CustomUser.objects.filter(pk__in=user_ids)
+        )
+    return {'users': list(user_ids), 'recipes': list(recipe_ids)}
+
+
+@task('recipes.update_search_vectors')
+def update_search_vectors_task(ingredients=(), tags=()):
+    recipes = Recipe.objects.filter(
+        Q(ingredients__in=ingredients) | Q(tags__in=tags)
+    ).values_list('pk', flat=True).order_by().distinct()
+    return {'recipes': update_search_vectors(recipes.iterator())}
+
+
+@task('recipes.fan_out_recipe')
+def fan_out_recipe_task(recipe_id):
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None:
+        return {'entries': 0}
+    return {'entries': FeedEntry.objects.fan_out(recipe)}
+
+
+@task('recipes.build_feed_timeline')
+def build_feed_timeline_task(user_id):
+    return {'timelines': FeedEntry.objects.rebuild([user_id])}
@@ -1,58 +1,110 @@
+import calendar
+import hashlib
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
+from jobs.queue import enqueue
+from jobs.serializers import JobSerializer
 from rest_framework import filters, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import SAFE_METHODS
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import ReadOnlyModelViewSet
 from users.models import CustomUser
 from users.permissions import AdminOrReadOnly, AuthenticatedOrAuthorOrReadOnly
 from users.serializers import ShortRecipesSerializer
 
-from recipes.pagination import CustomPageNumberPagination
+from recipes.pagination import CustomPageNumberPagination, KeysetPagination
 
-from .filters import IngredientSearchFilter, RecipeFilter
-from .models import (Favorite, Ingredient, IngredientAmountInRecipe, Recipe,
-                     ShoppingCart, Tag)
-from .serializers import (IngredientSerializer, RecipeReadSerializer,
-                          RecipeWriteSerializer, TagSerializer,
-                          FavoriteSerializer, ShoppingSerializer)
+from .autocomplete import get_index
+from .feed import has_timeline, join_feed, timeline_feed
+from .cache import (CatalogueCacheMixin, RecipeCacheMixin,
+                    get_catalogue_version, invalidate_user_flags)
+from .filters import RecipeFilter, RecipeSearchFilter
+from .models import (Favorite, FavoriteChange, Ingredient, Recipe,
+                     ShoppingCart, ShoppingListItem, SimilarRecipe, Tag)
+from .serializers import (IngredientSerializer, RecipeBatchSerializer,
+                          RecipeReadSerializer, RecipeWriteSerializer,
+                          TagSerializer)
+from .shopping_list import SHOPPING_LIST_RENDERERS
 
 User = CustomUser
 
+# счетчик рецепта и ошибки повторного добавления и удаления
+# для списков пользователя
+USER_LISTS = {
+    Favorite: ('favorites_count',
+               'Нельзя добавить повторно рецепт в избранное.',
+               'Нельзя удалить повторно рецепт из избранного.'),
+    ShoppingCart: ('shopping_cart_count',
+                   'Нельзя добавить повторно рецепт в список.',
+                   'Нельзя удалить повторно рецепт из списка.'),
+}
+
 
-class IngredientsViewSet(ReadOnlyModelViewSet):
+class IngredientsViewSet(CatalogueCacheMixin, ReadOnlyModelViewSet):
     """ViewSet для модели Ingredient.
-    Изменения разрешены к внесению только администратору."""
+    Изменения разрешены к внесению только администратору.
+    Поиск по ?name= выполняется по индексу автодополнения в памяти
+    (сначала совпадения по началу названия, затем по подстроке),
+    количество результатов ограничивается параметром ?limit=.
+    Ответы кэшируются до изменения справочников (CatalogueCacheMixin)."""
 
     permission_classes = (AdminOrReadOnly,)
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    filter_backends = (IngredientSearchFilter,)
-    search_fields = ('^name',)
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name is None:
+            return super().list(request, *args, **kwargs)
+        max_limit = settings.INGREDIENT_AUTOCOMPLETE_LIMIT
+        try:
+            limit = min(int(request.query_params['limit']), max_limit)
+        except (KeyError, ValueError):
+            limit = max_limit
+        return Response(get_index().search(name, max(limit, 1)))
 
 
-class TagsViewSet(ReadOnlyModelViewSet):
+class TagsViewSet(CatalogueCacheMixin, ReadOnlyModelViewSet):
     """ViewSet для модели Tag.
-    Изменения разрешены к внесению только администратору."""
+    Изменения разрешены к внесению только администратору.
+    Ответы кэшируются до изменения справочников (CatalogueCacheMixin)."""
 
     permission_classes = (AdminOrReadOnly,)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(RecipeCacheMixin, viewsets.ModelViewSet):
     """ViewSet для модели Recipe.
-    Подключены кастомные фильтры для запросов по параметрам.
+    Подключены кастомные фильтры для запросов по параметрам
+    и полнотекстовый поиск по ?search= (RecipeSearchFilter).
     Созданы эндпоинты для добавления рецепта
-    в избранное (favorite) и список покупок (shopping_cart)."""
+    в избранное (favorite) и список покупок (shopping_cart)
+    и выдачи похожих рецептов (similar).
+    Выдача списка и рецепта кэшируется (RecipeCacheMixin)."""
 
     permission_classes = (AuthenticatedOrAuthorOrReadOnly,)
     queryset = Recipe.objects.all()
     pagination_class = CustomPageNumberPagination
-    filter_backends = (filters.SearchFilter, DjangoFilterBackend,)
+    filter_backends = (RecipeSearchFilter, DjangoFilterBackend,
+                       filters.OrderingFilter)
     filterset_class = RecipeFilter
+    # ?ordering=-favorites_count - самые популярные рецепты
+    ordering_fields = ('pub_date', 'favorites_count', 'shopping_cart_count')
+
+    def get_queryset(self):
+        queryset = Recipe.objects.with_user_flags(self.get_flags_user())
+        if self.request.method in SAFE_METHODS:
+            return queryset.with_related()
+        return queryset
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
@@ -61,61 +113,226 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['POST', 'DELETE'])
     def favorite(self, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
-        serializer = FavoriteSerializer(
-            data={'user': request.user.id, 'recipe': recipe.id},
-            context={'request': request}
-        )
-        if request.method == 'POST':
-            serializer.is_valid(raise_exception=True)
-            serializer.save(recipe=recipe, user=request.user)
-            serializer = ShortRecipesSerializer(recipe)
-            return Response(
-                serializer.data, status=status.HTTP_201_CREATED
-            )
-
-        if request.method == 'DELETE':
-            serializer.is_valid(raise_exception=True)
-            favorite = get_object_or_404(
-                Favorite, recipe=recipe, user=request.user
-            )
-            self.perform_destroy(favorite)
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.change_user_list(request, pk, Favorite)
 
     @action(detail=True, methods=['POST', 'DELETE'])
     def shopping_cart(self, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
-        serializer = ShoppingSerializer(
-            data={'user': request.user.id, 'recipe': recipe.id},
-            context={'request': request}
-        )
+        return self.change_user_list(request, pk, ShoppingCart)
+
+    def change_user_list(self, request, pk, model):
+        """Добавление рецепта в избранное или список покупок (POST)
+        и удаление из него (DELETE) одним запросом INSERT или DELETE.
+        Счетчик рецепта, сводный список покупок и кэш флагов
+        пользователя меняются, только если строка действительно
+        добавлена или удалена, поэтому повторные и одновременные
+        запросы не нарушают их согласованность."""
+
+        user = request.user
+        _, add_error, remove_error = USER_LISTS[model]
         if request.method == 'POST':
-            serializer.is_valid(raise_exception=True)
-            serializer.save(recipe=recipe, user=request.user)
-            serializer = ShortRecipesSerializer(recipe)
-            return Response(
-                serializer.data, status=status.HTTP_201_CREATED
+            recipe = get_object_or_404(Recipe, id=pk)
+            with transaction.atomic():
+                added = model.objects.add(user=user, recipe=recipe)
+                if added:
+                    self.user_list_changed(user, model, [recipe.pk], 1)
+            if not added:
+                return Response({'errors': add_error},
+                                status=status.HTTP_400_BAD_REQUEST)
+            serializer = ShortRecipesSerializer(
+                recipe, context={'request': request}
             )
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+        with transaction.atomic():
+            removed = model.objects.remove(user=user, recipe_id=pk)
+            if removed:
+                self.user_list_changed(user, model, [pk], -1)
+        if not removed:
+            # отсутствующий рецепт - 404, рецепт не в списке - 400
+            get_object_or_404(Recipe, id=pk)
+            return Response({'errors': remove_error},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=['POST', 'DELETE'],
+            url_path='favorite', url_name='favorite-batch',
+            permission_classes=(IsAuthenticated,))
+    def favorite_batch(self, request):
+        return self.change_user_list_batch(request, Favorite)
+
+    @action(detail=False, methods=['POST', 'DELETE'],
+            url_path='shopping_cart', url_name='shopping-cart-batch',
+            permission_classes=(IsAuthenticated,))
+    def shopping_cart_batch(self, request):
+        return self.change_user_list_batch(request, ShoppingCart)
+
+    def change_user_list_batch(self, request, model):
+        """Пакетное добавление (POST) и удаление (DELETE) рецептов
+        {"recipes": [id, ...]} в избранном или списке покупок.
+        Рецепты проверяются одним запросом, связи добавляются или
+        удаляются одним INSERT или DELETE. В ответе для каждого id -
+        added или exists (POST), removed или absent (DELETE)
+        либо not_found для несуществующего рецепта."""
 
-        if request.method == 'DELETE':
-            serializer.is_valid(raise_exception=True)
-            favorite = get_object_or_404(
-                ShoppingCart, recipe=recipe, user=request.user
+        serializer = RecipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['recipes']
+        user = request.user
+        found = sorted(Recipe.objects.filter(pk__in=ids).values_list(
+            'pk', flat=True))
+        with transaction.atomic():
+            if request.method == 'POST':
+                changed = model.objects.add_many(user, 'recipe', found)
+                self.user_list_changed(user, model, changed, 1)
+                statuses = ('added', 'exists')
+            else:
+                changed = model.objects.remove_many(user, 'recipe', found)
+                self.user_list_changed(user, model, changed, -1)
+                statuses = ('removed', 'absent')
+        found = set(found)
+        results = []
+        for pk in ids:
+            if pk not in found:
+                result = 'not_found'
+            else:
+                result = statuses[pk not in changed]
+            results.append({'id': pk, 'status': result})
+        return Response({'results': results})
+
+    def user_list_changed(self, user, model, recipes, delta):
+        """Обновление счетчиков рецептов, сводного списка покупок
+        и кэша флагов пользователя после добавления (delta=1)
+        или удаления (delta=-1) рецептов recipes из списка model."""
+
+        if not recipes:
+            return
+        counter = USER_LISTS[model][0]
+        Recipe.objects.filter(pk__in=recipes).update(
+            **{counter: F(counter) + delta}
+        )
+        if model is ShoppingCart:
+            if delta > 0:
+                ShoppingListItem.objects.add_recipes(user, recipes)
+            else:
+                ShoppingListItem.objects.remove_recipes(user, recipes)
+        else:
+            FavoriteChange.objects.mark(recipes)
+        invalidate_user_flags(user.id)
+
+    @action(detail=False, methods=['DELETE'],
+            url_path='shopping_cart/clear',
+            permission_classes=(IsAuthenticated,))
+    def clear_shopping_cart(self, request):
+        """Очистка списка покупок одним DELETE; сводный список
+        ингредиентов пользователя удаляется целиком."""
+
+        user = request.user
+        with transaction.atomic():
+            removed = ShoppingCart.objects.remove_many(user, 'recipe')
+            if removed:
+                Recipe.objects.filter(pk__in=removed).update(
+                    shopping_cart_count=F('shopping_cart_count') - 1
+                )
+                ShoppingListItem.objects.clear(user)
+                invalidate_user_flags(user.id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=['GET'],
+            permission_classes=(IsAuthenticated,),
+            pagination_class=KeysetPagination)
+    def feed(self, request):
+        """Лента подписок: рецепты авторов, на которых подписан
+        пользователь, от новых к старым, с выдачей по курсору.
+        Для подписчиков большого числа авторов лента хранится заранее
+        посчитанной (FeedEntry), для остальных строится запросом
+        к рецептам авторов из подписок."""
+
+        user = request.user
+        if not has_timeline(user):
+            page = self.paginate_queryset(
+                join_feed(user).with_user_flags(user).with_related()
             )
-            self.perform_destroy(favorite)
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        else:
+            entries = self.paginate_queryset(timeline_feed(user))
+            recipes = Recipe.objects.with_user_flags(
+                user
+            ).with_related().in_bulk([entry.recipe_id for entry in entries])
+            # рецепт мог быть удален после чтения ленты
+            page = [recipes[entry.recipe_id] for entry in entries
+                    if entry.recipe_id in recipes]
+        serializer = RecipeReadSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['GET'])
+    def similar(self, request, pk):
+        """Похожие рецепты: добавившие этот рецепт в избранное
+        также добавили их. Список по убыванию сходства читается
+        из заранее посчитанной таблицы SimilarRecipe."""
 
-    @action(detail=False, methods=['GET'])
+        ids = SimilarRecipe.objects.for_recipe(pk)
+        if not ids:
+            get_object_or_404(Recipe, id=pk)
+        recipes = Recipe.objects.with_user_flags(
+            request.user
+        ).with_related().in_bulk(ids)
+        serializer = RecipeReadSerializer(
+            [recipes[recipe] for recipe in ids if recipe in recipes],
+            many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['GET'],
+            permission_classes=(IsAuthenticated,),
+            renderer_classes=SHOPPING_LIST_RENDERERS)
     def download_shopping_cart(self, request):
         """Эндпоинт для скачивания списка ингрединетов
-        для рецептов из списка покупок. Формат файла - .txt."""
+        для рецептов из списка покупок. Формат файла выбирается
+        параметром ?format= (txt, csv, json, pdf), по умолчанию - .txt.
+        Неизменившийся список отдается ответом 304 по ETag
+        или Last-Modified (время изменения списка с точностью
+        до секунды, точную проверку дает ETag).
+        С параметром ?async=1 файл готовится фоновой задачей, а в ответе
+        возвращается id задачи для запроса статуса и ссылки на файл."""
 
         user = request.user
-        content = IngredientAmountInRecipe.download_shopping_cart(user)
+        renderer = request.accepted_renderer
+        if request.query_params.get('async') in ('1', 'true'):
+            job, _ = enqueue(
+                'recipes.render_shopping_list',
+                {'user_id': user.id, 'file_format': renderer.format},
+                user=user
+            )
+            return Response(
+                JobSerializer(job).data, status=status.HTTP_202_ACCEPTED
+            )
+        # названия ингредиентов входят в выгрузку, поэтому в ETag
+        # входит и версия справочников
+        etag = quote_etag(hashlib.md5('{0}:{1}:{2}'.format(
+            renderer.format, get_catalogue_version(),
+            ShoppingListItem.objects.fingerprint(user)
+        ).encode()).hexdigest())
+        modified = user.shopping_list_modified
+        last_modified = modified and calendar.timegm(modified.utctimetuple())
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if not_modified is not None:
+            return not_modified
 
-        filename = 'shopping_list.txt'
-        response = HttpResponse(content, content_type='text/plain')
+        rows = ShoppingListItem.objects.shopping_list(user).iterator()
+        response = StreamingHttpResponse(
+            renderer.stream(rows), content_type=(
+                f'{renderer.media_type}; charset={renderer.charset}'
+                if renderer.charset else renderer.media_type
+            )
+        )
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'private, no-cache'
         response['Content-Disposition'] = (
-            'attachment; filename={0}'.format(filename)
+            'attachment; filename={0}'.format(renderer.get_filename())
         )
         return response
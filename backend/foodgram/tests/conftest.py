@@ -0,0 +1,87 @@
+import base64
+import io
+
+import pytest
+from django.core.cache import caches
+from PIL import Image
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, IngredientAmountInRecipe, Recipe, Tag
+from users.models import CustomUser
+
+
+@pytest.fixture(autouse=True)
+def clear_cache(settings):
+    caches[settings.CATALOGUE_CACHE_ALIAS].clear()
+
+
+@pytest.fixture
+def make_user(db):
+    def make_user(username):
+        return CustomUser.objects.create_user(
+            username=username, email=f'{username}@example.com',
+            first_name='Имя', last_name='Фамилия', password='password',
+        )
+    return make_user
+
+
+@pytest.fixture
+def user(make_user):
+    return make_user('user')
+
+
+@pytest.fixture
+def user_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def catalogue(db):
+    tags = [
+        Tag.objects.create(name=f'Тег {number}', color=f'#00000{number}',
+                           slug=f'tag{number}')
+        for number in range(3)
+    ]
+    ingredients = [
+        Ingredient.objects.create(name=f'Ингредиент {number}',
+                                  measurement_unit='г')
+        for number in range(5)
+    ]
+    return tags, ingredients
+
+
+@pytest.fixture
+def make_recipes(catalogue):
+    tags, ingredients = catalogue
+
+    def make_recipes(author, count):
+        recipes = []
+        for number in range(count):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {number}', text='Описание',
+                image='recipes/test.jpg', author=author, cooking_time=10,
+            )
+            recipe.tags.set(tags[:number % len(tags) + 1])
+            IngredientAmountInRecipe.objects.bulk_create(
+                IngredientAmountInRecipe(recipe=recipe, ingredients=item,
+                                         amount=10)
+                for item in ingredients[:number % len(ingredients) + 1]
+            )
+            recipes.append(recipe)
+        return recipes
+    return make_recipes
+
+
+@pytest.fixture
+def image_data(settings, tmp_path):
+    """Изображение рецепта для API в виде data URL; файлы
+    сохраняются во временный MEDIA_ROOT."""
+
+    settings.MEDIA_ROOT = str(tmp_path)
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), (255, 0, 0)).save(buffer, 'PNG')
+    return 'data:image/png;base64,{0}'.format(
+        base64.b64encode(buffer.getvalue()).decode()
+    )
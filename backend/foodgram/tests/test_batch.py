@@ -0,0 +1,107 @@
+import io
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe, ShoppingCart, ShoppingListItem
+
+FAVORITE_URL = '/api/recipes/favorite/'
+SHOPPING_CART_URL = '/api/recipes/shopping_cart/'
+
+
+@pytest.fixture
+def recipes(make_user, make_recipes):
+    return make_recipes(make_user('author'), 6)
+
+
+def counters(field):
+    return dict(Recipe.objects.values_list('pk', field))
+
+
+def statuses(response):
+    return [(item['id'], item['status'])
+            for item in response.json()['results']]
+
+
+def test_favorite_batch_add_and_remove(user_client, recipes):
+    first, second = recipes[0].pk, recipes[1].pk
+    missing = max(recipe.pk for recipe in recipes) + 1
+
+    response = user_client.post(
+        FAVORITE_URL, {'recipes': [first, second, missing, first]},
+        format='json'
+    )
+    assert response.status_code == 200
+    # повторы id отбрасываются
+    assert statuses(response) == [
+        (first, 'added'), (second, 'added'), (missing, 'not_found')
+    ]
+    response = user_client.post(FAVORITE_URL, {'recipes': [first]},
+                                format='json')
+    assert statuses(response) == [(first, 'exists')]
+    assert counters('favorites_count')[first] == 1
+
+    response = user_client.delete(
+        FAVORITE_URL, {'recipes': [first, recipes[2].pk]}, format='json'
+    )
+    assert statuses(response) == [
+        (first, 'removed'), (recipes[2].pk, 'absent')
+    ]
+    favorites = counters('favorites_count')
+    assert (favorites[first], favorites[second]) == (0, 1)
+    call_command('recount_counters', stdout=io.StringIO())
+    assert counters('favorites_count') == favorites
+
+
+def test_shopping_cart_batch_and_clear(user, user_client, recipes):
+    ids = [recipe.pk for recipe in recipes[:4]]
+    response = user_client.post(SHOPPING_CART_URL, {'recipes': ids},
+                                format='json')
+    assert [status for _, status in statuses(response)] == ['added'] * 4
+    user_client.delete(SHOPPING_CART_URL, {'recipes': ids[:1]},
+                       format='json')
+    # сводный список совпадает с пересчитанным из корзины
+    call_command('check_shopping_lists', stdout=io.StringIO())
+    assert ShoppingListItem.objects.filter(user=user).exists()
+    assert sorted(pk for pk, count in counters(
+        'shopping_cart_count').items() if count) == ids[1:]
+
+    response = user_client.delete(f'{SHOPPING_CART_URL}clear/')
+    assert response.status_code == 204
+    assert not ShoppingCart.objects.filter(user=user).exists()
+    assert not ShoppingListItem.objects.filter(user=user).exists()
+    assert not any(counters('shopping_cart_count').values())
+    # пересчет заново не меняет поддерживаемые счетчики
+    maintained = counters('shopping_cart_count')
+    call_command('recount_counters', stdout=io.StringIO())
+    assert counters('shopping_cart_count') == maintained
+
+
+@pytest.mark.parametrize('recipes_ids', [[], [0], 'не список',
+                                         list(range(1, 102))])
+def test_batch_validation(user_client, recipes_ids):
+    response = user_client.post(SHOPPING_CART_URL,
+                                {'recipes': recipes_ids}, format='json')
+    assert response.status_code == 400
+    assert 'recipes' in response.json()
+
+
+def test_batch_requires_authentication(recipes):
+    response = APIClient().post(
+        FAVORITE_URL, {'recipes': [recipes[0].pk]}, format='json'
+    )
+    assert response.status_code == 401
+
+
+@pytest.mark.parametrize('url', [FAVORITE_URL, SHOPPING_CART_URL])
+def test_batch_queries_do_not_depend_on_batch_size(
+        user_client, recipes, url, django_assert_num_queries):
+    ids = [recipe.pk for recipe in recipes]
+    for method in (user_client.post, user_client.delete):
+        with CaptureQueriesContext(connection) as queries:
+            method(url, {'recipes': ids[:2]}, format='json')
+        with django_assert_num_queries(len(queries)):
+            method(url, {'recipes': ids[2:]}, format='json')
@@ -0,0 +1,74 @@
+from contextlib import contextmanager
+from unittest import mock
+
+import pytest
+from django.core.cache.backends.locmem import LocMemCache
+
+from recipes.cache import (RECIPE_LIST_VERSION_KEY, bump_catalogue_version,
+                           bump_versions, recipe_version_key)
+from recipes.models import Ingredient, Recipe, Tag
+
+
+@contextmanager
+def other_process():
+    """Код внутри блока работает со своим кэшем в памяти,
+    как воркер очереди задач или команда управления."""
+
+    cache = LocMemCache('other-process', {})
+    with mock.patch('recipes.cache.get_cache', return_value=cache):
+        yield
+
+
+@pytest.fixture
+def recipes(make_user, make_recipes):
+    return make_recipes(make_user('author'), 2)
+
+
+def test_recipe_cache_invalidated_from_other_process(client, recipes):
+    recipe = recipes[0]
+    assert client.get('/api/recipes/').json()['results'][1]['name'] == (
+        recipe.name
+    )
+    assert client.get(f'/api/recipes/{recipe.pk}/').json()['name'] == (
+        recipe.name
+    )
+
+    # например, generate_renditions -> invalidate_recipes в воркере
+    Recipe.objects.filter(pk=recipe.pk).update(name='Новое название')
+    with other_process():
+        bump_versions(RECIPE_LIST_VERSION_KEY, recipe_version_key(recipe.pk))
+
+    assert client.get('/api/recipes/').json()['results'][1]['name'] == (
+        'Новое название'
+    )
+    assert client.get(f'/api/recipes/{recipe.pk}/').json()['name'] == (
+        'Новое название'
+    )
+
+
+def test_catalogue_cache_invalidated_from_other_process(client, catalogue):
+    response = client.get('/api/tags/')
+    etag = response['ETag']
+    assert len(response.json()) == 3
+    names = [item['name'] for item in client.get(
+        '/api/ingredients/?name=ингр').json()]
+    assert 'Ингредиент новый' not in names
+
+    # например, load_ingredients_data или import_foodgram: массовая
+    # загрузка без сигналов и смена версии справочников
+    Tag.objects.bulk_create([
+        Tag(name='Новый тег', color='#FFFFFF', slug='new')
+    ])
+    Ingredient.objects.bulk_create([
+        Ingredient(name='Ингредиент новый', measurement_unit='г')
+    ])
+    with other_process():
+        bump_catalogue_version()
+
+    response = client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert 'Новый тег' in [item['name'] for item in response.json()]
+    # индекс автодополнения в памяти перестраивается по новой версии
+    names = [item['name'] for item in client.get(
+        '/api/ingredients/?name=ингр').json()]
+    assert 'Ингредиент новый' in names
@@ -0,0 +1,110 @@
+import io
+
+import pytest
+from django.core.management import call_command
+from django.test import Client
+from rest_framework.test import APIClient
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import CustomUser, Subscribe
+
+
+@pytest.fixture
+def author(make_user):
+    return make_user('author')
+
+
+@pytest.fixture
+def recipes(author, make_recipes):
+    return make_recipes(author, 3)
+
+
+def read_counters():
+    return (
+        list(Recipe.objects.order_by('pk').values_list(
+            'pk', 'favorites_count', 'shopping_cart_count')),
+        list(CustomUser.objects.order_by('pk').values_list(
+            'pk', 'recipes_count', 'followers_count')),
+    )
+
+
+def assert_counters_consistent():
+    # поддерживаемые счетчики совпадают с пересчитанными заново
+    maintained = read_counters()
+    call_command('recount_counters', stdout=io.StringIO())
+    assert read_counters() == maintained
+
+
+def test_recipe_create_and_delete_outside_api(author, recipes):
+    author.refresh_from_db()
+    assert author.recipes_count == 3
+    recipes[0].delete()
+    Recipe.objects.filter(pk=recipes[1].pk).delete()
+    author.refresh_from_db()
+    assert author.recipes_count == 1
+    assert_counters_consistent()
+
+
+def test_recipe_author_change(author, make_user, recipes):
+    other = make_user('other')
+    recipe = recipes[0]
+    recipe.author = other
+    recipe.save()
+    author.refresh_from_db()
+    other.refresh_from_db()
+    assert (author.recipes_count, other.recipes_count) == (2, 1)
+    assert_counters_consistent()
+
+
+def test_user_links_outside_api(user, author, recipes):
+    Favorite.objects.create(user=user, recipe=recipes[0])
+    ShoppingCart.objects.create(user=user, recipe=recipes[0])
+    Subscribe.objects.create(user=user, author=author)
+    recipes[0].refresh_from_db()
+    author.refresh_from_db()
+    assert recipes[0].favorites_count == 1
+    assert recipes[0].shopping_cart_count == 1
+    assert author.followers_count == 1
+
+    # каскадное удаление связей вместе с пользователем
+    user.delete()
+    recipes[0].refresh_from_db()
+    author.refresh_from_db()
+    assert recipes[0].favorites_count == 0
+    assert recipes[0].shopping_cart_count == 0
+    assert author.followers_count == 0
+    assert_counters_consistent()
+
+
+def test_admin_recipe_delete(author, make_user, recipes):
+    admin = CustomUser.objects.create_superuser(
+        username='admin', email='admin@example.com', password='password',
+        first_name='Имя', last_name='Фамилия',
+    )
+    client = Client()
+    client.force_login(admin)
+    response = client.post(
+        f'/admin/recipes/recipe/{recipes[0].pk}/delete/', {'post': 'yes'}
+    )
+    assert response.status_code == 302
+    author.refresh_from_db()
+    assert author.recipes_count == 2
+    assert_counters_consistent()
+
+
+def test_api_recipe_create_and_delete(author, recipes, catalogue,
+                                      image_data):
+    tags, ingredients = catalogue
+    api_client = APIClient()
+    api_client.force_authenticate(author)
+    response = api_client.post('/api/recipes/', {
+        'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 5,
+        'image': image_data, 'tags': [tags[0].pk],
+        'ingredients': [{'id': ingredients[0].pk, 'amount': 10}],
+    }, format='json')
+    assert response.status_code == 201
+    response = api_client.delete(f'/api/recipes/{recipes[0].pk}/')
+    assert response.status_code == 204
+    author.refresh_from_db()
+    assert author.recipes_count == 3
+    assert_counters_consistent()
@@ -0,0 +1,39 @@
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+from recipes.images import RecipeImageField
+from recipes.serializers import RecipeWriteSerializer
+
+
+def data_url(content, media_type='image/png'):
+    return f'data:{media_type};base64,{base64.b64encode(content).decode()}'
+
+
+def png():
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), (255, 0, 0)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('data', [
+    'data:image/png;base64,не base64',
+    'data:image/png,без кодировки',
+    data_url(b'not an image'),
+    data_url(png()[:40]),
+    'plain string',
+])
+def test_invalid_image_is_validation_error(settings, tmp_path, data):
+    settings.MEDIA_ROOT = str(tmp_path)
+    serializer = RecipeWriteSerializer(data={'image': data})
+    assert not serializer.is_valid()
+    assert 'image' in serializer.errors
+
+
+def test_image_is_reencoded_to_jpeg(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    processed = RecipeImageField().to_internal_value(data_url(png()))
+    assert processed.name.endswith('.jpg')
+    assert Image.open(io.BytesIO(processed.content)).format == 'JPEG'
@@ -0,0 +1,87 @@
+import json
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from jobs.files import get_files_storage
+from jobs.models import Job
+from jobs.queue import claim_job, enqueue, run_job
+from recipes.models import Favorite, Recipe, ShoppingCart, ShoppingListItem
+from recipes.tasks import recount_counters_task
+
+
+def run_jobs():
+    job = claim_job()
+    while job is not None:
+        assert run_job(job).status == Job.DONE, job.error
+        job = claim_job()
+
+
+@pytest.fixture
+def files_root(settings, tmp_path):
+    settings.JOBS_FILES_ROOT = str(tmp_path / 'job_files')
+    settings.MEDIA_ROOT = str(tmp_path / 'media')
+    return tmp_path
+
+
+@pytest.fixture
+def cart(user, make_user, make_recipes):
+    recipes = make_recipes(make_user('author'), 2)
+    for recipe in recipes:
+        ShoppingCart.objects.add(user=user, recipe=recipe)
+    ShoppingListItem.objects.rebuild([user.pk])
+    return recipes
+
+
+def test_shopping_list_file_is_private(files_root, user, user_client,
+                                       make_user, cart):
+    response = user_client.get(
+        '/api/recipes/download_shopping_cart/?format=txt&async=1'
+    )
+    assert response.status_code == 202
+    job_id = response.data['id']
+    run_jobs()
+
+    response = user_client.get(f'/api/jobs/{job_id}/')
+    file_url = response.json()['file']
+    assert file_url == f'/api/jobs/{job_id}/file/'
+    response = user_client.get(file_url)
+    assert response.status_code == 200
+    assert 'Ингредиент 0' in b''.join(response.streaming_content).decode()
+    # файл не попадает в публичный каталог media
+    assert not (files_root / 'media').exists()
+
+    other_client = APIClient()
+    other_client.force_authenticate(make_user('other'))
+    assert other_client.get(file_url).status_code == 404
+    assert APIClient().get(file_url).status_code == 401
+
+
+def test_shopping_list_file_expires(files_root, user, cart):
+    job, _ = enqueue('recipes.render_shopping_list',
+                     {'user_id': user.id, 'file_format': 'csv'}, user=user)
+    run_jobs()
+    job.refresh_from_db()
+    name = json.loads(job.result)['file']
+    assert get_files_storage().exists(name)
+
+    # удаление файла ждет JOBS_FILES_TTL
+    Job.objects.filter(name='jobs.delete_file').update(
+        run_after=timezone.now() - timedelta(seconds=1)
+    )
+    run_jobs()
+    assert not get_files_storage().exists(name)
+    client = APIClient()
+    client.force_authenticate(user)
+    assert client.get(f'/api/jobs/{job.id}/file/').status_code == 404
+
+
+def test_recount_task_touches_only_given_rows(user, cart):
+    Favorite.objects.add(user=user, recipe=cart[0])
+    Favorite.objects.add(user=user, recipe=cart[1])
+    recount_counters_task(recipe_ids=[cart[0].pk])
+    assert dict(Recipe.objects.values_list('pk', 'favorites_count')) == {
+        cart[0].pk: 1, cart[1].pk: 0
+    }
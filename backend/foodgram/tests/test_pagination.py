@@ -0,0 +1,81 @@
+import base64
+import json
+
+import pytest
+
+from recipes.models import Recipe
+from users.models import Subscribe
+
+
+@pytest.fixture
+def recipes(make_user, make_recipes):
+    return make_recipes(make_user('author'), 5)
+
+
+def follow_cursor(client, url):
+    """Все страницы выдачи по курсору, начиная с url."""
+
+    pages = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        data = response.json()
+        assert data['previous'] is None
+        pages.append([item['id'] for item in data['results']])
+        url = data['next']
+    return pages
+
+
+def test_recipes_cursor_pages(client, recipes):
+    pages = follow_cursor(client, '/api/recipes/?cursor=&limit=2')
+    expected = list(Recipe.objects.order_by(
+        '-pub_date', '-id').values_list('pk', flat=True))
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert sum(pages, []) == expected
+
+    data = client.get('/api/recipes/?cursor=&limit=2').json()
+    # без ?count=estimated число записей не считается
+    assert 'count' not in data
+
+
+def test_recipes_cursor_estimated_count(client, recipes):
+    data = client.get('/api/recipes/?cursor=&count=estimated').json()
+    # на SQLite оценка - обычный count()
+    assert data['count'] == len(recipes)
+
+
+def test_recipes_cursor_empty_page(client, make_user, recipes):
+    author = make_user('empty')
+    data = client.get(
+        f'/api/recipes/?cursor=&author={author.pk}'
+    ).json()
+    assert data['results'] == []
+    assert data['next'] is None
+
+
+@pytest.mark.parametrize('cursor', [
+    'не курсор',
+    base64.urlsafe_b64encode(b'[1]').decode(),
+    base64.urlsafe_b64encode(json.dumps(['дата', 1]).encode()).decode(),
+])
+def test_recipes_invalid_cursor(client, recipes, cursor):
+    response = client.get('/api/recipes/', {'cursor': cursor})
+    assert response.status_code == 404
+    assert response.json() == {'detail': 'Неверный курсор.'}
+
+
+def test_page_number_mode_is_default(client, recipes):
+    data = client.get('/api/recipes/?limit=2&page=3').json()
+    assert data['count'] == len(recipes)
+    assert len(data['results']) == 1
+
+
+def test_subscriptions_cursor_pages(user, user_client, make_user):
+    authors = [make_user(f'author{number}') for number in range(3)]
+    for author in authors:
+        Subscribe.objects.create(user=user, author=author)
+    pages = follow_cursor(
+        user_client, '/api/users/subscriptions/?cursor=&limit=2'
+    )
+    assert [len(page) for page in pages] == [2, 1]
+    assert sum(pages, []) == [author.pk for author in reversed(authors)]
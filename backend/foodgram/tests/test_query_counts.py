@@ -0,0 +1,68 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Favorite, IngredientAmountInRecipe, ShoppingCart
+from users.models import Subscribe
+
+
+@pytest.fixture
+def recipes(user, make_user, make_recipes):
+    author = make_user('author')
+    recipes = make_recipes(author, 12)
+    Subscribe.objects.create(user=user, author=author)
+    for recipe in recipes[::2]:
+        Favorite.objects.create(user=user, recipe=recipe)
+    for recipe in recipes[::3]:
+        ShoppingCart.objects.create(user=user, recipe=recipe)
+    return recipes
+
+
+@pytest.mark.parametrize('authenticated', [True, False])
+def test_recipe_list_queries_do_not_depend_on_page_size(
+        settings, client, user_client, recipes, authenticated,
+        django_assert_num_queries):
+    settings.RECIPE_CACHE_TIMEOUT = 0
+    api_client = user_client if authenticated else client
+    with CaptureQueriesContext(connection) as queries:
+        response = api_client.get('/api/recipes/?limit=2')
+    assert len(response.json()['results']) == 2
+
+    with django_assert_num_queries(len(queries)):
+        response = api_client.get('/api/recipes/?limit=10')
+    results = response.json()['results']
+    assert len(results) == 10
+    if authenticated:
+        assert any(recipe['is_favorited'] for recipe in results)
+        assert any(recipe['is_in_shopping_cart'] for recipe in results)
+        assert all(recipe['author']['is_subscribed'] for recipe in results)
+
+
+def test_recipe_update_queries_do_not_depend_on_ingredient_count(
+        make_user, make_recipes, django_assert_num_queries):
+    author = make_user('author')
+    # у рецептов 2 и 5 ингредиентов
+    small, large = make_recipes(author, 5)[1::3]
+    client = APIClient()
+    client.force_authenticate(author)
+
+    def update(recipe):
+        amounts = IngredientAmountInRecipe.objects.filter(
+            recipe=recipe).values('ingredients_id', 'amount')
+        response = client.patch(f'/api/recipes/{recipe.pk}/', {
+            'name': recipe.name, 'text': recipe.text, 'cooking_time': 5,
+            'tags': list(recipe.tags.values_list('pk', flat=True)),
+            'ingredients': [
+                # меняется количество каждого ингредиента
+                {'id': item['ingredients_id'], 'amount': item['amount'] + 1}
+                for item in amounts
+            ],
+        }, format='json')
+        assert response.status_code == 200
+
+    with CaptureQueriesContext(connection) as queries:
+        update(small)
+    # запросы самого теста: чтение ингредиентов и тегов рецепта
+    with django_assert_num_queries(len(queries)):
+        update(large)
@@ -0,0 +1,17 @@
+import io
+
+import pytest
+from django.core.management import call_command
+
+
+@pytest.fixture
+def fake_data(settings, tmp_path, db):
+    settings.MEDIA_ROOT = str(tmp_path)
+    call_command('generate_fake_data', users=300, recipes=2000,
+                 stdout=io.StringIO())
+
+
+def test_hot_endpoints_do_not_scan_large_tables(fake_data):
+    # CommandError со списком запросов, если таблица от 1000 строк
+    # читается последовательным просмотром
+    call_command('check_query_plans', min_rows=1000, stdout=io.StringIO())
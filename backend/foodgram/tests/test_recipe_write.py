@@ -0,0 +1,155 @@
+import pytest
+from django.db import connection
+from django.db.models.signals import m2m_changed
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, IngredientAmountInRecipe, Recipe
+from recipes.serializers import RecipeWriteSerializer
+
+
+@pytest.fixture
+def author(make_user):
+    return make_user('author')
+
+
+@pytest.fixture
+def author_client(author):
+    client = APIClient()
+    client.force_authenticate(author)
+    return client
+
+
+@pytest.fixture
+def recipe(author, make_recipes):
+    # третий рецепт: три тега и три ингредиента по 10
+    return make_recipes(author, 3)[2]
+
+
+def payload(recipe, amounts, **fields):
+    return {
+        'name': recipe.name, 'text': recipe.text, 'cooking_time': 10,
+        'tags': list(recipe.tags.values_list('pk', flat=True)),
+        'ingredients': [
+            {'id': ingredient, 'amount': amount}
+            for ingredient, amount in amounts.items()
+        ],
+        **fields,
+    }
+
+
+def rows(recipe):
+    return {
+        row.ingredients_id: (row.pk, row.amount)
+        for row in IngredientAmountInRecipe.objects.filter(recipe=recipe)
+    }
+
+
+def test_update_applies_ingredient_diff(author_client, recipe, catalogue):
+    _, ingredients = catalogue
+    before = rows(recipe)
+    first, second, third = sorted(before)
+    new = ingredients[4].pk
+    response = author_client.patch(
+        f'/api/recipes/{recipe.pk}/',
+        payload(recipe, {first: 10, second: 25, new: 5}), format='json'
+    )
+    assert response.status_code == 200
+    after = rows(recipe)
+    # неизменившаяся и измененная строки сохраняют id
+    assert after[first] == before[first]
+    assert after[second] == (before[second][0], 25)
+    assert third not in after
+    assert after[new][1] == 5
+
+
+def test_update_without_changes_keeps_rows_and_tags(author_client, recipe):
+    before = rows(recipe)
+    tag_events = []
+
+    def receiver(sender, action, **kwargs):
+        tag_events.append(action)
+
+    m2m_changed.connect(receiver, sender=Recipe.tags.through)
+    try:
+        response = author_client.patch(
+            f'/api/recipes/{recipe.pk}/',
+            payload(recipe, {
+                ingredient: amount
+                for ingredient, (_, amount) in before.items()
+            }, name='Новое название'), format='json'
+        )
+    finally:
+        m2m_changed.disconnect(receiver, sender=Recipe.tags.through)
+    assert response.status_code == 200
+    assert response.json()['name'] == 'Новое название'
+    assert rows(recipe) == before
+    assert tag_events == []
+
+
+@pytest.fixture
+def recipe_data(catalogue, image_data):
+    tags, _ = catalogue
+
+    def recipe_data(ingredients):
+        return {
+            'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 10,
+            'image': image_data, 'tags': [tags[0].pk],
+            'ingredients': [
+                {'id': ingredient, 'amount': 10} for ingredient in ingredients
+            ],
+        }
+    return recipe_data
+
+
+def test_unknown_and_duplicate_ingredients_are_field_errors(
+        author_client, recipe_data, catalogue):
+    _, ingredients = catalogue
+    first, second = ingredients[0].pk, ingredients[1].pk
+    missing = max(item.pk for item in ingredients) + 1
+    response = author_client.post(
+        '/api/recipes/', recipe_data([first, missing, second, first]),
+        format='json'
+    )
+    # отсутствующий ингредиент - ошибка поля, а не 404
+    assert response.status_code == 400
+    assert response.json()['ingredients'] == [
+        {},
+        {'id': ['Ингредиент не найден.']},
+        {},
+        {'id': ['Ингредиент должен быть уникальным!']},
+    ]
+    assert not Recipe.objects.filter(name='Рецепт').exists()
+
+
+@pytest.mark.parametrize('count', [0, 4])
+def test_ingredient_count_limits(settings, author_client, recipe_data,
+                                 catalogue, count):
+    settings.RECIPE_MAX_INGREDIENTS = 3
+    _, ingredients = catalogue
+    response = author_client.post(
+        '/api/recipes/',
+        recipe_data([item.pk for item in ingredients[:count]]),
+        format='json'
+    )
+    assert response.status_code == 400
+    assert len(response.json()['ingredients']) == 1
+
+
+def test_ingredient_validation_uses_one_query(recipe_data, catalogue,
+                                              django_assert_num_queries):
+    _, ingredients = catalogue
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+        for number in range(len(ingredients), 120)
+    )
+    many = list(Ingredient.objects.values_list('pk', flat=True))
+
+    def validate(ingredient_ids):
+        serializer = RecipeWriteSerializer(data=recipe_data(ingredient_ids))
+        assert serializer.is_valid(), serializer.errors
+
+    with CaptureQueriesContext(connection) as queries:
+        validate([ingredients[0].pk])
+    with django_assert_num_queries(len(queries)):
+        validate(many)
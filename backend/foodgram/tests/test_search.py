@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from recipes.models import IngredientAmountInRecipe, Recipe
+
+
+@pytest.fixture
+def vector_updates():
+    # поисковый вектор есть только на PostgreSQL: на SQLite проверяется,
+    # для каких рецептов запрошен пересчет
+    postgresql = SimpleNamespace(vendor='postgresql')
+    with mock.patch('recipes.search.connection', postgresql):
+        with mock.patch('recipes.search.update_search_vectors') as update:
+            yield update
+
+
+def updated_recipes(update):
+    recipes = set()
+    for call in update.call_args_list:
+        recipes.update(call.args[0])
+    update.reset_mock()
+    return recipes
+
+
+@pytest.mark.django_db(transaction=True)
+def test_recipe_changes_outside_api_refresh_vectors(
+        make_user, catalogue, vector_updates):
+    tags, ingredients = catalogue
+    recipe = Recipe.objects.create(
+        name='Рецепт', text='Описание', image='recipes/test.jpg',
+        author=make_user('author'), cooking_time=10,
+    )
+    assert updated_recipes(vector_updates) == {recipe.pk}
+
+    recipe.tags.add(tags[0])
+    tags[1].recipes.add(recipe)
+    assert updated_recipes(vector_updates) == {recipe.pk}
+    tags[1].recipes.clear()
+    assert updated_recipes(vector_updates) == {recipe.pk}
+
+    row = IngredientAmountInRecipe.objects.create(
+        recipe=recipe, ingredients=ingredients[0], amount=10
+    )
+    row.delete()
+    assert updated_recipes(vector_updates) == {recipe.pk}
+
+    recipe.name = 'Новое название'
+    recipe.save()
+    assert updated_recipes(vector_updates) == {recipe.pk}
+
+    # сохранение без названия и описания вектор не меняет
+    recipe.has_renditions = True
+    recipe.save(update_fields=['has_renditions'])
+    assert not vector_updates.called
@@ -0,0 +1,172 @@
+import io
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import (Ingredient, IngredientAmountInRecipe,
+                            ShoppingCart, ShoppingListItem)
+from users.models import CustomUser
+
+DOWNLOAD_URL = '/api/recipes/download_shopping_cart/'
+
+
+@pytest.fixture
+def token_client(user):
+    # пользователь загружается заново на каждый запрос, как в работе
+    client = APIClient()
+    client.credentials(
+        HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}'
+    )
+    return client
+
+
+@pytest.fixture
+def recipes(make_user, make_recipes):
+    return make_recipes(make_user('author'), 3)
+
+
+def later():
+    return mock.patch('django.utils.timezone.now',
+                      return_value=timezone.now() + timedelta(hours=1))
+
+
+def test_download_not_modified_since_last_change(token_client, recipes):
+    token_client.post(f'/api/recipes/{recipes[0].id}/shopping_cart/')
+    response = token_client.get(DOWNLOAD_URL)
+    assert response.status_code == 200
+    last_modified = response['Last-Modified']
+
+    response = token_client.get(DOWNLOAD_URL,
+                                HTTP_IF_MODIFIED_SINCE=last_modified)
+    assert response.status_code == 304
+
+    with later():
+        token_client.post(f'/api/recipes/{recipes[1].id}/shopping_cart/')
+    response = token_client.get(DOWNLOAD_URL,
+                                HTTP_IF_MODIFIED_SINCE=last_modified)
+    assert response.status_code == 200
+    assert response['Last-Modified'] != last_modified
+
+
+def test_ingredient_rename_changes_last_modified(token_client, recipes):
+    token_client.post(f'/api/recipes/{recipes[0].id}/shopping_cart/')
+    last_modified = token_client.get(DOWNLOAD_URL)['Last-Modified']
+
+    ingredient = Ingredient.objects.get(recipe__recipe=recipes[0])
+    ingredient.name = 'Новое название'
+    with later():
+        ingredient.save()
+    response = token_client.get(DOWNLOAD_URL,
+                                HTTP_IF_MODIFIED_SINCE=last_modified)
+    assert response.status_code == 200
+    assert 'Новое название' in b''.join(response.streaming_content).decode()
+
+
+def test_etag_changes_when_amounts_keep_aggregates(user, token_client,
+                                                   recipes):
+    token_client.post(f'/api/recipes/{recipes[2].id}/shopping_cart/')
+    rows = ShoppingListItem.objects.filter(user=user).order_by(
+        'ingredient_id')
+    assert [item.total_amount for item in rows] == [10, 10, 10]
+    etag = token_client.get(DOWNLOAD_URL)['ETag']
+
+    # число строк, их id, сумма количеств и сумма количество * id
+    # ингредиента не меняются
+    i, j, k = rows.values_list('ingredient_id', flat=True)
+    ShoppingListItem.objects.apply_deltas(
+        [user.pk], {i: k - j, j: -(k - i), k: j - i}
+    )
+    response = token_client.get(DOWNLOAD_URL, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+
+
+def check_shopping_lists():
+    # команда завершается CommandError при расхождении списков
+    call_command('check_shopping_lists', stdout=io.StringIO())
+
+
+@pytest.fixture
+def cart(user, make_user, recipes):
+    other = make_user('other')
+    for recipe in recipes[:2]:
+        ShoppingCart.objects.add(user=user, recipe=recipe)
+        ShoppingCart.objects.add(user=other, recipe=recipe)
+    ShoppingListItem.objects.rebuild()
+    return recipes
+
+
+def test_recipe_delete_outside_api_updates_list(user, token_client, cart):
+    ingredients = set(cart[1].ingredients.values_list('name', flat=True))
+    cart[1].delete()
+    check_shopping_lists()
+
+    content = b''.join(
+        token_client.get(DOWNLOAD_URL).streaming_content
+    ).decode()
+    for name in ingredients - set(
+            cart[0].ingredients.values_list('name', flat=True)):
+        assert name not in content
+
+
+def test_author_delete_updates_list(cart):
+    CustomUser.objects.get(username='author').delete()
+    check_shopping_lists()
+    assert not ShoppingListItem.objects.exists()
+
+
+def test_recipe_ingredients_change_outside_api_updates_list(cart):
+    recipe = cart[1]
+    row = recipe.ingredient.first()
+    row.amount += 5
+    row.save()
+    check_shopping_lists()
+
+    row.recipe = cart[0]
+    row.save()
+    check_shopping_lists()
+
+    IngredientAmountInRecipe.objects.create(
+        recipe=recipe, ingredients=Ingredient.objects.exclude(
+            recipe__recipe=recipe).first(), amount=7
+    )
+    check_shopping_lists()
+
+    recipe.ingredient.all().delete()
+    check_shopping_lists()
+
+
+def test_recipe_update_through_api_keeps_list(token_client, cart):
+    recipe = cart[1]
+    author_client = APIClient()
+    author_client.force_authenticate(recipe.author)
+    rows = list(recipe.ingredient.values('ingredients_id', 'amount'))
+    response = author_client.patch(
+        f'/api/recipes/{recipe.id}/',
+        {'ingredients': [{'id': rows[0]['ingredients_id'], 'amount': 3}],
+         'tags': list(recipe.tags.values_list('id', flat=True)),
+         'name': recipe.name, 'text': recipe.text, 'cooking_time': 5},
+        format='json'
+    )
+    assert response.status_code == 200
+    check_shopping_lists()
+
+
+def test_apply_deltas_adds_to_existing_and_new_rows(user, catalogue):
+    _, ingredients = catalogue
+    first, second, third = (item.pk for item in ingredients[:3])
+    # строку уже вставил другой запрос
+    ShoppingListItem.objects.create(user=user, ingredient_id=first,
+                                    total_amount=5)
+    ShoppingListItem.objects.create(user=user, ingredient_id=third,
+                                    total_amount=2)
+    ShoppingListItem.objects.apply_deltas(
+        [user.pk], {first: 3, second: 4, third: -2}
+    )
+    assert dict(ShoppingListItem.objects.filter(user=user).values_list(
+        'ingredient_id', 'total_amount')) == {first: 8, second: 4}
@@ -0,0 +1,79 @@
+import io
+import shutil
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+
+from recipes.images import RENDITION_FORMATS, rendition_name
+from jobs.models import Job
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import CustomUser
+
+
+def clear_database():
+    # импорт выполняется в чистую базу
+    CustomUser.objects.all().delete()
+    Tag.objects.all().delete()
+    Ingredient.objects.all().delete()
+
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path / 'media')
+    return settings.MEDIA_ROOT
+
+
+@pytest.fixture
+def recipe(settings, media_root, make_user, make_recipes):
+    recipe = make_recipes(make_user('author'), 1)[0]
+    default_storage.save(recipe.image.name, ContentFile(b'image'))
+    for rendition in settings.RECIPE_IMAGE_RENDITIONS:
+        for extension, _ in RENDITION_FORMATS:
+            default_storage.save(
+                rendition_name(recipe.image.name, rendition, extension),
+                ContentFile(b'rendition')
+            )
+    Recipe.objects.filter(pk=recipe.pk).update(has_renditions=True)
+    return recipe
+
+
+def test_export_copies_renditions(settings, tmp_path, recipe):
+    snapshot = tmp_path / 'snapshot'
+    call_command('export_foodgram', str(snapshot), stdout=io.StringIO())
+
+    assert (snapshot / 'media' / recipe.image.name).exists()
+    for rendition in settings.RECIPE_IMAGE_RENDITIONS:
+        for extension, _ in RENDITION_FORMATS:
+            assert (snapshot / 'media' / rendition_name(
+                recipe.image.name, rendition, extension)).exists()
+
+
+def test_import_resets_missing_renditions(settings, tmp_path, recipe):
+    snapshot = tmp_path / 'snapshot'
+    call_command('export_foodgram', str(snapshot), stdout=io.StringIO())
+    # снимок без превью (например, сделанный до их генерации)
+    shutil.rmtree(snapshot / 'media' / 'recipes' / 'renditions')
+    clear_database()
+    settings.MEDIA_ROOT = str(tmp_path / 'imported')
+
+    call_command('import_foodgram', str(snapshot), stdout=io.StringIO())
+
+    imported = Recipe.objects.get(pk=recipe.pk)
+    assert not imported.has_renditions
+    assert Job.objects.filter(
+        idempotency_key=f'renditions:{recipe.image.name}'
+    ).exists()
+
+
+def test_import_keeps_existing_renditions(settings, tmp_path, recipe):
+    snapshot = tmp_path / 'snapshot'
+    call_command('export_foodgram', str(snapshot), stdout=io.StringIO())
+    clear_database()
+    settings.MEDIA_ROOT = str(tmp_path / 'imported')
+
+    call_command('import_foodgram', str(snapshot), stdout=io.StringIO())
+
+    assert Recipe.objects.get(pk=recipe.pk).has_renditions
+    assert not Job.objects.exists()
@@ -0,0 +1,89 @@
+import random
+import threading
+
+from django.db import connection
+from django.test import TransactionTestCase
+from rest_framework.test import APIClient
+
+from recipes.models import (Favorite, Ingredient, IngredientAmountInRecipe,
+                            Recipe, ShoppingCart, ShoppingListItem)
+from users.models import CustomUser, Subscribe
+
+THREADS_PER_USER = 2
+REQUESTS_PER_THREAD = 30
+
+
+class ConcurrentTogglesTest(TransactionTestCase):
+    """Одновременные добавления и удаления избранного, списка покупок
+    и подписок (в том числе повторные от одного пользователя) не должны
+    нарушать согласованность связей, счетчиков и сводных списков."""
+
+    def setUp(self):
+        self.author = self.make_user('author')
+        self.users = [self.make_user(f'user{number}') for number in range(3)]
+        self.recipe = Recipe.objects.create(
+            name='Рецепт', text='Описание', image='recipes/test.jpg',
+            author=self.author, cooking_time=10,
+        )
+        IngredientAmountInRecipe.objects.create(
+            recipe=self.recipe, amount=10,
+            ingredients=Ingredient.objects.create(
+                name='Ингредиент', measurement_unit='г'
+            ),
+        )
+
+    def make_user(self, username):
+        return CustomUser.objects.create_user(
+            username=username, email=f'{username}@example.com',
+            first_name='Имя', last_name='Фамилия', password='password',
+        )
+
+    def toggle(self, user, seed, barrier, statuses):
+        client = APIClient()
+        client.force_authenticate(user)
+        rng = random.Random(seed)
+        urls = (f'/api/recipes/{self.recipe.id}/favorite/',
+                f'/api/recipes/{self.recipe.id}/shopping_cart/',
+                f'/api/users/{self.author.id}/subscribe/')
+        try:
+            barrier.wait()
+            for _ in range(REQUESTS_PER_THREAD):
+                method = rng.choice((client.post, client.delete))
+                statuses.append(method(rng.choice(urls)).status_code)
+        finally:
+            connection.close()
+
+    def test_counters_match_links(self):
+        workers = [(user, seed) for user in self.users
+                   for seed in range(THREADS_PER_USER)]
+        barrier = threading.Barrier(len(workers))
+        statuses = []
+        threads = [
+            threading.Thread(target=self.toggle,
+                             args=(user, seed, barrier, statuses))
+            for user, seed in workers
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(statuses), len(workers) * REQUESTS_PER_THREAD)
+        self.assertLessEqual(set(statuses), {201, 204, 400})
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count,
+                         Favorite.objects.filter(recipe=self.recipe).count())
+        self.assertEqual(
+            self.recipe.shopping_cart_count,
+            ShoppingCart.objects.filter(recipe=self.recipe).count()
+        )
+        self.assertEqual(self.author.followers_count,
+                         Subscribe.objects.filter(author=self.author).count())
+        stored = set(ShoppingListItem.objects.values_list(
+            'user_id', 'ingredient_id', 'total_amount'))
+        expected = {
+            (row['user_id'], row['ingredient_id'], row['total_amount'])
+            for row in ShoppingListItem.objects.calculate()
+        }
+        self.assertEqual(stored, expected)
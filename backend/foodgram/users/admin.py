@@ -5,8 +5,11 @@ from .models import CustomUser, Subscribe
 
 class CustomUserAdmin(admin.ModelAdmin):
     """Настрока панели администратора для модели CustomUser."""
-    list_display = ('pk', 'email', 'username', 'first_name', 'last_name')
+    list_display = ('pk', 'email', 'username', 'first_name', 'last_name',
+                    'recipes_count', 'followers_count')
     search_fields = ('email', 'username')
+    readonly_fields = ('recipes_count', 'followers_count',
+                       'shopping_list_modified')
     list_filter = ('email', 'username')
 
 
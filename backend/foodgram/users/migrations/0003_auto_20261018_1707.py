@@ -0,0 +1,27 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_subscribe'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='subscribe',
+            options={'ordering': ['-id']},
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество рецептов'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:20
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_subscriptions(apps, schema_editor):
+    # до этой миграции уникальность подписки в базе не проверялась:
+    # оставляем самую раннюю запись и пересчитываем число подписчиков
+    Subscribe = apps.get_model('users', 'Subscribe')
+    CustomUser = apps.get_model('users', 'CustomUser')
+    duplicates = Subscribe.objects.values('user', 'author').annotate(
+        first=Min('id'), total=Count('id')
+    ).filter(total__gt=1).order_by()
+    for row in duplicates:
+        Subscribe.objects.filter(
+            user=row['user'], author=row['author']
+        ).exclude(id=row['first']).delete()
+        CustomUser.objects.filter(id=row['author']).update(
+            followers_count=Subscribe.objects.filter(
+                author=row['author']).count()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_auto_20261018_1707'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_subscriptions,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='subscribe',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_subscribing'),
+        ),
+    ]
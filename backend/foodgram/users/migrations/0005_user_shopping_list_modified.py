@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_auto_20261018_1720'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='shopping_list_modified',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Время изменения списка покупок'),
+        ),
+    ]
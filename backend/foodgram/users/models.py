@@ -1,7 +1,8 @@
+from django.apps import apps
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
-from django.db import models
-from django.db.models import UniqueConstraint
+from django.db import connections, models, transaction
+from django.db.models import OuterRef, Prefetch, Subquery, UniqueConstraint
 
 
 class CustomUser(AbstractUser):
@@ -32,6 +33,20 @@ class CustomUser(AbstractUser):
     password = models.CharField(
         max_length=150,
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0
+    )
+    # заголовок Last-Modified выгрузки списка покупок
+    shopping_list_modified = models.DateTimeField(
+        verbose_name='Время изменения списка покупок',
+        null=True,
+        blank=True
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = [
@@ -47,6 +62,157 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return self.username
 
+    def change_counter(self, field, delta):
+        """Атомарное изменение счетчика пользователя F-выражением."""
+
+        CustomUser.objects.filter(pk=self.pk).update(
+            **{field: models.F(field) + delta}
+        )
+
+
+def can_return_rows(connection):
+    """Поддерживает ли СУБД RETURNING в INSERT и DELETE
+    (PostgreSQL и SQLite начиная с 3.35)."""
+
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 35)
+    return connection.vendor == 'postgresql'
+
+
+class UserLinkQuerySet(models.QuerySet):
+    """QuerySet для связей пользователя с объектом, уникальных по паре
+    полей (подписки, избранное, список покупок). Добавление и удаление
+    выполняются одним запросом без предварительной проверки, результат
+    (изменилась ли строка) определяется по числу затронутых строк,
+    поэтому повторные и одновременные запросы не создают дублей."""
+
+    def add(self, **fields):
+        """INSERT ... ON CONFLICT DO NOTHING; True, если строка добавлена."""
+
+        opts = self.model._meta
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        columns = [opts.get_field(name).column for name in fields]
+        values = [getattr(value, 'pk', value) for value in fields.values()]
+        sql = '{0} {1} ({2}) VALUES ({3}) {4}'.format(
+            connection.ops.insert_statement(ignore_conflicts=True),
+            quote_name(opts.db_table),
+            ', '.join(map(quote_name, columns)),
+            ', '.join(['%s'] * len(values)),
+            connection.ops.ignore_conflicts_suffix_sql(ignore_conflicts=True),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, values)
+            return cursor.rowcount == 1
+
+    def remove(self, **fields):
+        """Один DELETE без сигналов; True, если строка удалена."""
+
+        opts = self.model._meta
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        model_fields = [opts.get_field(name) for name in fields]
+        sql = 'DELETE FROM {0} WHERE {1}'.format(
+            quote_name(opts.db_table),
+            ' AND '.join(
+                '{0} = %s'.format(quote_name(field.column))
+                for field in model_fields
+            ),
+        )
+        # значения из URL (строки) приводятся к типу столбца
+        values = [
+            field.get_prep_value(getattr(value, 'pk', value))
+            for field, value in zip(model_fields, fields.values())
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, values)
+            return cursor.rowcount > 0
+
+    def add_many(self, user, field, values):
+        """Добавление связей пользователя с объектами values (значения
+        поля field) одним INSERT ... ON CONFLICT DO NOTHING RETURNING.
+        Возвращает множество действительно добавленных значений.
+        Без поддержки RETURNING строки добавляются по одной."""
+
+        if not values:
+            return set()
+        connection = connections[self.db]
+        if not can_return_rows(connection):
+            return {
+                value for value in values
+                if self.add(user=user, **{field: value})
+            }
+        opts = self.model._meta
+        quote_name = connection.ops.quote_name
+        column = quote_name(opts.get_field(field).column)
+        sql = '{0} {1} ({2}, {3}) VALUES {4} {5} RETURNING {3}'.format(
+            connection.ops.insert_statement(ignore_conflicts=True),
+            quote_name(opts.db_table),
+            quote_name(opts.get_field('user').column),
+            column,
+            ', '.join(['(%s, %s)'] * len(values)),
+            connection.ops.ignore_conflicts_suffix_sql(ignore_conflicts=True),
+        )
+        params = [item for value in values for item in (user.pk, value)]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return {row[0] for row in cursor.fetchall()}
+
+    def remove_many(self, user, field, values=None):
+        """Удаление связей пользователя с объектами values (или всех)
+        одним DELETE ... RETURNING. Возвращает множество удаленных
+        значений поля field."""
+
+        if values is not None and not values:
+            return set()
+        connection = connections[self.db]
+        opts = self.model._meta
+        quote_name = connection.ops.quote_name
+        column = quote_name(opts.get_field(field).column)
+        sql = 'DELETE FROM {0} WHERE {1} = %s'.format(
+            quote_name(opts.db_table),
+            quote_name(opts.get_field('user').column),
+        )
+        params = [user.pk]
+        if values is not None:
+            sql += ' AND {0} IN ({1})'.format(
+                column, ', '.join(['%s'] * len(values))
+            )
+            params.extend(values)
+        with connection.cursor() as cursor:
+            if can_return_rows(connection):
+                cursor.execute(f'{sql} RETURNING {column}', params)
+                return {row[0] for row in cursor.fetchall()}
+            # без RETURNING удаляемые строки сначала блокируются и читаются
+            links = self.filter(user=user)
+            if values is not None:
+                links = links.filter(**{f'{field}__in': values})
+            with transaction.atomic(using=self.db):
+                removed = set(links.select_for_update().values_list(
+                    field, flat=True))
+                cursor.execute(sql, params)
+            return removed
+
+
+class SubscribeQuerySet(UserLinkQuerySet):
+    """QuerySet для модели Subscribe с загрузкой превью рецептов
+    одним запросом на страницу подписок."""
+
+    def with_author_recipes(self, recipes_limit=None):
+        recipe_model = apps.get_model('recipes', 'Recipe')
+        recipes = recipe_model.objects.order_by('-pub_date', '-id')
+        if recipes_limit:
+            # ограничение числа рецептов на каждого автора выполняется
+            # в базе данных коррелированным подзапросом с LIMIT
+            recipes = recipes.filter(pk__in=Subquery(
+                recipe_model.objects.filter(
+                    author=OuterRef('author')
+                ).order_by('-pub_date', '-id').values('pk')[:recipes_limit]
+            ))
+        return self.select_related('author').prefetch_related(Prefetch(
+            'author__recipes', queryset=recipes, to_attr='recipes_preview'
+        ))
+
 
 class Subscribe(models.Model):
     """Модель Subscribe хранит записи о подписке
@@ -63,12 +229,16 @@ class Subscribe(models.Model):
         related_name='subscribing_to'
     )
 
+    objects = SubscribeQuerySet.as_manager()
+
     class Meta:
         ordering = ['-id']
-        UniqueConstraint(
-            fields=['user', 'author'],
-            name='unique_subscribing'
-        )
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'author'],
+                name='unique_subscribing'
+            )
+        ]
 
     def __str__(self):
         return (f' User - {self.user.username}. '
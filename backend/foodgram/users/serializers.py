@@ -1,7 +1,7 @@
 # from django.shortcuts import get_object_or_404
 # from rest_framework.validators import UniqueTogetherValidator
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from drf_base64.fields import Base64ImageField
+from recipes.images import rendition_urls
 from recipes.models import Recipe
 from rest_framework import serializers
 
@@ -31,6 +31,8 @@ class CustomUserListSerializer(UserSerializer):
             'is_subscribed')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -39,15 +41,48 @@ class CustomUserListSerializer(UserSerializer):
         # return user.follower.filter(author=obj.id).exists()
 
 
+def get_recipes_limit(request):
+    """Значение query-параметра recipes_limit для списка подписок.
+    Некорректное или неположительное значение игнорируется."""
+
+    try:
+        recipes_limit = int(request.query_params.get('recipes_limit'))
+    except (TypeError, ValueError):
+        return None
+    return recipes_limit if recipes_limit > 0 else None
+
+
+def get_image_renditions(recipe, request):
+    """Ссылки на превью изображения рецепта по размерам и форматам
+    или None, пока превью не сгенерированы."""
+
+    if not recipe.image or not recipe.has_renditions:
+        return None
+    urls = rendition_urls(recipe.image.name)
+    if request is not None:
+        urls = {
+            rendition: {
+                extension: request.build_absolute_uri(url)
+                for extension, url in formats.items()
+            }
+            for rendition, formats in urls.items()
+        }
+    return urls
+
+
 class ShortRecipesSerializer(serializers.ModelSerializer):
     """Сериализатор для модели Recipe с краткой информацией о рецептах.
     Применяется для сериализатора подписок пользователей."""
 
-    image = Base64ImageField(max_length=None, use_url=True)
+    image = serializers.ImageField(read_only=True)
+    image_renditions = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_renditions', 'cooking_time')
+
+    def get_image_renditions(self, obj):
+        return get_image_renditions(obj, self.context.get('request'))
 
 
 class SubscribeSerializer(serializers.ModelSerializer):
@@ -62,9 +97,7 @@ class SubscribeSerializer(serializers.ModelSerializer):
     first_name = serializers.ReadOnlyField(source='author.first_name')
     last_name = serializers.ReadOnlyField(source='author.last_name')
     is_subscribed = serializers.SerializerMethodField()
-    recipes = ShortRecipesSerializer(source='author.recipes',
-                                     read_only=True,
-                                     many=True)
+    recipes = serializers.SerializerMethodField()
     recipes_count = serializers.SerializerMethodField()
 
     class Meta:
@@ -75,77 +108,24 @@ class SubscribeSerializer(serializers.ModelSerializer):
         ]
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return Subscribe.objects.filter(
-            user=user, author=obj.author.id
-        ).exists()
+        # obj - сама запись о подписке, поэтому флаг всегда истинный
+        return True
+
+    def get_recipes(self, obj):
+        # превью рецептов загружено в Subscribe.objects.with_author_recipes
+        # уже с учетом recipes_limit
+        if hasattr(obj.author, 'recipes_preview'):
+            recipes = obj.author.recipes_preview
+        else:
+            recipes = obj.author.recipes.all()
+            recipes_limit = get_recipes_limit(self.context.get('request'))
+            if recipes_limit:
+                recipes = recipes[:recipes_limit]
+        return ShortRecipesSerializer(
+            recipes, many=True, context=self.context
+        ).data
 
     def get_recipes_count(self, obj):
         # в obj получаем объект модели Subscribe, поскольку
         # во ViewSet сохраняем Subscibe-подписки через этот сериализатор
-        person = obj.author.id
-        return Recipe.objects.filter(author=person).count()
-
-    def to_representation(self, obj):
-        request = self.context.get('request')
-        recipes_limit = request.query_params.get('recipes_limit')
-        if not recipes_limit:
-            return super().to_representation(obj)
-
-        response = super().to_representation(obj)
-        response['recipes'] = response['recipes'][:int(recipes_limit)]
-        return response
-
-
-class SubscribeWriteDeleteSerializer(serializers.ModelSerializer):
-    queryset = CustomUser.objects.all()
-    user = serializers.SlugRelatedField(
-        read_only=True,
-        slug_field='username',
-        default=serializers.CurrentUserDefault()
-    )
-    author = serializers.SlugRelatedField(
-        required=True,
-        slug_field='username',
-        queryset=CustomUser.objects.all()
-    )
-
-    class Meta:
-        model = Subscribe
-        fields = ('user', 'author')
-
-    def validate(self, data):
-        request = self.context.get('request')
-        author = data['author']
-
-        if request.method == 'POST':
-            if request.user == author:
-                raise serializers.ValidationError(
-                    {'errors': 'Нельзя подписаться на себя'}
-                )
-            if Subscribe.objects.filter(
-                user=request.user, author=author
-            ).exists():
-                raise serializers.ValidationError(
-                    {'errors': 'Подписка на этого автора уже есть'}
-                )
-        if request.method == 'DELETE':
-            if request.user == author:
-                raise serializers.ValidationError(
-                    {'errors': 'Нельзя отписаться от себя'}
-                )
-            if not Subscribe.objects.filter(
-                user=request.user, author=author
-            ).exists():
-                raise serializers.ValidationError(
-                    {'errors': 'подписка на этого автора отсутствует'}
-                )
-        return data
-
-    def create(self, validated_data):
-        user = validated_data['user']
-        author = validated_data['author']
-        Subscribe.objects.get_or_create(user=user, author=author)
-        return validated_data
+        return obj.author.recipes_count
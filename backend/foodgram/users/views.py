@@ -1,5 +1,8 @@
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
+from recipes.cache import invalidate_user_flags
+from recipes.feed import follow, unfollow
 from recipes.pagination import CustomPageNumberPagination
 from rest_framework import status
 from rest_framework.decorators import action
@@ -8,10 +11,18 @@ from rest_framework.response import Response
 from users.models import CustomUser, Subscribe
 from users.serializers import (CustomUserCreateSerializer,
                                CustomUserListSerializer, SubscribeSerializer,
-                               SubscribeWriteDeleteSerializer)
+                               get_recipes_limit)
 
 User = CustomUser
 
+# ошибки подписки на себя и повторной подписки или отписки
+SUBSCRIBE_ERRORS = {
+    'POST': ('Нельзя подписаться на себя',
+             'Подписка на этого автора уже есть'),
+    'DELETE': ('Нельзя отписаться от себя',
+               'подписка на этого автора отсутствует'),
+}
+
 
 class CustomUserViewSet(UserViewSet):
     """Переопределение встроенного представления пользователя.
@@ -30,36 +41,50 @@ class CustomUserViewSet(UserViewSet):
 
     @action(methods=['POST', 'DELETE'], detail=True)
     def subscribe(self, request, id=None):
+        """Подписка на автора (POST) и отписка (DELETE) одним запросом
+        INSERT или DELETE; счетчик подписчиков и кэш флагов меняются,
+        только если подписка действительно добавлена или удалена."""
+
         user = request.user
         author = get_object_or_404(User, id=id)
-        serializer = SubscribeWriteDeleteSerializer(
-            data={'user': request.user, 'author': author},
-            context={'request': request}
-        )
-
-        if self.request.method == 'POST':
-            serializer.is_valid(raise_exception=True)
-            new_subscription = Subscribe.objects.create(
-                user=user, author=author
+        if user == author:
+            return Response(
+                {'errors': SUBSCRIBE_ERRORS[request.method][0]},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            serializer = SubscribeSerializer(
-                new_subscription, context={'request': request}
-            )
-            return Response(serializer.data,
-                            status=status.HTTP_201_CREATED)
 
-        if self.request.method == 'DELETE':
-            serializer.is_valid(raise_exception=True)
-            subscription = Subscribe.objects.filter(
-                user=user, author=author
+        with transaction.atomic():
+            if request.method == 'POST':
+                changed = Subscribe.objects.add(user=user, author=author)
+                delta, update_feed = 1, follow
+            else:
+                changed = Subscribe.objects.remove(user=user, author=author)
+                delta, update_feed = -1, unfollow
+            if changed:
+                author.change_counter('followers_count', delta)
+                update_feed(user.id, author.id)
+                invalidate_user_flags(user.id)
+        if not changed:
+            return Response(
+                {'errors': SUBSCRIBE_ERRORS[request.method][1]},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            subscription.delete()
+        if request.method == 'DELETE':
             return Response(status=status.HTTP_204_NO_CONTENT)
 
+        # ответ строится без повторного чтения подписки: ее уже может
+        # удалить параллельный запрос на отписку
+        serializer = SubscribeSerializer(
+            Subscribe(user=user, author=author), context={'request': request}
+        )
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
     @action(methods=['GET'], detail=False)
     def subscriptions(self, request):
         user = request.user
-        subscriptions = Subscribe.objects.filter(user=user)
+        subscriptions = Subscribe.objects.filter(
+            user=user
+        ).with_author_recipes(get_recipes_limit(request))
         pages = self.paginate_queryset(subscriptions)
         serializer = SubscribeSerializer(
             pages,